@@ -21,9 +21,9 @@ import json
 from collections import defaultdict
 import time
 
-from controller.kontext import LinesGroups, Kontext
+from controller.kontext import LinesGroups, Kontext, AsyncTaskStatus
 from controller import exposed
-from controller.errors import UserActionException, BackgroundCalculationException
+from controller.errors import UserActionException, BackgroundCalculationException, CalculationPendingException
 from argmapping.query import (FilterFormArgs, QueryFormArgs, SortFormArgs, SampleFormArgs, ShuffleFormArgs,
                               LgroupOpArgs, LockedOpFormsArgs, ContextFilterArgsConv, QuickFilterArgsConv,
                               KwicSwitchArgs, SubHitsFilterFormArgs, FirstHitsFilterFormArgs)
@@ -32,13 +32,13 @@ from argmapping import ConcArgsMapping
 import settings
 import conclib
 from conclib.empty import EmptyConc
-from conclib.search import get_conc
+from conclib.search import get_conc, get_stored_calc_status
 from conclib.calc.base import GeneralWorker
 from conclib.calc import cancel_async_task
 import corplib
 from bgcalc import freq_calc, coll_calc
 import plugins
-from kwiclib import Kwic, KwicPageArgs
+from kwiclib import Kwic, KwicPageArgs, get_sort_crit
 import l10n
 from l10n import corpus_get_conf
 from translation import ugettext as translate
@@ -63,6 +63,7 @@ class Actions(Querying):
     CONC_QUICK_SAVE_MAX_LINES = 10000
     FREQ_QUICK_SAVE_MAX_LINES = 10000
     COLLS_QUICK_SAVE_MAX_LINES = 10000
+    SAVECONC_CHUNK_SIZE = 1000
 
     """
     This class specifies all the actions KonText offers to a user via HTTP
@@ -136,6 +137,43 @@ class Actions(Querying):
             if self._lines_groups.sorted:
                 conclib.sort_line_groups(conc, [x[2] for x in self._lines_groups])
 
+    def _get_kwicpage(self, conc, kwic, kwic_args):
+        """
+        Return KWIC page data (see Kwic.kwicpage()). Pages of finished
+        concordances are cached along with respective concordance cache entries.
+        """
+        if isinstance(conc, EmptyConc) or not conc.finished():
+            return kwic.kwicpage(kwic_args)
+        cache_map = plugins.runtime.CONC_CACHE.instance.get_mapping(self.corp)
+        subchash = getattr(self.corp, 'subchash', None)
+        page_key = kwic_args.create_cache_key(self._lines_groups.serialize())
+        ans = cache_map.get_kwic_page(subchash, self.args.q, page_key)
+        if ans is None:
+            ans = kwic.kwicpage(kwic_args)
+            cache_map.store_kwic_page(subchash, self.args.q, page_key, ans)
+        else:
+            ans.update(kwic.get_result_stats())  # stored ARF may have been added in the meantime
+        return ans
+
+    def _get_sort_idx(self, conc, kwic):
+        """
+        Return sort index page shortcuts (see Kwic.get_sort_idx()). Indices of finished
+        concordances are cached along with respective concordance cache entries (typically
+        stored there already by the worker which performed the sorting).
+        """
+        crit = get_sort_crit(self.args.q)
+        if not crit:
+            return []
+        if isinstance(conc, EmptyConc) or not conc.finished() or self._lines_groups.is_defined():
+            return kwic.get_sort_idx(q=self.args.q, pagesize=self.args.pagesize)
+        cache_map = plugins.runtime.CONC_CACHE.instance.get_mapping(self.corp)
+        subchash = getattr(self.corp, 'subchash', None)
+        items = cache_map.get_sort_idx(subchash, self.args.q, crit)
+        if items is None:
+            items = conc.get_sort_idx_items(crit)
+            cache_map.store_sort_idx(subchash, self.args.q, crit, items)
+        return Kwic.sort_idx_pages(items, self.args.pagesize)
+
     def _get_ipm_base_set_desc(self, contains_within):
         """
         Generates a proper description for i.p.m. depending on the
@@ -221,10 +259,11 @@ class Actions(Querying):
                 kwic_args.alignlist = [self.cm.get_Corpus(c) for c in self.args.align if c]
                 kwic_args.structs = self._get_struct_opts()
 
-                kwic = Kwic(self.corp, self.args.corpname, conc)
+                calc_status = get_stored_calc_status(self.corp, self.session_get('user', 'id'), self.args.q)
+                kwic = Kwic(self.corp, self.args.corpname, conc, calc_status=calc_status)
 
-                out['Sort_idx'] = kwic.get_sort_idx(q=self.args.q, pagesize=self.args.pagesize)
-                out.update(kwic.kwicpage(kwic_args))
+                out['Sort_idx'] = self._get_sort_idx(conc, kwic)
+                out.update(self._get_kwicpage(conc, kwic, kwic_args))
                 out.update(self.get_conc_sizes(conc))
         except TypeError as ex:
             self.add_system_message('error', str(ex))
@@ -914,7 +953,6 @@ class Actions(Querying):
         """
         display a frequency list
         """
-        time.sleep(6)
         self.disabled_menu_items = (MainMenu.CONCORDANCE('query-save-as'), MainMenu.VIEW('kwic-sent-switch'),
                                     MainMenu.CONCORDANCE('query-overview'))
 
@@ -966,7 +1004,10 @@ class Actions(Querying):
         args.line_offset = line_offset
         args.force_cache = True if force_cache else False
 
-        calc_result = freq_calc.calculate_freqs(args)
+        calc_result, calc_task = self._calc_in_background(
+            freq_calc.calculate_freqs, args, AsyncTaskStatus.CATEGORY_FREQ, translate('Frequency distribution'))
+        if calc_task is not None:
+            return dict(calc_task=calc_task.to_dict())
         result.update(
             fcrit=[('fcrit', cr) for cr in fcrit],
             FCrit=[{'fcrit': cr} for cr in fcrit],
@@ -1218,10 +1259,15 @@ class Actions(Querying):
         args.fcrit = '{0} {1} {2} {3}'.format(self.args.ctattr1, self.args.ctfcrit1,
                                               self.args.ctattr2, self.args.ctfcrit2)
         try:
-            freq_data = freq_calc.calculate_freqs_ct(args)
+            freq_data, calc_task = self._calc_in_background(
+                freq_calc.calculate_freqs_ct, args, AsyncTaskStatus.CATEGORY_FREQ_CT, translate('Contingency table'))
+            if calc_task is not None:
+                return dict(calc_task=calc_task.to_dict())
+        except CalculationPendingException:
+            raise
         except UserActionException as ex:
             freq_data = dict(data=[], full_size=0)
-            self.add_system_message('error', str(e))
+            self.add_system_message('error', str(ex))
 
         self._add_save_menu_item('XLSX', save_format='xlsx')
 
@@ -1306,7 +1352,10 @@ class Actions(Querying):
                                      self.CONC_QUICK_SAVE_MAX_LINES)))
         self._add_save_menu_item(translate('Custom'))
 
-        ans = coll_calc.calculate_colls(calc_args)
+        ans, calc_task = self._calc_in_background(
+            coll_calc.calculate_colls, calc_args, AsyncTaskStatus.CATEGORY_COLL, translate('Collocations'))
+        if calc_task is not None:
+            return dict(calc_task=calc_task.to_dict())
         ans['coll_form_args'] = CollFormArgs().update(self.args).to_dict()
         ans['freq_form_args'] = FreqFormArgs().update(self.args).to_dict()
         ans['ctfreq_form_args'] = CTFreqFormArgs().update(self.args).to_dict()
@@ -1469,16 +1518,33 @@ class Actions(Querying):
             kwic_args.rightctx = self.args.rightctx
             kwic_args.structs = self._get_struct_opts()
 
-            data = kwic.kwicpage(kwic_args)
+            stats = kwic.get_result_stats()
+            # lines are fetched (and exported) in chunks to keep memory usage low
+            chunks = kwic.kwiclines_chunks(kwic_args, self.SAVECONC_CHUNK_SIZE)
+            first_chunk = next(chunks, None)
+
+            def iter_chunks():
+                if first_chunk is not None:
+                    yield first_chunk
+                    yield from chunks
 
             def mkfilename(suffix): return '%s-concordance.%s' % (self.args.corpname, suffix)
             if saveformat == 'text':
                 self._headers['Content-Type'] = 'text/plain'
                 self._headers['Content-Disposition'] = 'attachment; filename="%s"' % (
                     mkfilename('txt'),)
-                output.update(data)
-                for item in data['Lines']:
-                    item['ref'] = ', '.join(item['ref'])
+                output.update(stats)
+
+                def iter_lines():
+                    for chunk in iter_chunks():
+                        for item in chunk.Lines:
+                            item['ref'] = ', '.join(item['ref'])
+                            yield item
+
+                output['Lines'] = iter_lines()
+                if first_chunk is not None:
+                    output['KWICCorps'] = first_chunk.KWICCorps
+                    output['CorporaColumns'] = first_chunk.CorporaColumns
                 # we must set contains_within = False as it is impossible (in the current user interface)
                 # to offer a custom i.p.m. calculation before the download starts
                 output['result_relative_freq_rel_to'] = self._get_ipm_base_set_desc(
@@ -1492,12 +1558,12 @@ class Actions(Querying):
                 self._headers['Content-Disposition'] = 'attachment; filename="%s"' % (
                     mkfilename(saveformat),)
 
-                if len(data['Lines']) > 0:
-                    if 'Left' in data['Lines'][0]:
+                if first_chunk is not None and len(first_chunk.Lines) > 0:
+                    if 'Left' in first_chunk.Lines[0]:
                         left_key = 'Left'
                         kwic_key = 'Kwic'
                         right_key = 'Right'
-                    elif 'Sen_Left' in data['Lines'][0]:
+                    elif 'Sen_Left' in first_chunk.Lines[0]:
                         left_key = 'Sen_Left'
                         kwic_key = 'Kwic'
                         right_key = 'Sen_Right'
@@ -1513,8 +1579,8 @@ class Actions(Querying):
                         writer.writeheading({
                             'corpus': self._human_readable_corpname(),
                             'subcorpus': self.args.usesubcorp,
-                            'concordance_size': data['concsize'],
-                            'arf': data['result_arf'],
+                            'concordance_size': stats['concsize'],
+                            'arf': stats['result_arf'],
                             'query': ['%s: %s (%s)' % (x['op'], x['arg'], x['size'])
                                       for x in self.concdesc_json().get('Desc', [])]
                         })
@@ -1526,20 +1592,26 @@ class Actions(Querying):
                         used_refs = [x[1] for x in used_refs if x[0] in refs_args]
                         writer.write_ref_headings([''] + used_refs if numbering else used_refs)
 
-                    for i in range(len(data['Lines'])):
-                        line = data['Lines'][i]
-                        if numbering:
-                            row_num = str(i + from_line)
-                        else:
-                            row_num = None
-
-                        lang_rows = process_lang(line, left_key, kwic_key, right_key,
-                                                 add_linegroup=self._lines_groups.is_defined())
-                        if 'Align' in line:
-                            lang_rows += process_lang(line['Align'], left_key, kwic_key, right_key,
-                                                      add_linegroup=False)
-                        writer.writerow(row_num, *lang_rows)
-                output = writer.raw_content()
+                add_linegroup = self._lines_groups.is_defined()
+
+                def export_rows():
+                    row_num = from_line
+                    for chunk in iter_chunks():
+                        for line in chunk.Lines:
+                            lang_rows = process_lang(line, left_key, kwic_key, right_key,
+                                                     add_linegroup=add_linegroup)
+                            if 'Align' in line:
+                                lang_rows += process_lang(line['Align'], left_key, kwic_key, right_key,
+                                                          add_linegroup=False)
+                            writer.writerow(str(row_num) if numbering else None, *lang_rows)
+                            row_num += 1
+                        content = writer.pop_content()
+                        if content:
+                            yield content
+                    if writer.pop_content() is None:  # writer cannot stream partial output
+                        yield writer.raw_content()
+
+                output = export_rows()
             else:
                 raise UserActionException(translate('Unknown export data type'))
             return output
@@ -14,6 +14,7 @@
 
 import sys
 import re
+import itertools
 import logging
 import os
 import hashlib
@@ -39,6 +40,8 @@ class Wordlist(ConcActions):
 
     WORDLIST_QUICK_SAVE_MAX_LINES = 10000
 
+    SAVEWL_CHUNK_SIZE = 1000
+
     def get_mapping_url_prefix(self):
         return '/wordlist/'
 
@@ -255,16 +258,32 @@ class Wordlist(ConcActions):
         """
         from_line = int(from_line)
         to_line = int(to_line) if to_line else sys.maxsize
-        self.args.wlpage = 1
-        ans = self.result(wlpat=self.args.wlpat, paginate=False)
-        ans['Items'] = ans['Items'][:(to_line - from_line + 1)]
+        num_lines = max(0, to_line - from_line + 1)
+        if not self.args.wlpat:
+            self.args.wlpat = '.*'
+        if '.' in self.args.wlattr:
+            wlnums = self._wlnums2structattr(self.args.wlnums)
+        else:
+            wlnums = self.args.wlnums
+        # with frequency sorting, only the required number of the most frequent items
+        # is kept during the search; other orderings need the whole list to be sorted
+        items = corplib.iter_wordlist(
+            corp=self.corp, words=[w for w in re.split(r'\s+', self.args.wlwords.strip()) if w],
+            wlattr=self.args.wlattr, wlpat=self.args.wlpat, wlminfreq=self.args.wlminfreq,
+            wlmaxitems=num_lines if self.args.wlsort == 'f' else sys.maxsize, wlsort=self.args.wlsort,
+            blacklist=[w for w in re.split(r'\s+', self.args.blacklist.strip()) if w], wlnums=wlnums,
+            include_nonwords=self.args.include_nonwords)
+        items = itertools.islice(items, num_lines)
+        first_item = next(items, None)  # this makes possible errors raise before the output starts
+        if first_item is not None:
+            items = itertools.chain((first_item,), items)
         saved_filename = self.args.corpname
 
         if saveformat == 'text':
             self._headers['Content-Type'] = 'application/text'
             self._headers['Content-Disposition'] = 'attachment; filename="%s-word-list.txt"' % (
                 saved_filename,)
-            out_data = ans
+            out_data = dict(Items=(dict(str=w, freq=f) for w, f in items) if first_item is not None else [])
             out_data['pattern'] = self.args.wlpat
             out_data['from_line'] = from_line
             out_data['to_line'] = to_line
@@ -290,11 +309,17 @@ class Wordlist(ConcActions):
                     'pattern': self.args.wlpat
                 })
 
-            i = 1
-            for item in ans['Items']:
-                writer.writerow(i, (item['str'], str(item['freq'])))
-                i += 1
-            out_data = writer.raw_content()
+            def export_rows():
+                for i, (w, f) in enumerate(items, 1):
+                    writer.writerow(i, (w, str(f)))
+                    if i % self.SAVEWL_CHUNK_SIZE == 0:
+                        content = writer.pop_content()
+                        if content:
+                            yield content
+                content = writer.pop_content()
+                yield writer.raw_content() if content is None else content
+
+            out_data = export_rows()
         return out_data
 
     @exposed(func_arg_mapped=True, return_type='json')
@@ -276,6 +276,11 @@ class GlobalArgs(object):
     ctfcrit1 = Parameter[str]('0<0')
     ctfcrit2 = Parameter[str]('0<0')
 
+    # Background calculations (freqs, collocations, contingency table)
+
+    calc_nowait = Parameter[int](0)  # if 1 (and format=json) then an unfinished calculation returns a task handle
+    calc_task_id = Parameter[str]('')  # a task handle of a previously unfinished calculation
+
     # word list
 
     wlminfreq = Parameter[int](5)
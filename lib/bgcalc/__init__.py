@@ -37,6 +37,35 @@ class UnfinishedConcordanceError(Exception):
     pass
 
 
+class CalcTaskPending(Exception):
+    """
+    This error is used whenever a result of a background
+    calculation is requested in a non-blocking way and
+    the respective task has not finished yet. The task
+    identifier serves as a handle to poll for the result.
+    """
+
+    def __init__(self, task_id, status):
+        super().__init__('Task {0} not finished yet (status: {1})'.format(task_id, status))
+        self.task_id = task_id
+        self.status = status
+
+
+def get_task_result(res, timeout, wait=True):
+    """
+    Return a result of a background task.
+
+    arguments:
+    res -- a task result object (Celery AsyncResult or a compatible one)
+    timeout -- max. time (in seconds) to block while waiting for the result
+    wait -- if False then CalcTaskPending is raised in case the task
+            has not finished yet instead of blocking until it does
+    """
+    if not wait and res.status not in ('SUCCESS', 'FAILURE'):
+        raise CalcTaskPending(res.id, res.status)
+    return res.get(timeout=timeout)
+
+
 def _init_backend_app(conf, fn_prefix):
     app_type = conf.get('calc_backend', 'type')
     app_conf = conf.get('calc_backend', 'conf')
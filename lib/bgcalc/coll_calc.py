@@ -16,9 +16,11 @@ import pickle
 import hashlib
 import os
 import time
+import math
 
 import corplib
 from conclib.search import get_conc
+from conclib.pyconc import PyConc
 from bgcalc import freq_calc
 import settings
 from structures import FixedDict
@@ -54,12 +56,13 @@ class CollCalcArgs(FixedDict):
     cminbgr = None
     cminfreq = None
     cache_path = None
-    num_fetch_items = None
 
 
 class CollCalcCache(object):
-
-    MANATEE_DEFAULT_NUM_FETCH_LINES = 50
+    """
+    Caches complete (i.e. all the candidates) sorted collocation lists
+    so any page can be served without recalculation.
+    """
 
     def __init__(self, corpname, subcname, subcpath, user_id, q, save=0, samplesize=0):
         self._corpname = corpname
@@ -72,7 +75,7 @@ class CollCalcCache(object):
 
     def _cache_file_path(self, cattr, csortfn, cbgrfns, cfromw, ctow, cminbgr, cminfreq):
         v = f'{self._corpname}{self._subcname}{self._user_id}{"".join(self._q)}{cattr}{csortfn}{cbgrfns}{cfromw}{ctow}{cminbgr}{cminbgr}{cminfreq}'
-        filename = f'{hashlib.sha1(v.encode("utf-8")).hexdigest()}.pkl'
+        filename = f'{hashlib.sha1(v.encode("utf-8")).hexdigest()}.rows.pkl'
         return os.path.join(settings.get('corpora', 'colls_cache_dir'), filename)
 
     def get(self, cattr, csortfn, cbgrfns, cfromw, ctow, cminbgr, cminfreq):
@@ -81,6 +84,7 @@ class CollCalcCache(object):
 
         returns:
         a 2-tuple (cached_data, cache_path)  where cached_data is None in case of cache miss
+        and dict(Head=..., Items=[list of compact rows]) otherwise (see PyConc.calc_collocs())
         """
         cache_path = self._cache_file_path(cattr=cattr, csortfn=csortfn, cbgrfns=cbgrfns, cfromw=cfromw, ctow=ctow,
                                            cminbgr=cminbgr, cminfreq=cminfreq)
@@ -97,6 +101,9 @@ def calculate_colls_bg(coll_args):
     Background collocations calculation.
     This function is expected to be run either
     from Celery or from other process (via multiprocessing).
+
+    All the collocation candidates are calculated so the result can
+    be cached and paginated without any further calculation.
     """
     cm = corplib.CorpusManager(subcpath=coll_args.subcpath)
     corp = cm.get_Corpus(coll_args.corpname, subcname=coll_args.subcname)
@@ -108,13 +115,10 @@ def calculate_colls_bg(coll_args):
         if not conc.finished():
             raise UnfinishedConcordanceError(
                 _('Cannot calculate yet - source concordance not finished. Please try again later.'))
-        collocs = conc.collocs(cattr=coll_args.cattr, csortfn=coll_args.csortfn, cbgrfns=coll_args.cbgrfns,
-                               cfromw=coll_args.cfromw, ctow=coll_args.ctow, cminfreq=coll_args.cminfreq,
-                               cminbgr=coll_args.cminbgr, max_lines=coll_args.num_fetch_items)
-        for item in collocs['Items']:
-            item['pfilter'] = [('q2', item['pfilter'])]
-            item['nfilter'] = [('q2', item['nfilter'])]
-        return dict(data=collocs, processing=0, tasks=[])
+        head, rows = conc.calc_collocs(cattr=coll_args.cattr, csortfn=coll_args.csortfn, cbgrfns=coll_args.cbgrfns,
+                                       cfromw=coll_args.cfromw, ctow=coll_args.ctow, cminfreq=coll_args.cminfreq,
+                                       cminbgr=coll_args.cminbgr, max_lines=0)
+        return dict(data=dict(Head=head, Items=rows), processing=0, tasks=[])
     except corplib.MissingSubCorpFreqFile as e:
         ans = {'attrname': coll_args.cattr, 'tasks': []}
         out = freq_calc.build_arf_db(e.corpus, coll_args.cattr)
@@ -128,15 +132,15 @@ def calculate_colls_bg(coll_args):
         return ans
 
 
-def calculate_colls(coll_args):
+def export_colls_page(calc_result, coll_args):
     """
-    Calculates required collocations based on passed arguments.
-    Function is able to reuse cached values and utilize configured
-    backend (either Celery or multiprocessing).
+    Exports a page of collocations specified by coll_args
+    (collpage, citemsperpage, line_offset, num_lines) from
+    a complete collocation list (see calculate_colls_bg()).
 
     returns:
     a dictionary ready to be used in a respective template (collx.tmpl)
-    (keys: Head, Items, cmaxitems, attrname, processing, collstart, lastpage)
+    (keys: Head, Items, attrname, processing, collstart, lastpage, Total, TotalPages)
     """
     if coll_args.num_lines > 0:
         collstart = 0
@@ -145,7 +149,39 @@ def calculate_colls(coll_args):
         collstart = (int(coll_args.collpage) - 1) * \
             int(coll_args.citemsperpage) + int(coll_args.line_offset)
         collend = collstart + int(coll_args.citemsperpage) + 1
+    rows = calc_result['data']['Items']
+    items = PyConc.export_colloc_rows(rows[collstart:collend - 1], cattr=coll_args.cattr,
+                                      cfromw=coll_args.cfromw, ctow=coll_args.ctow)
+    for item in items:
+        item['pfilter'] = [('q2', item['pfilter'])]
+        item['nfilter'] = [('q2', item['nfilter'])]
+    return dict(
+        Head=calc_result['data']['Head'],
+        attrname=coll_args.cattr,
+        processing=calc_result['processing'],
+        collstart=collstart,
+        lastpage=0 if collstart + coll_args.citemsperpage < len(rows) else 1,
+        Total=len(rows),
+        TotalPages=int(math.ceil(len(rows) / float(coll_args.citemsperpage))),
+        Items=items
+    )
+
+
+def calculate_colls(coll_args, wait=True, task_id=None):
+    """
+    Calculates required collocations based on passed arguments.
+    Function is able to reuse cached values and utilize configured
+    backend (either Celery or multiprocessing).
 
+    arguments:
+    coll_args -- a CollCalcArgs instance
+    wait -- if False then bgcalc.CalcTaskPending is raised in case the calculation is not finished
+    task_id -- an ID of a task submitted by a previous non-blocking call with the same args
+
+    returns:
+    a dictionary ready to be used in a respective template (collx.tmpl)
+    (see export_colls_page())
+    """
     cache = CollCalcCache(corpname=coll_args.corpname, subcname=coll_args.subcname, subcpath=coll_args.subcpath,
                           user_id=coll_args.user_id, q=coll_args.q, save=coll_args.save,
                           samplesize=coll_args.samplesize)
@@ -153,35 +189,17 @@ def calculate_colls(coll_args):
                                     cfromw=coll_args.cfromw, ctow=coll_args.ctow, cminbgr=coll_args.cminbgr,
                                     cminfreq=coll_args.cminfreq)
     if collocs is None:
-        num_fetch_items = CollCalcCache.MANATEE_DEFAULT_NUM_FETCH_LINES
-    else:
-        num_fetch_items = len(collocs['Items'])
-
-    if collocs is None or collend > num_fetch_items:
-        if os.path.isfile(cache_path):  # cache avail. but not enough items
-            os.unlink(cache_path)
-        if collend >= num_fetch_items:
-            num_fetch_items += (collend - num_fetch_items) + 10 * \
-                int(coll_args.citemsperpage)  # TODO heuristics :)
-
         coll_args.cache_path = cache_path
-        coll_args.num_fetch_items = num_fetch_items
         app = bgcalc.calc_backend_client(settings)
-        res = app.send_task('worker.calculate_colls', args=(coll_args.to_dict(),),
-                            time_limit=TASK_TIME_LIMIT)
-        # worker task caches the value AFTER the result is returned (see worker.py)
-        ans = res.get()
-    else:
-        ans = dict(data=collocs, processing=0)
-    result = dict(
-        Head=ans['data']['Head'],
-        attrname=coll_args.cattr,
-        processing=ans['processing'],
-        collstart=collstart,
-        lastpage=0 if collstart + coll_args.citemsperpage < len(ans['data']['Items']) else 1,
-        Items=ans['data']['Items'][collstart:collend - 1]
-    )
-    return result
+        if task_id:
+            res = app.AsyncResult(task_id)
+        else:
+            res = app.send_task('worker.calculate_colls', args=(coll_args.to_dict(),),
+                                time_limit=TASK_TIME_LIMIT)
+        # worker task caches the complete list AFTER the result is returned (see worker.py)
+        # and it returns just the requested page
+        return bgcalc.get_task_result(res, TASK_TIME_LIMIT, wait)
+    return export_colls_page(dict(data=collocs, processing=0), coll_args)
 
 
 def clean_colls_cache():
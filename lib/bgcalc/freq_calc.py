@@ -21,12 +21,12 @@ import time
 import math
 import hashlib
 import logging
-import pickle
 from structures import FixedDict
 
 import manatee
 import corplib
 from conclib.search import get_conc
+from conclib.freq import save_freq_dists, load_freq_dists
 import settings
 import plugins
 import bgcalc
@@ -210,19 +210,35 @@ class FreqCalcCache(object):
         v = (str(self._corpname) + str(self._subcname) + str(self._user_id) +
              ''.join(self._q) + str(fcrit) + str(flimit) + str(freq_sort) + str(ml) +
              str(ftt_include_empty) + str(rel_mode) + str(collator_locale))
-        filename = '%s.pkl' % hashlib.sha1(v.encode('utf-8')).hexdigest()
+        filename = '%s.frq' % hashlib.sha1(v.encode('utf-8')).hexdigest()
         return os.path.join(settings.get('corpora', 'freqs_cache_dir'), filename)
 
     def get(self, fcrit, flimit, freq_sort, ml, ftt_include_empty, rel_mode, collator_locale):
+        """
+        returns:
+        a 2-tuple (data, cache_path) where data is either None (no cached data) or
+        a dict(freqs=[list of FreqDistResult/None], conc_size=...) with
+        memory-mapped (i.e. lazily read) frequency data
+        """
         cache_path = self._cache_file_path(
             fcrit, flimit, freq_sort, ml, ftt_include_empty, rel_mode, collator_locale)
+        data = None
         if os.path.isfile(cache_path):
-            with open(cache_path, 'rb') as f:
-                data = pickle.load(f)
-        else:
-            data = None
+            try:
+                freqs, conc_size = load_freq_dists(cache_path)
+                data = dict(freqs=freqs, conc_size=conc_size)
+            except (ValueError, OSError) as ex:
+                logging.getLogger(__name__).warning(
+                    'Failed to load freq. cache file {0}: {1}'.format(cache_path, ex))
         return data, cache_path
 
+    @staticmethod
+    def store(cache_path, calc_result):
+        """
+        Store a result of calc_freqs_bg() to a cache file
+        """
+        save_freq_dists(cache_path, calc_result['freqs'], calc_result['conc_size'])
+
 
 def calc_freqs_bg(args):
     """
@@ -232,7 +248,7 @@ def calc_freqs_bg(args):
     args -- a FreqCalsArgs instance
 
     returns:
-    a dict(freqs=..., conc_size=...)
+    a dict(freqs=[list of FreqDistResult/None], conc_size=...)
     """
 
     cm = corplib.CorpusManager(subcpath=args.subcpath)
@@ -242,37 +258,27 @@ def calc_freqs_bg(args):
     if not conc.finished():
         raise UnfinishedConcordanceError(
             _('Cannot calculate yet - source concordance not finished. Please try again later.'))
-    freqs = [conc.xfreq_dist(cr, args.flimit, args.freq_sort, args.ml, args.ftt_include_empty, args.rel_mode,
+    freqs = [conc.calc_freq_dist(cr, args.flimit, args.freq_sort, args.ml, args.ftt_include_empty, args.rel_mode,
                              args.collator_locale)
              for cr in args.fcrit]
     return dict(freqs=freqs, conc_size=conc.size())
 
 
-def calculate_freqs(args):
+def export_freqs_page(calc_result, args):
     """
-    Calculates a frequency distribution based on a defined concordance and frequency-related arguments.
-    The class is able to cache the data in a background process/task. This prevents KonText to calculate
-    (via Manatee) full frequency list again and again (e.g. if user moves from page to page).
-    """
-    cache = FreqCalcCache(corpname=args.corpname, subcname=args.subcname, user_id=args.user_id, subcpath=args.subcpath,
-                          q=args.q, fromp=args.fromp, pagesize=args.pagesize, save=args.save,
-                          samplesize=args.samplesize)
-    calc_result, cache_path = cache.get(fcrit=args.fcrit, flimit=args.flimit, freq_sort=args.freq_sort, ml=args.ml,
-                                        ftt_include_empty=args.ftt_include_empty, rel_mode=args.rel_mode,
-                                        collator_locale=args.collator_locale)
-    if calc_result is None:
-        args.cache_path = cache_path
-        app = bgcalc.calc_backend_client(settings)
-        res = app.send_task('worker.calculate_freqs', args=(args.to_dict(),),
-                            time_limit=TASK_TIME_LIMIT)
-        # worker task caches the value AFTER the result is returned (see worker.py)
-        calc_result = res.get()
+    Export a requested page (in case of a single block) or all the data (multiple blocks)
+    of frequency distributions as returned by calc_freqs_bg() or FreqCalcCache.get().
+    Only the exported lines are materialized.
 
+    arguments:
+    calc_result -- a dict(freqs=..., conc_size=...)
+    args -- a FreqCalsArgs instance
+    """
     data = calc_result['freqs']
     conc_size = calc_result['conc_size']
     lastpage = None
     if len(data) == 1:  # a single block => pagination
-        total_length = len(data[0]['Items']) if 'Items' in data[0] else 0
+        total_length = len(data[0]) if data[0] is not None else 0
         items_per_page = args.fmaxitems
         fstart = (args.fpage - 1) * args.fmaxitems + args.line_offset
         fmaxitems = args.fmaxitems * args.fpage + 1 + args.line_offset
@@ -282,19 +288,50 @@ def calculate_freqs(args):
             lastpage = 0
         ans = [dict(Total=total_length,
                     TotalPages=int(math.ceil(total_length / float(items_per_page))),
-                    Items=data[0]['Items'][fstart:fmaxitems - 1] if 'Items' in data[0] else [],
-                    Head=data[0].get('Head', []))]
+                    Items=data[0].items(fstart, fmaxitems - 1) if data[0] is not None else [],
+                    Head=data[0].head if data[0] is not None else [])]
     else:
+        ans = []
         for item in data:
-            if 'Items' not in item:
-                item['Items'] = []
-            item['Total'] = len(item['Items'])
-            item['TotalPages'] = None
-        ans = data
+            block = item.to_dict() if item is not None else {'Items': []}
+            block['Total'] = len(block['Items'])
+            block['TotalPages'] = None
+            ans.append(block)
         fstart = None
     return dict(lastpage=lastpage, data=ans, fstart=fstart, fmaxitems=args.fmaxitems, conc_size=conc_size)
 
 
+def calculate_freqs(args, wait=True, task_id=None):
+    """
+    Calculates a frequency distribution based on a defined concordance and frequency-related arguments.
+    The class is able to cache the data in a background process/task. This prevents KonText to calculate
+    (via Manatee) full frequency list again and again (e.g. if user moves from page to page).
+
+    arguments:
+    args -- a FreqCalsArgs instance
+    wait -- if False then bgcalc.CalcTaskPending is raised in case the calculation is not finished
+    task_id -- an ID of a task submitted by a previous non-blocking call with the same args
+    """
+    cache = FreqCalcCache(corpname=args.corpname, subcname=args.subcname, user_id=args.user_id, subcpath=args.subcpath,
+                          q=args.q, fromp=args.fromp, pagesize=args.pagesize, save=args.save,
+                          samplesize=args.samplesize)
+    calc_result, cache_path = cache.get(fcrit=args.fcrit, flimit=args.flimit, freq_sort=args.freq_sort, ml=args.ml,
+                                        ftt_include_empty=args.ftt_include_empty, rel_mode=args.rel_mode,
+                                        collator_locale=args.collator_locale)
+    if calc_result is None:
+        args.cache_path = cache_path
+        app = bgcalc.calc_backend_client(settings)
+        if task_id:
+            res = app.AsyncResult(task_id)
+        else:
+            res = app.send_task('worker.calculate_freqs', args=(args.to_dict(),),
+                                time_limit=TASK_TIME_LIMIT)
+        # worker task caches the value AFTER the result is returned (see worker.py)
+        # and it returns just the requested page
+        return bgcalc.get_task_result(res, TASK_TIME_LIMIT, wait)
+    return export_freqs_page(calc_result, args)
+
+
 def clean_freqs_cache():
     root_dir = settings.get('corpora', 'freqs_cache_dir')
     cache_ttl = settings.get_int('corpora', 'freqs_cache_ttl', 3600)
@@ -344,8 +381,7 @@ class CTCalculation(object):
         return len([x for x in attrs if '.' in x])
 
     def _calc_1sattr_norms(self, words, sattr, sattr_idx):
-        norms2_dict = self._conc.get_attr_values_sizes(sattr)
-        return [norms2_dict.get(x[sattr_idx], 0) for x in words]
+        return self._conc.get_attr_values_norms(sattr, [x[sattr_idx] for x in words])
 
     def ct_dist(self, crit, limit_type, limit=1):
         """
@@ -409,15 +445,23 @@ class CTCalculation(object):
         return dict(data=[x[0] + x[1:] for x in result], full_size=full_size)
 
 
-def calculate_freqs_ct(args):
+def calculate_freqs_ct(args, wait=True, task_id=None):
     """
     note: this is called by webserver
+
+    arguments:
+    args -- a CTFreqCalcArgs instance
+    wait -- if False then bgcalc.CalcTaskPending is raised in case the calculation is not finished
+    task_id -- an ID of a task submitted by a previous non-blocking call with the same args
     """
     try:
         app = bgcalc.calc_backend_client(settings)
-        res = app.send_task('worker.calculate_freqs_ct', args=(args.to_dict(),),
-                            time_limit=TASK_TIME_LIMIT)
-        calc_result = res.get()
+        if task_id:
+            res = app.AsyncResult(task_id)
+        else:
+            res = app.send_task('worker.calculate_freqs_ct', args=(args.to_dict(),),
+                                time_limit=TASK_TIME_LIMIT)
+        calc_result = bgcalc.get_task_result(res, TASK_TIME_LIMIT, wait)
     except Exception as ex:
         if is_celery_user_error(ex):
             raise UserActionException(str(ex)) from ex
@@ -188,11 +188,14 @@ class Result(APIConnection):
         return 'Result[task_id: {0}, status: {1}, error: {2}, result: {3}]'.format(
             self._task_id, self._status, self._error, self._result)
 
-    def get(self):
+    def get(self, timeout=None):
         """
         Wait for result calculated by KonServer and return it.
+
+        arguments:
+        timeout -- max. time (in seconds) to wait for the result; RESULT_WAIT_MAX_TIME by default
         """
-        time_limit = self._conf.RESULT_WAIT_MAX_TIME
+        time_limit = self._conf.RESULT_WAIT_MAX_TIME if timeout is None else timeout
         wait = Result.INITIAL_WAIT_STEP
         total_wait = 0
         while True:
@@ -48,9 +48,12 @@ def get_conc_desc(corpus, q=None, subchash=None, translate=True, skip_internals=
     """
     cache_map = plugins.runtime.CONC_CACHE.instance.get_mapping(corpus)
     q = tuple(q)
+    # fetch stored sizes of all the operations at once
+    stored_sizes = [entry[0] if entry else None
+                    for entry in cache_map.get_entries(subchash, [q[:i + 1] for i in range(len(q))])]
 
     def get_size(pos):
-        return cache_map.get_stored_size(subchash, q[:pos + 1])
+        return stored_sizes[pos]
 
     def is_aligned_op(query_items, pos):
         return (query_items[pos].startswith('x-') and query_items[pos + 1] == 'p0 0 1 []' and
@@ -36,6 +36,10 @@ import bgcalc
 
 TASK_TIME_LIMIT = settings.get_int('calc_backend', 'task_time_limit', 300)
 
+# max. time to block on a calc. status notification channel before re-checking
+# the status anyway (a safety measure in case a notification is lost)
+STATUS_WAIT_MAX_INTERVAL = 1.0
+
 
 def _contains_shuffle_seq(q_ops: Tuple[str, ...]) -> bool:
     """
@@ -54,6 +58,17 @@ def _contains_shuffle_seq(q_ops: Tuple[str, ...]) -> bool:
     return False
 
 
+def store_sort_idx(cache_map: AbstractConcCache, conc: PyConc, subchash: Optional[str], q: Tuple[str, ...]):
+    """
+    In case the last operation of q is sorting, store the sort index
+    (see PyConc.get_sort_idx_items()) of a just calculated concordance
+    along with its cache entry so views of the concordance can read it
+    directly.
+    """
+    if q[-1].startswith('s') and not q[-1].startswith('s*'):
+        cache_map.store_sort_idx(subchash, q, q[-1][1:], conc.get_sort_idx_items(q[-1][1:]))
+
+
 def del_silent(path: str):
     """
     Remove a file without complaining in case of a error (OSError, TypeError)
@@ -83,6 +98,11 @@ def wait_for_conc(cache_map: AbstractConcCache, q: Tuple[str, ...], subchash: Op
     Find a conc. calculation record in cache (matching provided subchash and query)
     and wait until a result is available. The behavior is modified by 'minsize' (see below).
 
+    The function does not poll the cache repeatedly. Instead, it blocks on a notification
+    channel provided by the cache (see AbstractConcCache.watch_calc_status) and re-reads
+    the status only once a calculation reports a change (or in case the cache implementation
+    does not support notifications, it falls back to polling with an increasing interval).
+
     arguments:
     minsize -- min. size of concordance we accept:
                 1) > 0  => we want at least some lines to be available => short time limit
@@ -91,13 +111,12 @@ def wait_for_conc(cache_map: AbstractConcCache, q: Tuple[str, ...], subchash: Op
     """
     time_limit = 5 if minsize >= 0 else 30
     t0 = t1 = time.time()
-    i = 1
-    has_result, finished = _check_result(cache_map, q, subchash, minsize)
-    while not finished and t1 - t0 < time_limit:
-        time.sleep(i * 0.1)
-        i += 1
-        t1 = time.time()
+    with cache_map.watch_calc_status(subchash, q) as status_watch:
         has_result, finished = _check_result(cache_map, q, subchash, minsize)
+        while not finished and t1 - t0 < time_limit:
+            status_watch.wait(min(time_limit - (t1 - t0), STATUS_WAIT_MAX_INTERVAL))
+            t1 = time.time()
+            has_result, finished = _check_result(cache_map, q, subchash, minsize)
     if not os.path.isfile(cache_map.cache_file_path(subchash, q)):
         if finished:  # cache vs. filesystem mismatch
             cache_map.del_entry(subchash, q)
@@ -147,9 +166,13 @@ def find_cached_conc_base(corp: manatee.Corpus, subchash: Optional[str], q: Tupl
     a 2-tuple [an index within 'q' where to start with non-cached results], [a concordance instance]
     """
     start_time = time.time()
+    if len(q) == 0:
+        return 0, EmptyConc(corp=corp)
     cache_map = plugins.runtime.CONC_CACHE.instance.get_mapping(corp)
     cache_map.refresh_map()
-    calc_status = cache_map.get_calc_status(subchash, q)
+    # fetch the whole prefix chain q[:1], q[:2], ..., q[:] at once
+    entries = cache_map.get_entries(subchash, [q[:i] for i in range(1, len(q) + 1)])
+    calc_status = entries[-1][1] if entries[-1] else None
     if calc_status:
         if calc_status.error is None:
             corp_mtime = corplib_corp_mtime(corp)
@@ -157,10 +180,12 @@ def find_cached_conc_base(corp: manatee.Corpus, subchash: Optional[str], q: Tupl
                 logging.getLogger(__name__).warning(
                     'Removed outdated cache file (older than corpus indices)')
                 cache_map.del_full_entry(subchash, q)
+                entries = [None] * len(q)
         else:
             logging.getLogger(__name__).warning(
                 'Removed failed calculation cache record (error: {0}'.format(calc_status.error))
             cache_map.del_full_entry(subchash, q)
+            entries = [None] * len(q)
 
     if _contains_shuffle_seq(q):
         srch_from = 1
@@ -169,16 +194,23 @@ def find_cached_conc_base(corp: manatee.Corpus, subchash: Optional[str], q: Tupl
 
     conc = EmptyConc(corp=corp)
     ans = (0, conc)
+    # the 'entries' snapshot is not valid once we remove a cache record
+    invalidated = False
     # try to find the most complete cached operation
     # (e.g. query + filter + sample)
     for i in range(srch_from, 0, -1):
-        cache_path = cache_map.cache_file_path(subchash, q[:i])
+        if invalidated:
+            entries[i - 1] = cache_map.get_entries(subchash, [q[:i]])[0]
+        entry = entries[i - 1]
+        cache_path = entry[2] if entry else None
         # now we know that someone already calculated the conc (but it might not be finished yet)
         if cache_path:
             try:
                 ready = wait_for_conc(cache_map=cache_map, subchash=subchash,
                                       q=q[:i], minsize=minsize)
                 if not ready:
+                    # (wait_for_conc may have removed an inconsistent record too)
+                    invalidated = True
                     if minsize != 0:
                         cancel_async_task(cache_map, subchash, q[:i])
                         logging.getLogger(__name__).warning(
@@ -196,6 +228,7 @@ def find_cached_conc_base(corp: manatee.Corpus, subchash: Optional[str], q: Tupl
             except (ConcCalculationStatusException, manatee.FileAccessError) as ex:
                 logging.getLogger(__name__).error(f'Failed to use cached concordance for {q[:i]}: {ex}')
                 cancel_async_task(cache_map, subchash, q[:i])
+                invalidated = True
                 continue
             ans = (i, conc)
             break
@@ -253,9 +286,7 @@ class ConcCalculation(GeneralWorker):
                 sizes = self.get_cached_conc_sizes(corpus_obj, query, initial_args['cachefile'])
                 cache_map.update_calc_status(subchash, query, finished=sizes['finished'],
                                              concsize=sizes['concsize'], fullsize=sizes['fullsize'],
-                                             relconcsize=sizes['relconcsize'],
-                                             arf=round(conc.compute_ARF(), 2) if not is_subcorpus(
-                                                 corpus_obj) else None,
+                                             relconcsize=sizes['relconcsize'], arf=sizes['arf'],
                                              task_id=self._task_id)
                 # update size in map file
                 cache_map.add_to_map(subchash, query, conc.size())
@@ -315,9 +346,40 @@ class ConcSyncCalculation(GeneralWorker):
                 cachefile = self.cache_map.cache_file_path(subchash, query[:act + 1])
                 # TODO if stored_status then something went wrong
                 conc.save(cachefile)
+                store_sort_idx(self.cache_map, conc, subchash, query[:act + 1])
                 self.cache_map.update_calc_status(
                     subchash, query[:act + 1], finished=True, concsize=conc.size())
             except Exception as ex:
                 self._mark_calc_states_err(subchash, query, act, ex)
                 logging.getLogger(__name__).error(ex)
                 return
+
+
+class ConcArfCalculation(GeneralWorker):
+    """
+    A worker for calculating ARF of an already calculated (and cached) concordance.
+    The value is written to the respective cache entry so it is calculated only once
+    (concordances calculated via ConcCalculation have the value stored already).
+    """
+
+    def __init__(self, task_id, subc_dirs, corpus_name, subc_name):
+        super().__init__(task_id=task_id)
+        corpus_manager = CorpusManager(subcpath=subc_dirs)
+        self.corpus_obj = corpus_manager.get_Corpus(corpus_name, subcname=subc_name)
+        self.cache_map = self._cache_factory.get_mapping(self.corpus_obj)
+
+    def __call__(self, subchash: Optional[str], query: Tuple[str, ...]) -> Optional[float]:
+        status = self.cache_map.get_calc_status(subchash, query)
+        if status is None or not status.finished or status.error is not None or is_subcorpus(self.corpus_obj):
+            return None
+        if status.has_arf():  # e.g. another task has been faster
+            return status.arf
+        mcorp = self.corpus_obj
+        for qq in reversed(query):  # find the right main corp, if aligned
+            if qq.startswith('x-'):
+                mcorp = manatee.Corpus(qq[2:])
+                break
+        conc = PyConc(mcorp, 'l', self.cache_map.cache_file_path(subchash, query), orig_corp=self.corpus_obj)
+        arf = round(conc.compute_ARF(), 2)
+        self.cache_map.update_calc_status(subchash, query, arf=arf)
+        return arf
@@ -66,6 +66,7 @@ class GeneralWorker(object):
         if q is None:
             q = ()
         ans = dict(finished=False, concsize=0, fullsize=0, relconcsize=0)
+        status = None
         if not cachefile:  # AJAX call
             subchash = getattr(corp, 'subchash', None)
             cache_map = self._cache_factory.get_mapping(corp)
@@ -90,7 +91,9 @@ class GeneralWorker(object):
             else:
                 relconcsize = 1000000.0 * concsize / corp.search_size()
 
-            if finished and not is_subcorpus(corp):
+            if finished and not is_subcorpus(corp) and status is not None and status.has_arf():
+                result_arf = status.arf
+            elif finished and not is_subcorpus(corp):
                 conc = manatee.Concordance(corp, cachefile)
                 result_arf = round(conc.compute_ARF(), 2)
             else:
@@ -0,0 +1,225 @@
+# Copyright (c) 2020 Charles University, Faculty of Arts,
+#                    Institute of the Czech National Corpus
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; version 2
+# dated June, 1991.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.
+
+"""
+A columnar representation of a calculated frequency distribution
+and its on-disk (memory-mappable) cache format.
+
+The cache file layout is as follows (all numbers are little-endian):
+
+    [magic (8 bytes)][header size (uint64)][JSON header][padding][data]
+
+The header describes individual frequency distribution blocks (numbers of lines,
+'Head' records, byte offsets of respective columns within the data section).
+Numeric columns are stored as fixed-width arrays, words are stored as a single
+UTF-8 encoded heap accompanied by an array of (num_lines + 1) offsets. This
+allows reading any range of lines without touching the rest of the file.
+"""
+
+from typing import List, Dict, Any, Optional, Union, Tuple, Sequence
+import os
+import json
+import struct
+
+import numpy as np
+
+CACHE_FILE_MAGIC = b'KFRQ0001'
+
+_NUM_COLUMNS = (('freq', '<i8'), ('fbar', '<i8'), ('norm', '<i8'), ('nbar', '<i8'), ('relbar', '<i8'),
+                ('freqbar', '<i8'), ('rel', '<f8'), ('has_rel', '|u1'))
+
+
+def word_to_items(w: str) -> List[Dict[str, str]]:
+    """
+    Convert a raw frequency distribution item as returned by Manatee
+    (individual criteria separated by tab, multi-word values by \\v)
+    into a list of KonText 'Word' items.
+    """
+    return [{'n': '  '.join(n.split('\v'))} for n in w.split('\t')]
+
+
+class FreqDistResult(object):
+    """
+    Frequency distribution data stored as NumPy columns (one value per line). Items
+    (i.e. dicts as expected by templates and the client) are materialized only for
+    a requested range of lines.
+
+    Lines with 'has_rel' == False are exported without relative frequency related
+    values ('norm', 'nbar', 'freqbar', 'rel') and with 'relbar' set to None.
+    """
+
+    def __init__(self, head: List[Dict[str, Any]], words: Sequence[str], freq: np.ndarray, fbar: np.ndarray,
+                 norm: np.ndarray, nbar: np.ndarray, relbar: np.ndarray, freqbar: np.ndarray, rel: np.ndarray,
+                 has_rel: np.ndarray, norel: Union[str, int]):
+        self.head = head
+        self.words = words
+        self.freq = freq
+        self.fbar = fbar
+        self.norm = norm
+        self.nbar = nbar
+        self.relbar = relbar
+        self.freqbar = freqbar
+        self.rel = rel
+        self.has_rel = has_rel
+        self.norel = norel
+
+    def __len__(self):
+        return len(self.words)
+
+    def reorder(self, order: np.ndarray) -> 'FreqDistResult':
+        """
+        Reorder all the lines (in place) according to the passed array of line indices.
+        """
+        self.words = [self.words[i] for i in order]
+        for col, _ in _NUM_COLUMNS:
+            setattr(self, col, getattr(self, col)[order])
+        return self
+
+    def items(self, start: int = 0, end: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        Materialize lines [start, end) as dicts
+        """
+        sl = slice(start, end)
+        ans = []
+        cols = zip(self.words[sl], self.freq[sl].tolist(), self.fbar[sl].tolist(), self.norm[sl].tolist(),
+                   self.nbar[sl].tolist(), self.relbar[sl].tolist(), self.freqbar[sl].tolist(),
+                   self.rel[sl].tolist(), self.has_rel[sl].tolist())
+        for w, freq, fbar, norm, nbar, relbar, freqbar, rel, has_rel in cols:
+            if has_rel:
+                ans.append(dict(Word=word_to_items(w), freq=freq, fbar=fbar, norm=norm, nbar=nbar,
+                                relbar=relbar, norel=self.norel, freqbar=freqbar, rel=rel))
+            else:
+                ans.append(dict(Word=word_to_items(w), freq=freq, fbar=fbar, norel=1, relbar=None))
+        return ans
+
+    def to_dict(self, start: int = 0, end: Optional[int] = None) -> Dict[str, Any]:
+        return dict(Head=self.head, Items=self.items(start, end))
+
+
+class StrHeap(Sequence[str]):
+    """
+    A read-only sequence of strings stored in a single UTF-8 encoded
+    buffer with an array of boundary offsets. Only accessed items
+    are decoded.
+    """
+
+    def __init__(self, offsets: np.ndarray, heap: np.ndarray):
+        self._offsets = offsets
+        self._heap = heap
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def _decode(self, i):
+        return self._heap[self._offsets[i]:self._offsets[i + 1]].tobytes().decode('utf-8')
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [self._decode(i) for i in range(*idx.indices(len(self)))]
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError('StrHeap index out of range')
+        return self._decode(idx)
+
+
+def _align(size: int, to: int = 8) -> int:
+    return size + (-size % to)
+
+
+def save_freq_dists(path: str, blocks: List[Optional[FreqDistResult]], conc_size: int):
+    """
+    Store a list of frequency distributions (None stands for an empty
+    distribution) to a cache file. The file is written under a temporary
+    name and then atomically renamed so readers never see partial data.
+    """
+    chunks = []
+    data_size = 0
+
+    def add_chunk(b):
+        nonlocal data_size
+        offset = data_size
+        padded = _align(len(b))
+        chunks.append(b + b'\0' * (padded - len(b)))
+        data_size += padded
+        return offset
+
+    header_blocks: List[Optional[Dict[str, Any]]] = []
+    for block in blocks:
+        if block is None:
+            header_blocks.append(None)
+            continue
+        columns = {}
+        for col, dtype in _NUM_COLUMNS:
+            columns[col] = add_chunk(np.ascontiguousarray(getattr(block, col), dtype=dtype).tobytes())
+        encoded = [w.encode('utf-8') for w in block.words]
+        offsets = np.zeros(len(encoded) + 1, dtype='<i8')
+        np.cumsum([len(w) for w in encoded], out=offsets[1:])
+        header_blocks.append(dict(
+            num_lines=len(block), head=block.head, norel=block.norel, columns=columns,
+            word_offsets=add_chunk(offsets.tobytes()), word_heap=add_chunk(b''.join(encoded)),
+            word_heap_size=int(offsets[-1])))
+    header = json.dumps(dict(conc_size=conc_size, blocks=header_blocks)).encode('utf-8')
+    prefix = CACHE_FILE_MAGIC + struct.pack('<Q', len(header)) + header
+    prefix += b'\0' * (_align(len(prefix)) - len(prefix))
+    tmp_path = '{0}.{1}.tmp'.format(path, os.getpid())
+    with open(tmp_path, 'wb') as fw:
+        fw.write(prefix)
+        for chunk in chunks:
+            fw.write(chunk)
+    os.rename(tmp_path, path)
+
+
+def load_freq_dists(path: str) -> Tuple[List[Optional[FreqDistResult]], int]:
+    """
+    Open a cache file created by save_freq_dists(). The data are memory-mapped,
+    i.e. only lines actually exported (see FreqDistResult.items()) are read.
+
+    returns:
+    a 2-tuple (list of FreqDistResult/None, concordance size)
+    """
+    with open(path, 'rb') as fr:
+        magic = fr.read(len(CACHE_FILE_MAGIC))
+        if magic != CACHE_FILE_MAGIC:
+            raise ValueError('Invalid freq. distribution cache file {0}'.format(path))
+        header_size = struct.unpack('<Q', fr.read(8))[0]
+        header = json.loads(fr.read(header_size).decode('utf-8'))
+    data_start = _align(len(CACHE_FILE_MAGIC) + 8 + header_size)
+    mm = None
+    if os.path.getsize(path) > data_start:
+        mm = np.memmap(path, dtype=np.uint8, mode='r', offset=data_start)
+    ans: List[Optional[FreqDistResult]] = []
+    for block in header['blocks']:
+        if block is None:
+            ans.append(None)
+            continue
+        if mm is None:
+            raise ValueError('Invalid freq. distribution cache file {0} (missing data)'.format(path))
+        num_lines = block['num_lines']
+        cols = {}
+        for col, dtype in _NUM_COLUMNS:
+            dt = np.dtype(dtype)
+            offset = block['columns'][col]
+            cols[col] = mm[offset:offset + num_lines * dt.itemsize].view(dt)
+        offset = block['word_offsets']
+        word_offsets = mm[offset:offset + (num_lines + 1) * 8].view('<i8')
+        offset = block['word_heap']
+        heap = mm[offset:offset + block['word_heap_size']]
+        ans.append(FreqDistResult(head=block['head'], words=StrHeap(word_offsets, heap),
+                                  norel=block['norel'], **cols))
+    return ans, header['conc_size']
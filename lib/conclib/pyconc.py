@@ -16,7 +16,7 @@
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
 # 02110-1301, USA.
 
-from typing import List
+from typing import List, Tuple
 
 import os
 from sys import stderr
@@ -24,11 +24,15 @@ import re
 import logging
 
 import manatee
+import corplib
 import l10n
 from l10n import escape
 from kwiclib import lngrp_sortcrit
 from translation import ugettext as translate
-from functools import reduce
+
+import numpy as np
+
+from conclib.freq import FreqDistResult, word_to_items
 
 
 def get_conc_labelmap(infopath):
@@ -113,6 +117,33 @@ class PyConc(manatee.Concordance):
         else:
             raise ValueError('Unknown PyConc command: {0}'.format(name))
 
+    def get_sort_idx_items(self, crit: str) -> List[Tuple[str, int]]:
+        """
+        Return (label, line index) pairs of lines where a new value of a sorting key
+        starts. In case crit contains no structural attribute, only first letters
+        of the keys are considered. Undecodable labels are skipped.
+        """
+        vals = manatee.StrVector()
+        idx = manatee.IntVector()
+        just_letters = '.' not in crit.split('/')[0]
+        self.sort_idx(crit, vals, idx, just_letters)
+        ans = []
+        used_letters = set()
+        for i in range(len(vals)):
+            try:
+                v = vals[i]
+            except UnicodeDecodeError:
+                # Without manatee.set_encoding, manatee appears to produce
+                # few extra undecodable items. Ignoring them produces
+                # the same result as in case of official Bonito app.
+                continue
+            if not just_letters:
+                ans.append((v, idx[i]))
+            elif v[0] not in used_letters:
+                ans.append((v[0], idx[i]))
+                used_letters.add(v[0])
+        return ans
+
     def command_g(self, options):
         """
         sort according to linegroups
@@ -207,28 +238,37 @@ class PyConc(manatee.Concordance):
         a dictionary (key = "structural attribute value" and value = "size in positions")
         """
         full_attr_name = re.split(r'\s+', full_attr_name)[0]
-        struct_name, attr_name = full_attr_name.split('.')
-        struct = self.pycorp.get_struct(struct_name)
-        attr = struct.get_attr(attr_name)
-        normvals = dict([(struct.beg(
-            i), struct.end(i) - struct.beg(i)) for i in range(struct.size())])
-        ans = {}
-        for i in range(attr.id_range()):
-            value = attr.id2str(i)
-            valid = attr.str2id(value)
-            r = self.pycorp.filter_query(struct.attr_val(attr_name, valid))
-            cnt = 0
-            while not r.end():
-                cnt += normvals[r.peek_beg()]
-                r.next()
-            ans[value] = cnt
+        attr = self.pycorp.get_attr(full_attr_name)
+        norms = corplib.struct_attr_norms(self.pycorp, full_attr_name)
+        return dict((attr.id2str(i), int(v)) for i, v in enumerate(norms))
+
+    def get_attr_values_norms(self, full_attr_name, values):
+        """
+        Returns sizes in positions for provided values of a structural attribute.
+        Unlike get_attr_values_sizes(), this does not touch any other attribute values.
+
+        arguments:
+        full_attr_name -- fully qualified structural attribute name (see get_attr_values_sizes())
+        values -- an iterable of attribute values (unknown values are evaluated as 0)
+
+        returns:
+        a list of sizes matching the order of passed values
+        """
+        full_attr_name = re.split(r'\s+', full_attr_name)[0]
+        attr = self.pycorp.get_attr(full_attr_name)
+        norms = corplib.struct_attr_norms(self.pycorp, full_attr_name)
+        ans = []
+        for v in values:
+            vid = attr.str2id(v)
+            ans.append(int(norms[vid]) if vid >= 0 else 0)
         return ans
 
-    def xfreq_dist(self, crit, limit=1, sortkey='f', ml='', ftt_include_empty='', rel_mode=0,
-                   collator_locale='en_US'):
+    def calc_freq_dist(self, crit, limit=1, sortkey='f', ml='', ftt_include_empty='', rel_mode=0,
+                       collator_locale='en_US'):
         """
         Calculates data (including data for visual output) of a frequency distribution
-        specified by the 'crit' parameter
+        specified by the 'crit' parameter. All the per-line metrics are calculated
+        in bulk (see conclib.freq.FreqDistResult).
 
         arguments:
         crit -- specified criteria (CQL)
@@ -238,10 +278,12 @@ class PyConc(manatee.Concordance):
         ml -- str, if non-empty then multi-level freq. distribution is generated
         ftt_include_empty -- str, TODO
         rel_mode -- {0, 1}, TODO
+
+        returns:
+        a FreqDistResult instance or None in case the distribution is empty
         """
 
         # ml = determines how the bar appears (multilevel x text type)
-        # import math
         normwidth_freq = 100
         normwidth_rel = 100
 
@@ -250,13 +292,12 @@ class PyConc(manatee.Concordance):
             Create proper scaling coefficients for freqs and norms
             to match a 100 units length bar.
             """
-            from operator import add
-            sumn = float(reduce(add, norms))
+            sumn = float(norms.sum())
             if sumn == 0:
-                return float(normwidth_rel) / max(freqs), 0
+                return float(normwidth_rel) / freqs.max(), 0
             else:
-                sumf = float(reduce(add, freqs))
-                corr = min(sumf / max(freqs), sumn / max(norms))
+                sumf = float(freqs.sum())
+                corr = min(sumf / freqs.max(), sumn / norms.max())
                 return normwidth_rel / sumf * corr, normwidth_rel / sumn * corr
 
         def label(attr):
@@ -265,36 +306,34 @@ class PyConc(manatee.Concordance):
             lab = self.pycorp.get_conf(attr + '.LABEL')
             return lab if lab else attr
 
-        words = manatee.StrVector()
-        freqs = manatee.NumVector()
-        norms = manatee.NumVector()
-        self.pycorp.freq_dist(self.RS(), crit, limit, words, freqs, norms)
-        if not len(freqs):
-            return {}
+        mwords = manatee.StrVector()
+        mfreqs = manatee.NumVector()
+        mnorms = manatee.NumVector()
+        self.pycorp.freq_dist(self.RS(), crit, limit, mwords, mfreqs, mnorms)
+        if not len(mfreqs):
+            return None
+        words = list(mwords)
+        freqs = np.array(list(mfreqs), dtype=np.int64)
         # now we intentionally rewrite norms as filled in by freq_dist()
         # because of "hard to explain" metrics they lead to
         if rel_mode == 0:
-            norms2_dict = self.get_attr_values_sizes(crit)
-            norms = [norms2_dict.get(x, 0) for x in words]
-        sumf = float(sum([x for x in freqs]))
+            norms = np.array(self.get_attr_values_norms(crit, words), dtype=np.int64)
+        else:
+            norms = np.array(list(mnorms), dtype=np.int64)
+        sumf = float(freqs.sum())
         attrs = crit.split()
         head = [dict(n=label(attrs[x]), s=x / 2)
                 for x in range(0, len(attrs), 2)]
         head.append(dict(n=translate('Freq'), s='freq', title=translate('Frequency')))
 
         tofbar, tonbar = calc_scale(freqs, norms)
+        fbar = (freqs * tofbar).astype(np.int64) + 1
         if tonbar and not ml:
-            maxf = max(freqs)  # because of bar height
-            minf = min(freqs)
-            maxrel = 0
+            maxf = int(freqs.max())  # because of bar height
+            minf = int(freqs.min())
             # because of bar width
-            for index, (f, nf) in enumerate(zip(freqs, norms)):
-                if nf == 0:
-                    nf = 100000
-                    norms[index] = 100000
-                newrel = (f * tofbar / (nf * tonbar))
-                if maxrel < newrel:
-                    maxrel = newrel
+            norms[norms == 0] = 100000
+            maxrel = max(0, float((freqs * tofbar / (norms * tonbar)).max()))
             if rel_mode == 0:
                 head.append(dict(
                     n='i.p.m.',
@@ -302,73 +341,64 @@ class PyConc(manatee.Concordance):
                         'instances per million positions (refers to the respective category)'),
                     s='rel'
                 ))
+                rel = np.round(freqs * 1e6 / norms, 2)
+                relbar = 1 + (freqs * tofbar * normwidth_rel / (norms * tonbar * maxrel)).astype(np.int64)
+                freqbar = (normwidth_freq * freqs.astype(np.float64) / (maxf - minf + 1) + 1).astype(np.int64)
             else:
                 head.append(dict(n='Freq [%]', title='', s='rel'))
-
-            lines = []
-            for w, f, nf in zip(words, freqs, norms):
-                rel_norm_freq = {
-                    0: round(f * 1e6 / nf, 2),
-                    1: round(f / sumf * 100, 2)
-                }[rel_mode]
-
-                rel_bar = {
-                    0: 1 + int(f * tofbar * normwidth_rel / (nf * tonbar * maxrel)),
-                    1: 1 + int(float(f) / maxf * normwidth_rel)
-                }[rel_mode]
-
-                freq_bar = {
-                    0: int(normwidth_freq * float(f) / (maxf - minf + 1) + 1),
-                    1: 10
-                }[rel_mode]
-                lines.append(dict(
-                    Word=[{'n': '  '.join(n.split('\v'))} for n in w.split('\t')],
-                    freq=f,
-                    fbar=int(f * tofbar) + 1,
-                    norm=nf,
-                    nbar=int(nf * tonbar),
-                    relbar=rel_bar,
-                    norel=ml,
-                    freqbar=freq_bar,
-                    rel=rel_norm_freq
-                ))
+                rel = np.round(freqs / sumf * 100, 2)
+                relbar = 1 + (freqs.astype(np.float64) / maxf * normwidth_rel).astype(np.int64)
+                freqbar = np.full(len(freqs), 10, dtype=np.int64)
+            nbar = (norms * tonbar).astype(np.int64)
+            has_rel = np.ones(len(freqs), dtype=bool)
         else:
-            lines = []
-            for w, f, nf in zip(words, freqs, norms):
-                lines.append(dict(
-                    Word=[{'n': '  '.join(n.split('\v'))} for n in w.split('\t')],
-                    freq=f,
-                    fbar=int(f * tofbar) + 1,
-                    norel=1,
-                    relbar=None
-                ))
+            rel = np.zeros(len(freqs))
+            relbar = np.zeros(len(freqs), dtype=np.int64)
+            freqbar = np.zeros(len(freqs), dtype=np.int64)
+            nbar = np.zeros(len(freqs), dtype=np.int64)
+            has_rel = np.zeros(len(freqs), dtype=bool)
+        ans = FreqDistResult(head=head, words=words, freq=freqs, fbar=fbar, norm=norms, nbar=nbar,
+                             relbar=relbar, freqbar=freqbar, rel=rel, has_rel=has_rel, norel=ml)
 
         if ftt_include_empty and limit == 0 and '.' in attrs[0]:
             attr = self.pycorp.get_attr(attrs[0])
-            all_vals = [attr.id2str(i) for i in range(attr.id_range())]
-            used_vals = [line['Word'][0]['n'] for line in lines]
-            for v in all_vals:
-                if v in used_vals:
-                    continue
-                lines.append(dict(
-                    Word=[{'n': v}],
-                    freq=0,
-                    rel=0,
-                    norm=0,
-                    nbar=0,
-                    relbar=0,
-                    norel=ml,
-                    freqbar=0,
-                    fbar=0
-                ))
-        if (sortkey in ('0', '1', '2')) and (int(sortkey) < len(lines[0]['Word'])):
+            used_vals = set(item[0]['n'] for item in (word_to_items(w) for w in words))
+            empty_vals = [v for v in (attr.id2str(i) for i in range(attr.id_range())) if v not in used_vals]
+            if len(empty_vals) > 0:
+                zeros_i = np.zeros(len(empty_vals), dtype=np.int64)
+                ans = FreqDistResult(
+                    head=head, words=words + empty_vals, freq=np.concatenate([ans.freq, zeros_i]),
+                    fbar=np.concatenate([ans.fbar, zeros_i]), norm=np.concatenate([ans.norm, zeros_i]),
+                    nbar=np.concatenate([ans.nbar, zeros_i]), relbar=np.concatenate([ans.relbar, zeros_i]),
+                    freqbar=np.concatenate([ans.freqbar, zeros_i]),
+                    rel=np.concatenate([ans.rel, np.zeros(len(empty_vals))]),
+                    has_rel=np.concatenate([ans.has_rel, np.ones(len(empty_vals), dtype=bool)]), norel=ml)
+
+        if (sortkey in ('0', '1', '2')) and (int(sortkey) < len(ans.words[0].split('\t'))):
             sortkey = int(sortkey)
-            lines = l10n.sort(lines, loc=collator_locale, key=lambda v: v['Word'][sortkey]['n'])
+
+            def sort_val(i):
+                items = word_to_items(ans.words[i])
+                return items[sortkey]['n'] if sortkey < len(items) else ''
+            ans.reorder(l10n.sort(range(len(ans)), loc=collator_locale, key=sort_val))
         else:
             if sortkey not in ('freq', 'rel'):
                 sortkey = 'freq'
-            lines = sorted(lines, key=lambda v: v[sortkey], reverse=True)
-        return dict(Head=head, Items=lines)
+            # a stable sort to keep the original order of lines with equal values
+            ans.reorder(np.argsort(-getattr(ans, sortkey), kind='mergesort'))
+        return ans
+
+    def xfreq_dist(self, crit, limit=1, sortkey='f', ml='', ftt_include_empty='', rel_mode=0,
+                   collator_locale='en_US'):
+        """
+        Calculates a frequency distribution (see calc_freq_dist()) and exports
+        all its lines.
+
+        returns:
+        a dict(Head=..., Items=...) or an empty dict in case there are no data
+        """
+        ans = self.calc_freq_dist(crit, limit, sortkey, ml, ftt_include_empty, rel_mode, collator_locale)
+        return ans.to_dict() if ans is not None else {}
 
     def xdistribution(self, xrange, yrange):
         """
@@ -379,7 +409,18 @@ class PyConc(manatee.Concordance):
         self.distribution(vals, begs, yrange)
         return list(zip(vals, begs))
 
-    def collocs(self, cattr='-', csortfn='m', cbgrfns='mt', cfromw=-5, ctow=5, cminfreq=5, cminbgr=3, max_lines=0):
+    def calc_collocs(self, cattr='-', csortfn='m', cbgrfns='mt', cfromw=-5, ctow=5, cminfreq=5, cminbgr=3,
+                     max_lines=0):
+        """
+        Calculates collocation candidates sorted by 'csortfn'.
+
+        arguments:
+        max_lines -- max. number of returned items (0 = all the candidates)
+
+        returns:
+        a 2-tuple (head, rows) where each row is a compact tuple
+        (item, freq, tuple of 'cbgrfns' stats values)
+        """
         statdesc = {'t': translate('T-score'),
                     'm': translate('MI'),
                     '3': translate('MI3'),
@@ -390,27 +431,39 @@ class PyConc(manatee.Concordance):
                     'f': translate('absolute freq.'),
                     'd': translate('logDice')
                     }
-        items = []
+        rows = []
         colls = manatee.CollocItems(self, cattr, csortfn, cminfreq, cminbgr,
                                     cfromw, ctow, max_lines)
-        qfilter = '%%s%i %i 1 [%s="%%s"]' % (cfromw, ctow, cattr)
         i = 0
         while not colls.eos():
             if 0 < max_lines < i:
                 break
-            items.append(dict(
-                str=colls.get_item(),
-                freq=colls.get_cnt(),
-                Stats=[{'s': '%.3f' % colls.get_bgr(s)} for s in cbgrfns],
-                pfilter=qfilter % ('P', escape(colls.get_item())),
-                nfilter=qfilter % ('N', escape(colls.get_item()))
-            ))
+            rows.append((colls.get_item(), colls.get_cnt(), tuple(colls.get_bgr(s) for s in cbgrfns)))
             colls.next()
             i += 1
 
         head = [{'n': ''}, {'n': 'Freq', 's': 'f'}] + \
             [{'n': statdesc.get(s, s), 's': s} for s in cbgrfns]
-        return dict(Head=head, Items=items)
+        return head, rows
+
+    @staticmethod
+    def export_colloc_rows(rows, cattr, cfromw, ctow):
+        """
+        Converts compact rows as returned by calc_collocs() into
+        dicts as expected by templates and the client.
+        """
+        qfilter = '%%s%i %i 1 [%s="%%s"]' % (cfromw, ctow, cattr)
+        return [dict(str=item,
+                     freq=freq,
+                     Stats=[{'s': '%.3f' % v} for v in stats],
+                     pfilter=qfilter % ('P', escape(item)),
+                     nfilter=qfilter % ('N', escape(item)))
+                for item, freq, stats in rows]
+
+    def collocs(self, cattr='-', csortfn='m', cbgrfns='mt', cfromw=-5, ctow=5, cminfreq=5, cminbgr=3, max_lines=0):
+        head, rows = self.calc_collocs(cattr=cattr, csortfn=csortfn, cbgrfns=cbgrfns, cfromw=cfromw, ctow=ctow,
+                                       cminfreq=cminfreq, cminbgr=cminbgr, max_lines=max_lines)
+        return dict(Head=head, Items=self.export_colloc_rows(rows, cattr, cfromw, ctow))
 
     def linegroup_info_select(self, selected_count=5):
         """
@@ -21,6 +21,7 @@
 import logging
 from typing import Tuple, Optional, Union
 import os
+import time
 
 import settings
 import plugins
@@ -28,8 +29,9 @@ from plugins.abstract.conc_cache import CalcStatus
 from conclib.pyconc import PyConc
 from conclib.empty import EmptyConc
 from conclib.calc.base import GeneralWorker
-from conclib.calc import find_cached_conc_base, wait_for_conc, del_silent
+from conclib.calc import find_cached_conc_base, wait_for_conc, del_silent, store_sort_idx
 from conclib.calc.errors import ConcCalculationStatusException
+from corplib import is_subcorpus
 import bgcalc
 import manatee
 
@@ -193,6 +195,34 @@ def get_conc(corp, user_id, q: Tuple[str, ...] = None, fromp=0, pagesize=0, asnc
                             'Wait for concordance operation failed')
                 elif not stored_status:
                     conc.save(cachefile)
+                    if not isinstance(conc, EmptyConc):  # an empty concordance has nothing to index
+                        store_sort_idx(cache_map, conc, subchash, q[:act + 1])
                     cache_map.update_calc_status(
                         subchash, q[:act + 1], finished=True, concsize=conc.size())
     return conc
+
+
+def get_stored_calc_status(corp: manatee.Corpus, user_id: int, q: Tuple[str, ...]) -> Optional[CalcStatus]:
+    """
+    Return a stored calculation status of a cached concordance (None if there is no
+    valid one). Result ARF of concordances calculated via Manatee's asynchronous
+    calculation is stored along with the status. For the other (finished) ones,
+    the value is calculated in background (i.e. it is missing in the returned status)
+    and stored once ready. The background task is submitted only once (unless it
+    does not finish within the task time limit).
+    """
+    if not q:
+        return None
+    cache_map = plugins.runtime.CONC_CACHE.instance.get_mapping(corp)
+    subchash = getattr(corp, 'subchash', None)
+    status = cache_map.get_calc_status(subchash, q)
+    if status is None or status.error is not None:
+        return None
+    if status.finished and not status.has_arf() and not is_subcorpus(corp):
+        if status.arf_task_id is None or time.time() - status.last_upd > TASK_TIME_LIMIT:
+            app = bgcalc.calc_backend_client(settings)
+            res = app.send_task('worker.conc_calculate_arf',
+                                (user_id, corp.corpname, getattr(corp, 'subcname', None), subchash, q),
+                                time_limit=TASK_TIME_LIMIT)
+            cache_map.update_calc_status(subchash, q, arf_task_id=res.id)
+    return status
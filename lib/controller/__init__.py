@@ -21,7 +21,7 @@
 KonText controller and related auxiliary objects
 """
 
-from typing import Dict, List, Tuple, Callable, Any, Union, Optional, TYPE_CHECKING, TypeVar
+from typing import Dict, List, Tuple, Callable, Any, Union, Optional, Iterator, TYPE_CHECKING, TypeVar
 # this is to fix cyclic imports when running the app caused by typing
 if TYPE_CHECKING:
     from .plg import PluginApi
@@ -55,7 +55,7 @@ import settings
 from translation import ugettext as translate
 from argmapping import Parameter, GlobalArgs, Args
 from .errors import (UserActionException, NotFoundException, get_traceback, fetch_exception_msg,
-                     CorpusForbiddenException, ImmediateRedirectException)
+                     CorpusForbiddenException, ImmediateRedirectException, CalculationPendingException)
 
 import werkzeug.wrappers
 import http.cookies
@@ -804,7 +804,7 @@ class Controller(object):
     def _is_allowed_explicit_out_format(f: str) -> bool:
         return f in ('template', 'json', 'xml', 'plain')
 
-    def run(self, path: Optional[List[str]] = None) -> Tuple[str, List[Tuple[str, str]], bool, Union[str, bytes]]:
+    def run(self, path: Optional[List[str]] = None) -> Tuple[str, List[Tuple[str, str]], bool, Union[str, bytes, Iterator[str]]]:
         """
         This method wraps all the processing of an HTTP request.
 
@@ -848,6 +848,11 @@ class Controller(object):
             err = (ex, None)
             tmpl, result = None, None
             self.redirect(ex.url, ex.code)
+        except CalculationPendingException as ex:
+            err = (ex, None)
+            self._status = ex.code
+            tmpl, result = self._run_message_action(named_args, action_metadata, 'info', str(ex))
+            result['calc_pending_task_id'] = ex.task_id
         except UserActionException as ex:
             err = (ex, None)
             self._status = ex.code
@@ -952,7 +957,7 @@ class Controller(object):
             ans.append(('Set-Cookie', cookie.OutputString()))
         return ans
 
-    def output_result(self, methodname: str, template: str, result: Union[Callable, Dict[str, Any], str, bytes], action_metadata: Dict[str, Any], return_type: str) -> Union[str, bytes]:
+    def output_result(self, methodname: str, template: str, result: Union[Callable, Dict[str, Any], str, bytes], action_metadata: Dict[str, Any], return_type: str) -> Union[str, bytes, Iterator[str]]:
         """
         Renders a response body out of a provided data resource along with which can
         required target data type.
@@ -961,6 +966,9 @@ class Controller(object):
         1) a callable object returning a string or bytes
         2) a dictionary
         3) str or bytes
+
+        In case of the 'plain' return type, a dictionary source produces an iterator
+        of rendered string chunks.
         """
         if callable(result):
             return result()
@@ -977,6 +985,9 @@ class Controller(object):
             for k in self.args.__dict__:
                 if k not in result:
                     result[k] = getattr(self.args, k)
+            if return_type == 'plain':
+                # plain text exports may be large - let the response stream the output
+                return template_object.generate(result)
             return template_object.render(result)
         raise RuntimeError('Unknown source or return type')
 
@@ -121,6 +121,19 @@ class ImmediateRedirectException(UserActionException):
         self.url = url
 
 
+class CalculationPendingException(UserActionException):
+    """
+    Raised by an action rendering an HTML page in case a required
+    background calculation has not finished yet. Instead of the page,
+    a message is shown and the client reloads the page (with the task
+    identifier attached) once the task is finished.
+    """
+
+    def __init__(self, message, task_id):
+        super().__init__(message, 202)
+        self.task_id = task_id
+
+
 class FunctionNotSupported(Exception):
     """
     In case a function is invoked on a corpus which does not support it
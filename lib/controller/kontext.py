@@ -34,7 +34,7 @@ import corplib
 import conclib
 from . import convert_types, exposed
 from .errors import (UserActionException, ForbiddenException,
-                     AlignedCorpusForbiddenException, NotFoundException)
+                     AlignedCorpusForbiddenException, NotFoundException, CalculationPendingException)
 import plugins
 from plugins.abstract.corpora import BrokenCorpusInfo, CorpusInfo
 from plugins.abstract.auth import AbstractInternalAuth
@@ -180,6 +180,9 @@ class AsyncTaskStatus(object):
         status (str): one of
     """
     CATEGORY_SUBCORPUS = 'subcorpus'
+    CATEGORY_FREQ = 'freq'
+    CATEGORY_FREQ_CT = 'freq_ct'
+    CATEGORY_COLL = 'coll'
 
     def __init__(self, ident: str, label: str, status: int, category: str, args: Dict[str, Any], created: Optional[float] = None, error: Optional[str] = None) -> None:
         self.ident: str = ident
@@ -1405,6 +1408,60 @@ class Kontext(Controller):
         at_list.append(async_task_status)
         self._set_async_tasks(at_list)
 
+    def _calc_in_background(self, calc_fn, calc_args, category: str, label: str) -> Tuple[Any, Optional[AsyncTaskStatus]]:
+        """
+        Runs a background calculation function (freq_calc.calculate_freqs etc.)
+        without blocking the request until an unfinished calculation is done:
+
+        1) an HTML page (a GET request of an action rendering a template) raises
+           CalculationPendingException - a message is shown instead of the page
+           and the client reloads the page with 'calc_task_id' set once the task
+           is finished (see the 'asyncTasks' page configuration),
+        2) a JSON request with the 'calc_nowait' argument set obtains a task handle
+           (the client polls check_tasks_status and then repeats the same request
+           with 'calc_task_id' set to obtain the result),
+        3) other requests (exports, JSON requests without 'calc_nowait') wait for the result.
+
+        An unfinished calculation is stored as a respective AsyncTaskStatus. Only IDs of
+        the user's own tasks of the respective category are accepted (a page reloaded
+        with an already consumed task ID just ignores the ID).
+
+        returns:
+        a 2-tuple (calculation result, None) or (None, AsyncTaskStatus) for
+        an unfinished calculation
+        """
+        from bgcalc import CalcTaskPending
+        return_type = self._request.args.get(
+            'format', self._get_method_metadata(self.get_current_action()[1], 'return_type'))
+        is_page = return_type == 'template' and self.get_http_method() == 'GET'
+        nowait = is_page or (bool(getattr(self.args, 'calc_nowait')) and return_type == 'json')
+        task_id = getattr(self.args, 'calc_task_id') or None
+        if task_id and task_id not in [at.ident for at in self.get_async_tasks(category=category)]:
+            if not is_page:
+                raise UserActionException(translate('Unknown calculation task'))
+            task_id = None
+        try:
+            ans = calc_fn(calc_args, wait=not nowait, task_id=task_id)
+        except CalcTaskPending as ex:
+            at_list = self.get_async_tasks()
+            for at in at_list:
+                if at.ident == ex.task_id:
+                    at.status = ex.status
+                    break
+            else:
+                at = AsyncTaskStatus(status=ex.status, ident=ex.task_id, label=label, category=category,
+                                     args=dict(corpname=getattr(self.args, 'corpname')))
+                at_list.append(at)
+            self._set_async_tasks(at_list)
+            if is_page:
+                raise CalculationPendingException(
+                    translate('The calculation is still running. The page will be reloaded once it is finished.'),
+                    ex.task_id)
+            return None, at
+        if task_id:
+            self._set_async_tasks([x for x in self.get_async_tasks() if x.ident != task_id])
+        return ans, None
+
     @exposed(return_type='json')
     def concdesc_json(self, _: Optional[Request] = None) -> Dict[str, List[Dict[str, Any]]]:
         out_list: List[Dict[str, Any]] = []
@@ -1444,12 +1501,18 @@ class Kontext(Controller):
 
     @exposed(return_type='json', skip_corpus_init=True)
     def check_tasks_status(self, request: Request) -> Dict[str, Any]:
+        """
+        Returns status of user's background tasks. The request never waits
+        for the tasks - clients are expected to poll repeatedly.
+        """
         backend = settings.get('calc_backend', 'type')
         if backend in('celery', 'konserver'):
             import bgcalc
             app = bgcalc.calc_backend_client(settings)
             at_list = self.get_async_tasks()
             for at in at_list:
+                if at.is_finished():
+                    continue
                 r = app.AsyncResult(at.ident)
                 at.status = r.status
                 if at.status == 'FAILURE':
@@ -18,9 +18,9 @@
 # along with this program; if not, write to the Free Software
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
 
-from typing import List, Any, Optional, Tuple, Dict, Union, Set
+from typing import List, Any, Optional, Tuple, Dict, Union, Set, Iterator, Iterable
 from manatee import Corpus, SubCorpus, Concordance, StrVector, PosAttr, Structure
-from array import array
+from collections import OrderedDict
 
 import os
 import glob
@@ -28,6 +28,8 @@ from hashlib import md5
 from datetime import datetime
 import json
 import logging
+import threading
+import numpy as np
 
 
 try:
@@ -51,6 +53,7 @@ import manatee
 from functools import partial
 from translation import ugettext as _
 import plugins
+import settings
 from functools import cmp_to_key
 
 
@@ -181,6 +184,50 @@ def subcorpus_from_conc(path: str, conc: Concordance, struct: Optional[str] = No
     return manatee.create_subcorpus(path, conc.RS(), struct)
 
 
+def merge_intervals(begs: np.ndarray, ends: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Merge overlapping and adjacent position intervals [beg, end).
+
+    arguments:
+    begs -- an array of interval beginnings
+    ends -- an array of (exclusive) interval ends
+
+    returns:
+    a 2-tuple of sorted arrays (beginnings, ends) of merged intervals
+    """
+    if len(begs) == 0:
+        return np.array([], dtype=np.int64), np.array([], dtype=np.int64)
+    order = np.argsort(begs, kind='mergesort')
+    begs = begs[order]
+    ends = ends[order]
+    max_ends = np.maximum.accumulate(ends)
+    starts = np.concatenate([[0], np.nonzero(begs[1:] > max_ends[:-1])[0] + 1])
+    return begs[starts], np.maximum.reduceat(ends, starts)
+
+
+def subcorpus_from_struct_indices(path: str, struct: Structure, indices: Iterable[int]) -> int:
+    """
+    Creates a subcorpus file containing provided structure items. Just like
+    Manatee does, adjacent and overlapping intervals are merged. The file is
+    written as a sequence of 64-bit little-endian (begin, end) position pairs.
+
+    arguments:
+    path -- path of the new subcorpus file
+    struct -- a structure the indices refer to (a manatee.Structure instance)
+    indices -- indices of the structure's items
+
+    returns:
+    number of written intervals
+    """
+    indices = list(indices)
+    begs = np.fromiter((struct.beg(idx) for idx in indices), dtype=np.int64, count=len(indices))
+    ends = np.fromiter((struct.end(idx) for idx in indices), dtype=np.int64, count=len(indices))
+    begs, ends = merge_intervals(begs, ends)
+    with open(path, 'wb') as fw:
+        fw.write(np.column_stack((begs, ends)).astype('<i8').tobytes())
+    return len(begs)
+
+
 def is_subcorpus(corp_obj: Corpus) -> bool:
     return isinstance(corp_obj, manatee.SubCorpus)
 
@@ -405,99 +452,193 @@ def add_block_items(items: List[Dict[str, Any]], attr: str = 'class', val: str =
     return items
 
 
+# number of value IDs fetched from manatee's regexp2ids() at once
+WORDLIST_ID_CHUNK_SIZE = 100000
+
+
+def _wordlist_ids(attr: PosAttr, enc_pattern: str, excl_pattern: str) -> Iterator[np.ndarray]:
+    """
+    Generates (in chunks) IDs of attribute values matching enc_pattern
+    (and not matching excl_pattern).
+    """
+    if enc_pattern in ('', '.*') and not excl_pattern:
+        yield np.arange(attr.id_range(), dtype=np.int64)
+        return
+    try:
+        gen = attr.regexp2ids(enc_pattern, 0, excl_pattern)
+    except TypeError:
+        gen = attr.regexp2ids(enc_pattern, 0)
+
+    def read_chunk():
+        i = 0
+        while i < WORDLIST_ID_CHUNK_SIZE and not gen.end():
+            yield gen.next()
+            i += 1
+
+    while not gen.end():
+        yield np.fromiter(read_chunk(), dtype=np.int64)
+
+
+def _str2ids(attr: PosAttr, values: Union[str, Iterable[str], None]) -> Optional[np.ndarray]:
+    """
+    Translates a collection of attribute values (or a whitespace-separated string) into
+    an array of respective IDs (unknown values are ignored). Empty input produces None.
+    """
+    if isinstance(values, str):
+        values = values.split()
+    if not values:
+        return None
+    ids = (attr.str2id(v) for v in values)
+    return np.array(sorted(set(i for i in ids if i >= 0)), dtype=np.int64)
+
+
+def _iter_wordlist_matches(attr: PosAttr, attrfreq: np.ndarray, enc_pattern: str, excl_pattern: str,
+                           wlminfreq: int, words: Union[str, Iterable[str], None],
+                           blacklist: Union[str, Iterable[str], None]) -> Iterator[np.ndarray]:
+    """
+    Generates (in chunks, in the pattern search order) all the attribute value IDs
+    matching the pattern with non-zero frequency greater or equal to wlminfreq, present
+    in 'words' (if non-empty) and not present in 'blacklist'. All the filtering is
+    performed in bulk over NumPy arrays.
+    """
+    white_ids = _str2ids(attr, words)
+    black_ids = _str2ids(attr, blacklist)
+    for ids in _wordlist_ids(attr, enc_pattern, excl_pattern):
+        frq = attrfreq[ids]
+        mask = (frq != 0) & (frq >= wlminfreq)
+        if white_ids is not None:
+            mask &= np.isin(ids, white_ids)
+        if black_ids is not None:
+            mask &= ~np.isin(ids, black_ids)
+        yield ids[mask]
+
+
+def _wordlist_matches(attr: PosAttr, attrfreq: np.ndarray, enc_pattern: str, excl_pattern: str, wlminfreq: int,
+                      words: Union[str, Iterable[str], None], blacklist: Union[str, Iterable[str], None],
+                      limit: int = 0) -> np.ndarray:
+    """
+    Finds all the attribute value IDs matching the search (see _iter_wordlist_matches()).
+
+    arguments:
+    limit -- if non-zero then the search stops once the specified number of IDs is found
+             (the result is then the first 'limit' matching IDs in the pattern search order)
+    """
+    ans = []
+    total = 0
+    for ids in _iter_wordlist_matches(attr, attrfreq, enc_pattern, excl_pattern, wlminfreq, words, blacklist):
+        ans.append(ids)
+        total += len(ids)
+        if 0 < limit <= total:
+            break
+    ans = np.concatenate(ans) if len(ans) > 0 else np.zeros(0, dtype=np.int64)
+    return ans[:limit] if limit > 0 else ans
+
+
+def _top_k(freqs: np.ndarray, k: int) -> np.ndarray:
+    """
+    Returns (ascending) indices of k highest values of 'freqs'. Ties are resolved
+    in favour of lower indices so the selection is the same as the first k items
+    of a stable descending sort.
+    """
+    if len(freqs) <= k:
+        return np.arange(len(freqs))
+    if k <= 0:
+        return np.zeros(0, dtype=np.int64)
+    threshold = np.partition(freqs, len(freqs) - k)[len(freqs) - k]
+    above = np.nonzero(freqs > threshold)[0]
+    at = np.nonzero(freqs == threshold)[0][:k - len(above)]
+    return np.sort(np.concatenate((above, at)))
+
+
+def _top_freqs(freqs: np.ndarray, k: int) -> np.ndarray:
+    """
+    Returns indices of k highest values of 'freqs' sorted in descending order
+    """
+    idx = _top_k(freqs, k)
+    return idx[np.argsort(-freqs[idx], kind='mergesort')]
+
+
+def _wordlist_freqs(attrfreq: np.ndarray, ids: np.ndarray, wlnums: str) -> np.ndarray:
+    frq = attrfreq[ids]
+    return np.round(frq.astype(np.float64), 1) if wlnums == 'arf' else frq
+
+
 def get_wordlist_length(corp: Corpus, wlattr: str, wlpat: str, wlnums: str, wlminfreq: int, words: str, blacklist: str, include_nonwords: bool) -> int:
-    enc_pattern = wlpat.strip()
     attr = corp.get_attr(wlattr)
     attrfreq = _get_attrfreq(corp=corp, attr=attr, wlattr=wlattr, wlnums=wlnums)
     if not include_nonwords:
         nwre = corp.get_conf('NONWORDRE')
     else:
         nwre = ''
-    try:
-        gen = attr.regexp2ids(enc_pattern, 0, nwre)
-    except TypeError:
-        gen = attr.regexp2ids(enc_pattern, 0)
-    i = 0
-    while not gen.end():
-        wid = gen.next()
-        frq = attrfreq[wid]
-        if not frq:
-            continue
-        id_value = attr.id2str(wid)
-        if frq >= wlminfreq and (not words or id_value in words) and (not blacklist or id_value not in blacklist):
-            i += 1
-    return i
+    return len(_wordlist_matches(attr=attr, attrfreq=attrfreq, enc_pattern=wlpat.strip(), excl_pattern=nwre,
+                                 wlminfreq=wlminfreq, words=words, blacklist=blacklist))
 
 
 def _wordlist_by_pattern(attr, attrfreq, enc_pattern, excl_pattern, wlminfreq, words, blacklist, wlnums, wlsort, wlmaxitems):
-    try:
-        gen = attr.regexp2ids(enc_pattern, 0, excl_pattern)
-    except TypeError:
-        gen = attr.regexp2ids(enc_pattern, 0)
-    items = []
-    while not gen.end():
-        if wlsort == 'f':
-            if len(items) > 5 * wlmaxitems:
-                items.sort()
-                del items[:-wlmaxitems]
-        else:
-            if len(items) >= wlmaxitems:
-                break
-        wid = gen.next()
-        frq = attrfreq[wid]
-        if not frq:
-            continue
-
-        id_value = attr.id2str(wid)
-        if frq >= wlminfreq and (not words or id_value in words) and (not blacklist or id_value not in blacklist):
-            if wlnums == 'arf':
-                items.append((round(frq, 1), wid))
-            else:
-                items.append((frq, wid))
-    return items
+    """
+    returns:
+    a 2-tuple of arrays (freqs, value IDs) - either wlmaxitems most frequent ones (wlsort == 'f')
+    or first wlmaxitems found ones. In the former case, the search keeps only the current
+    top wlmaxitems candidates in memory.
+    """
+    if wlsort != 'f':
+        ids = _wordlist_matches(attr=attr, attrfreq=attrfreq, enc_pattern=enc_pattern, excl_pattern=excl_pattern,
+                                wlminfreq=wlminfreq, words=words, blacklist=blacklist, limit=wlmaxitems)
+        return _wordlist_freqs(attrfreq, ids, wlnums), ids
+    # candidates are kept in the search order and reduced to the top wlmaxitems
+    # once there are more than 2 * wlmaxitems of them
+    cand_ids = [np.zeros(0, dtype=np.int64)]
+    num_cand = 0
+    for chunk in _iter_wordlist_matches(attr=attr, attrfreq=attrfreq, enc_pattern=enc_pattern,
+                                        excl_pattern=excl_pattern, wlminfreq=wlminfreq, words=words,
+                                        blacklist=blacklist):
+        cand_ids.append(chunk)
+        num_cand += len(chunk)
+        if num_cand > 2 * wlmaxitems:
+            ids = np.concatenate(cand_ids)
+            ids = ids[_top_k(_wordlist_freqs(attrfreq, ids, wlnums), wlmaxitems)]
+            cand_ids = [ids]
+            num_cand = len(ids)
+    ids = np.concatenate(cand_ids)
+    freqs = _wordlist_freqs(attrfreq, ids, wlnums)
+    idx = _top_freqs(freqs, wlmaxitems)
+    return freqs[idx], ids[idx]
 
 
 def _wordlist_from_list(attr, attrfreq, words, blacklist, wlsort, wlminfreq, wlmaxitems, wlnums):
-    items = []
-    for word in words:
-        if wlsort == 'f':
-            if len(items) > 5 * wlmaxitems:
-                items.sort()
-                del items[:-wlmaxitems]
-        else:
-            if len(items) >= wlmaxitems:
-                break
-        id = attr.str2id(word)
-        if id == -1:
-            frq = 0
-        else:
-            frq = attrfreq[id]
-        if word and frq >= wlminfreq and (not blacklist or word not in blacklist):
-            if wlnums == 'arf':
-                items.append((round(frq, 1), word))
-            else:
-                items.append((frq, word))
-    return items
+    """
+    returns:
+    a list of (freq, value) for provided words (unknown words have zero frequency)
+    """
+    words = [w for w in words if w and (not blacklist or w not in blacklist)]
+    ids = np.array([attr.str2id(w) for w in words], dtype=np.int64)
+    known = ids >= 0
+    ids[~known] = 0
+    sel = np.nonzero(np.where(known, attrfreq[ids], 0) >= wlminfreq)[0]
+    freqs = np.where(known, _wordlist_freqs(attrfreq, ids, wlnums), 0)
+    if wlsort == 'f':
+        sel = sel[_top_freqs(freqs[sel], wlmaxitems)]
+    else:
+        sel = sel[:wlmaxitems]
+    return [(freqs[i].item(), words[i]) for i in sel]
 
 
 def _get_attrfreq(corp, attr, wlattr, wlnums):
     if '.' in wlattr:  # attribute of a structure
-        struct = corp.get_struct(wlattr.split('.')[0])
-        if wlnums == 'doc sizes':
-            normvals = dict([(struct.beg(i), struct.end(i) - struct.beg(i))
-                             for i in range(struct.size())])
-        else:
-            normvals = dict([(struct.beg(i), 1) for i in range(struct.size())])
-        attrfreq = dict([(i, doc_sizes(corp, struct, wlattr, i, normvals))
-                         for i in range(attr.id_range())])
+        attrfreq = struct_attr_norms(corp, wlattr, norm='tokens' if wlnums == 'doc sizes' else 'freq')
     else:  # positional attribute
         attrfreq = frq_db(corp, wlattr, wlnums)
     return attrfreq
 
 
-def wordlist(corp: Corpus, words: Optional[Set[str]] = None, wlattr: str = '', wlpat: str = '', wlminfreq: int = 5, wlmaxitems: int = 100,
-             wlsort: str = '', blacklist: Optional[Set[str]] = None, wlnums: Optional[str] = 'frq', include_nonwords: int = 0) -> List[Dict[str, Any]]:
+def iter_wordlist(corp: Corpus, words: Optional[Set[str]] = None, wlattr: str = '', wlpat: str = '', wlminfreq: int = 5,
+                  wlmaxitems: int = 100, wlsort: str = '', blacklist: Optional[Set[str]] = None,
+                  wlnums: Optional[str] = 'frq', include_nonwords: int = 0) -> Iterator[Tuple[str, Union[int, float]]]:
     """
+    A lazy variant of wordlist() producing (value, freq) pairs. With wlsort == 'f', only
+    the wlmaxitems most frequent candidates are kept during the search and attribute
+    values are decoded one by one as the items are consumed.
+
     Note: 'words' and 'blacklist' are expected to contain utf-8-encoded strings.
     """
     blacklist = set(w for w in blacklist) if blacklist else set()
@@ -507,33 +648,136 @@ def wordlist(corp: Corpus, words: Optional[Set[str]] = None, wlattr: str = '', w
     if words and wlpat == '.*':  # word list just for given words
         items = _wordlist_from_list(attr=attr, attrfreq=attrfreq, words=words, blacklist=blacklist, wlsort=wlsort,
                                     wlminfreq=wlminfreq, wlmaxitems=wlmaxitems, wlnums=wlnums)
-    else:  # word list according to pattern
-        if not include_nonwords:
-            nwre = corp.get_conf('NONWORDRE')
+        if wlsort == 'f':
+            items = sorted(items, key=lambda x: x[0], reverse=True)
         else:
-            nwre = ''
-        items = _wordlist_by_pattern(attr=attr, enc_pattern=wlpat.strip(), excl_pattern=nwre,
-                                     wlminfreq=wlminfreq, words=words, blacklist=blacklist, wlnums=wlnums,
-                                     wlsort=wlsort, wlmaxitems=wlmaxitems, attrfreq=attrfreq)
+            items = sorted(items, key=lambda x: x[1])
+        for f, w in items:
+            yield w, f
+        return
 
-    if not words or wlpat != '.*':
-        items = [(f, attr.id2str(i)) for (f, i) in items]
-    if wlsort == 'f':
-        items = sorted(items, key=lambda x: x[0], reverse=True)
+    if not include_nonwords:
+        nwre = corp.get_conf('NONWORDRE')
     else:
-        items = sorted(items, key=lambda x: x[1])
-    del items[wlmaxitems:]
-    return add_block_items([{'str': w, 'freq': f}
-                            for f, w in items])
+        nwre = ''
+    freqs, ids = _wordlist_by_pattern(attr=attr, enc_pattern=wlpat.strip(), excl_pattern=nwre,
+                                      wlminfreq=wlminfreq, words=words, blacklist=blacklist, wlnums=wlnums,
+                                      wlsort=wlsort, wlmaxitems=wlmaxitems, attrfreq=attrfreq)
+    if wlsort == 'f':  # already sorted
+        for f, i in zip(freqs.tolist(), ids.tolist()):
+            yield attr.id2str(i), f
+    else:
+        yield from sorted(((attr.id2str(i), f) for f, i in zip(freqs.tolist(), ids.tolist())),
+                          key=lambda x: x[0])
+
+
+def wordlist(corp: Corpus, words: Optional[Set[str]] = None, wlattr: str = '', wlpat: str = '', wlminfreq: int = 5, wlmaxitems: int = 100,
+             wlsort: str = '', blacklist: Optional[Set[str]] = None, wlnums: Optional[str] = 'frq', include_nonwords: int = 0) -> List[Dict[str, Any]]:
+    """
+    Note: 'words' and 'blacklist' are expected to contain utf-8-encoded strings.
+    """
+    items = iter_wordlist(corp=corp, words=words, wlattr=wlattr, wlpat=wlpat, wlminfreq=wlminfreq,
+                          wlmaxitems=wlmaxitems, wlsort=wlsort, blacklist=blacklist, wlnums=wlnums,
+                          include_nonwords=include_nonwords)
+    return add_block_items([{'str': w, 'freq': f} for w, f in items])
 
 
-def doc_sizes(corp: Corpus, struct: Structure, attrname: str, i: int, normvals: Dict[int, int]) -> int:
-    r = corp.filter_query(struct.attr_val(attrname.split('.')[1], i))
-    cnt = 0
-    while not r.end():
-        cnt += normvals[r.peek_beg()]
-        r.next()
-    return cnt
+# max. number of struct_attr_norms() results kept within a process
+STRUCT_ATTR_NORMS_CACHE_SIZE = 64
+
+# a per-process LRU cache of struct_attr_norms() results:
+# (corpus conf. path, subcorpus path, attribute, norm) => (data mtime, norms)
+_struct_attr_norms_cache: 'OrderedDict[Tuple[str, Optional[str], str, str], Tuple[float, np.ndarray]]' = \
+    OrderedDict()
+
+_struct_attr_norms_cache_lock = threading.Lock()
+
+
+def _struct_attr_norms_path(corp: Corpus, full_attr_name: str, norm: str) -> Optional[str]:
+    if hasattr(corp, 'spath'):
+        return '%s.%s.norms' % (subcorp_base_file(corp, full_attr_name), norm)
+    precalc_dir = settings.get('corpora', 'freqs_precalc_dir', None)
+    if precalc_dir:
+        return os.path.join(os.path.abspath(precalc_dir), corp.corpname, '%s.%s.norms' % (full_attr_name, norm))
+    return None
+
+
+def _calc_struct_attr_norms(corp: Corpus, full_attr_name: str, norm: str) -> np.ndarray:
+    struct_name, attr_name = full_attr_name.split('.')
+    struct = corp.get_struct(struct_name)
+    attr = struct.get_attr(attr_name)
+    val_ids = []
+    sizes = []
+    if is_subcorpus(corp):
+        # only structure instances (at least partially) covered by the subcorpus are counted
+        r = corp.filter_query(struct.whole())
+        while not r.end():
+            num = struct.num_at_pos(r.peek_beg())
+            val_ids.append(attr.pos2id(num))
+            sizes.append(struct.end(num) - struct.beg(num))
+            r.next()
+    else:
+        for i in range(struct.size()):
+            val_ids.append(attr.pos2id(i))
+            sizes.append(struct.end(i) - struct.beg(i))
+    weights = np.array(sizes, dtype=np.float64) if norm == 'tokens' else None
+    return np.bincount(np.array(val_ids, dtype=np.int64), weights=weights,
+                       minlength=attr.id_range()).astype(np.int64)
+
+
+def struct_attr_norms(corp: Corpus, full_attr_name: str, norm: str = 'tokens') -> np.ndarray:
+    """
+    Calculate sizes of all the values of a structural attribute in a single
+    pass over respective structure instances.
+
+    The result is memoized within the current process and (if possible) stored
+    next to the corpus frequency data (see 'freqs_precalc_dir' configuration)
+    or next to the subcorpus file.
+
+    arguments:
+    corp -- a manatee.Corpus (or SubCorpus) instance
+    full_attr_name -- a structural attribute (e.g. 'doc.id')
+    norm -- either 'tokens' (sum of sizes of structure instances in positions)
+            or 'freq' (number of structure instances)
+
+    returns:
+    an array of sizes indexed by attribute value IDs
+    """
+    data_mtime = corp_mtime(corp)
+    spath = getattr(corp, 'spath', None)
+    if spath:
+        data_mtime = max(data_mtime, os.path.getmtime(spath))
+    key = (corp.get_confpath(), spath, full_attr_name, norm)
+    with _struct_attr_norms_cache_lock:
+        cached = _struct_attr_norms_cache.get(key)
+        if cached and cached[0] == data_mtime:
+            _struct_attr_norms_cache.move_to_end(key)
+            return cached[1]
+
+    id_range = corp.get_attr(full_attr_name).id_range()
+    path = _struct_attr_norms_path(corp, full_attr_name, norm)
+    ans = None
+    if path and os.path.isfile(path) and os.path.getmtime(path) >= data_mtime:
+        ans = np.fromfile(path, dtype=np.int64)
+        if len(ans) != id_range:
+            logging.getLogger(__name__).warning(f'Ignoring invalid structural attribute norms file {path}')
+            ans = None
+    if ans is None:
+        ans = _calc_struct_attr_norms(corp, full_attr_name, norm)
+        if path:
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                ans.tofile(path + '.tmp')
+                os.rename(path + '.tmp', path)
+            except OSError as ex:
+                logging.getLogger(__name__).warning(f'Failed to store structural attribute norms {path}: {ex}')
+    ans.setflags(write=False)
+    with _struct_attr_norms_cache_lock:
+        _struct_attr_norms_cache[key] = (data_mtime, ans)
+        _struct_attr_norms_cache.move_to_end(key)
+        while len(_struct_attr_norms_cache) > STRUCT_ATTR_NORMS_CACHE_SIZE:
+            _struct_attr_norms_cache.popitem(last=False)
+    return ans
 
 
 def texttype_values(corp: Corpus, subcorpattrs: str, maxlistsize: int, shrink_list: Union[Tuple[str, ...], List[str]] = (), collator_locale: Optional[str] = None) -> List[Dict[str, Any]]:
@@ -732,15 +976,67 @@ class MissingSubCorpFreqFile(Exception):
         return self._corpus
 
 
-def frq_db(corp: Corpus, attrname: str, nums: str = 'frq', id_range: int = 0) -> array:
-    import array
+# max. number of memory-mapped frequency files kept open by frq_db() within a process
+FRQ_DB_CACHE_SIZE = 32
+
+# a per-process LRU cache of frequency data used by frq_db():
+# (file path, file mtime) => read-only array
+_frq_db_cache: 'OrderedDict[Tuple[str, float], np.ndarray]' = OrderedDict()
+
+_frq_db_cache_lock = threading.Lock()
+
+
+def _frq_db_cache_get(key: Tuple[str, float]) -> Optional[np.ndarray]:
+    with _frq_db_cache_lock:
+        ans = _frq_db_cache.get(key)
+        if ans is not None:
+            _frq_db_cache.move_to_end(key)
+        return ans
+
+
+def _frq_db_cache_set(key: Tuple[str, float], data: np.ndarray):
+    data.setflags(write=False)
+    with _frq_db_cache_lock:
+        _frq_db_cache[key] = data
+        while len(_frq_db_cache) > FRQ_DB_CACHE_SIZE:
+            _frq_db_cache.popitem(last=False)
+
+
+def _map_frq_file(path: str, dtype: Any, id_range: int) -> np.ndarray:
+    """
+    Memory-map a frequency data file. The mapping is shared via the OS page cache
+    among all the processes reading the same file and it is cached within the current
+    process until the file changes (or it is evicted by newer items).
+
+    raises:
+    IOError (OSError) if the file cannot be opened, EOFError if it contains less than id_range items
+    """
+    key = (path, os.path.getmtime(path))
+    ans = _frq_db_cache_get(key)
+    if ans is None:
+        try:
+            ans = np.memmap(path, dtype=dtype, mode='r')
+        except ValueError as ex:  # empty file
+            raise EOFError(ex)
+        _frq_db_cache_set(key, ans)
+    if len(ans) < id_range:
+        raise EOFError('{0} contains less than {1} items'.format(path, id_range))
+    return ans[:id_range]
+
+
+def frq_db(corp: Corpus, attrname: str, nums: str = 'frq', id_range: int = 0) -> np.ndarray:
+    """
+    Returns a read-only array of precalculated frequencies ('frq', 'arf', 'docf')
+    of all the values of a positional attribute (indexed by value IDs). The data
+    are memory-mapped and cached (see _map_frq_file()) so repeated calls do not copy
+    anything.
+    """
     filename = (subcorp_base_file(corp, attrname) + '.' + nums)
     if not id_range:
         id_range = corp.get_attr(attrname).id_range()
     if nums == 'arf':
-        frq = array.array('f')
         try:
-            frq.fromfile(open(filename, 'rb'), id_range)  # type: ignore
+            frq = _map_frq_file(filename, np.float32, id_range)
         except IOError as ex:
             raise MissingSubCorpFreqFile(corp, ex)
         except EOFError as ex:
@@ -750,8 +1046,7 @@ def frq_db(corp: Corpus, attrname: str, nums: str = 'frq', id_range: int = 0) ->
         try:
             if corp.get_conf('VIRTUAL') and not hasattr(corp, 'spath') and nums == 'frq':
                 raise IOError
-            frq = array.array('i')
-            frq.fromfile(open(filename, 'rb'), id_range)  # type: ignore
+            frq = _map_frq_file(filename, np.int32, id_range)
         except EOFError as ex:
             os.remove(filename.rsplit('.', 1)[0] + '.docf')
             os.remove(filename.rsplit('.', 1)[0] + '.arf')
@@ -759,12 +1054,15 @@ def frq_db(corp: Corpus, attrname: str, nums: str = 'frq', id_range: int = 0) ->
             raise MissingSubCorpFreqFile(corp, ex)
         except IOError:
             try:
-                frq = array.array('l')
-                frq.fromfile(open(filename + '64', 'rb'), id_range)  # type: ignore
-            except IOError as ex:
+                frq = _map_frq_file(filename + '64', np.int64, id_range)
+            except (IOError, EOFError) as ex:
                 if not hasattr(corp, 'spath') and nums == 'frq':
-                    a = corp.get_attr(attrname)
-                    frq.fromlist([a.freq(i) for i in range(a.id_range())])
+                    key = (filename + '64', corp_mtime(corp))
+                    frq = _frq_db_cache_get(key)
+                    if frq is None:
+                        a = corp.get_attr(attrname)
+                        frq = np.array([a.freq(i) for i in range(a.id_range())], dtype=np.int64)
+                        _frq_db_cache_set(key, frq)
                 else:
                     raise MissingSubCorpFreqFile(corp, ex)
     return frq
@@ -775,8 +1073,9 @@ def subc_keywords_onstr(sc: SubCorpus, scref: SubCorpus, attrname: str = 'word',
                         blacklist: Optional[List[str]] = None, include_nonwords: int = 0, wlnums: str = 'frq') -> List[Tuple[float, float, float, int, int, int, int, str]]:
     f = frq_db(sc, attrname, wlnums)
     fref = frq_db(scref, attrname, wlnums)
-    size = sum(f)
-    size_ref = sum(fref)
+    sum_dtype = np.float64 if wlnums == 'arf' else np.int64
+    size = f.sum(dtype=sum_dtype).item()
+    size_ref = fref.sum(dtype=sum_dtype).item()
     p = size_ref / size
     attr = sc.get_attr(attrname)
     attrref = scref.get_attr(attrname)
@@ -797,15 +1096,16 @@ def subc_keywords_onstr(sc: SubCorpus, scref: SubCorpus, attrname: str = 'word',
     while not gen.end():
         i = gen.next()
         w = attr.id2str(i)
-        if f[i] < wlminfreq or (wlwords and w not in wlwords) \
+        f_i = f[i].item()
+        if f_i < wlminfreq or (wlwords and w not in wlwords) \
                 or (blacklist and w in blacklist):
             continue
         iref = attrref.str2id(w)
-        fref_iref = (iref != -1 and fref[iref]) or 0
-        if fref_iref == 0 or p * f[i] / fref[iref] > 1.0:
-            rel = (f[i] * 1000000.0) / size
+        fref_iref = (iref != -1 and fref[iref].item()) or 0
+        if fref_iref == 0 or p * f_i / fref_iref > 1.0:
+            rel = (f_i * 1000000.0) / size
             relref = (fref_iref * 1000000.0) / size_ref
             score = (rel + simple_n) / (relref + simple_n)
-            items.append((score, rel, relref, i, iref, f[i], fref_iref, w))
+            items.append((score, rel, relref, i, iref, f_i, fref_iref, w))
     items.sort(reverse=True)
     return items[:wlmaxitems]
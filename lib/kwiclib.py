@@ -16,10 +16,12 @@
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
 # 02110-1301, USA.
 
-from typing import Any, List, Mapping, Dict, Tuple, Union
+from typing import Any, List, Mapping, Dict, Tuple, Union, Sequence
 
 from collections import defaultdict
 import re
+import json
+import hashlib
 import itertools
 import math
 
@@ -62,6 +64,18 @@ def format_labelmap(labelmap: Mapping[str, str], separator: str = '.') -> LabelM
     return lines
 
 
+def get_sort_crit(q: Sequence[str]) -> str:
+    """
+    Return a criterion of the last sorting operation in a query
+    (or an empty string if there is no such operation).
+    """
+    crit = ''
+    for qq in q:
+        if qq.startswith('s') and not qq.startswith('s*'):
+            crit = qq[1:]
+    return crit
+
+
 def tokens2strclass(tokens):
     """
     Converts internal data structure produced by KwicLine and CorpRegion containing tokens and
@@ -77,6 +91,106 @@ def tokens2strclass(tokens):
             for i in range(0, len(tokens), 2)]
 
 
+class SpeechTokenizer(object):
+    """
+    Splits tokens of KWIC line parts into speech segment fragments and attaches
+    speech playback information ('open_link', 'close_link') to them.
+
+    | left                 | kwic                     | right     |
+    ---------------------------------------------------------------
+    |  <sp>....</sp> <sp>..|..</sp> <sp>..</sp> <sp>..|..</sp>    |
+
+    All the regular expressions are compiled once per instance so the object
+    should be created once per processed set of lines (see Kwic.kwiclines()).
+    Tokens without any speech tag are just copied.
+    """
+
+    def __init__(self, speech_segment, filter_speech_tag):
+        """
+        arguments:
+        speech_segment -- 2-tuple (struct_name, attr_name) or None
+        filter_speech_tag -- if True then whole speech tag is removed else only its 'speech attribute'
+        """
+        self._struct = speech_segment[0] if speech_segment and len(speech_segment) > 0 else None
+        self._has_audio = bool(speech_segment and speech_segment[1])
+        self._filter_speech_tag = filter_speech_tag
+        if self._struct is not None:
+            struct = re.escape(self._struct)
+            self._open_prefix = '<%s' % self._struct
+            self._close_tag = '</%s>' % self._struct
+            self._split_rx = re.compile('(<%s[^>]*>|</%s>)' % (struct, struct))
+            self._open_tag_rx = re.compile('^<%s(>|[^>]+>)$' % struct)
+            self._remove_open_rx = re.compile('<%s[^>]*>' % struct)
+            if self._has_audio:
+                # e.g. "<seg foo=bar speechfile=1234.wav time=1234>" => ("<seg foo=bar time=1234>", "1234.wav")
+                self._speech_attr_rx = re.compile(r'^(<%s\s+.*)%s=([^\s>]+)(\s.+|>)$' % (
+                    struct, re.escape(speech_segment[1])))
+
+    def _contains_tag(self, text):
+        return self._struct is not None and (self._open_prefix in text or self._close_tag in text)
+
+    def _process_part(self, tokens, prev_speech_id):
+        """
+        returns:
+        2-tuple: modified tokens and the last speech id (which is necessary to obtain proper speech ID
+        in case of a partial segment on the 'left' part of a concordance line and similarly in case
+        of a partial segment on the 'right' part of a concordance line)
+        """
+        ans = []
+        last_speech_id = prev_speech_id
+        for item in tokens:
+            if not self._contains_tag(item['str']):
+                if item['str'] != '':
+                    ans.append({'str': item['str'], 'class': item['class']})
+                continue
+            for fragment in self._split_rx.split(item['str']):
+                if fragment == '':
+                    continue
+                if self._has_audio and fragment.startswith(self._open_prefix):
+                    srch = self._speech_attr_rx.search(fragment)
+                    if srch is not None:
+                        fragment = srch.group(1).rstrip() + srch.group(3)
+                        if srch.group(2):
+                            last_speech_id = srch.group(2)
+                new_item = {'str': fragment, 'class': item['class']}
+                if fragment.startswith(self._open_prefix):
+                    new_item['open_link'] = {'speech_path': last_speech_id}
+                elif fragment.endswith(self._close_tag):
+                    new_item['close_link'] = {'speech_path': last_speech_id}
+                ans.append(new_item)
+        return ans, last_speech_id
+
+    def _remove_tags(self, tokens):
+        for item in tokens:
+            if self._contains_tag(item['str']):
+                item['str'] = self._remove_open_rx.sub('', item['str'].replace(self._close_tag, ''))
+
+    def process_line(self, left, kwic, right, leftmost_speech_id=None):
+        """
+        Process all the parts of a concordance line at once. The speech ID
+        is passed from the left part to the KWIC part and then to the right part.
+
+        arguments:
+        left -- list of dicts {'str': '...', 'class': '...'} (see tokens2strclass())
+        kwic -- dtto
+        right -- dtto
+        leftmost_speech_id -- an ID of the speech segment the line starts in
+
+        returns:
+        3-tuple (left, kwic, right) of new lists
+        """
+        left, speech_id = self._process_part(left, leftmost_speech_id)
+        kwic, speech_id = self._process_part(kwic, speech_id)
+        right = self._process_part(right, speech_id)[0]
+        # a speech segment starting right at the end of the line cannot be played
+        if len(right) > 0 and 'open_link' in right[-1] and self._open_tag_rx.search(right[-1]['str']):
+            del right[-1]['open_link']
+        if self._filter_speech_tag:
+            for part in (left, kwic, right):
+                self._remove_tags(part)
+        return left, kwic, right
+
+
 class EmptyKWiclines:
 
     def nextline(self):
@@ -204,6 +318,18 @@ class KwicPageArgs(object):
     def to_dict(self):
         return self.__dict__
 
+    def create_cache_key(self, *extra):
+        """
+        Create a hash identifying a KWIC page produced with these arguments
+        (for a fixed concordance). Any additional values affecting the output
+        (e.g. line groups applied to the concordance) can be passed via 'extra'.
+        """
+        data = [self.speech_attr, self.fromp, self.line_offset, self.pagesize, self.leftctx, self.rightctx,
+                self.attrs, self.ctxattrs, self.refs, self.structs, self.labelmap, self.righttoleft,
+                [c.get_conffile() for c in self.alignlist], self.hidenone, self.attr_vmode,
+                getattr(self, 'base_attr', None), extra]
+        return hashlib.md5(json.dumps(data, sort_keys=True).encode('utf-8')).hexdigest()
+
     def calc_fromline(self):
         return (self.fromp - 1) * self.pagesize + self.line_offset
 
@@ -238,12 +364,15 @@ class Kwic(object):
     corpus -- a manatee.Corpus instance
     corpus_fullname -- full (internal) name of the corpus (e.g. with path prefix if used)
     conc -- a manatee.Concordance instance
+    calc_status -- a stored calculation status of the concordance (CalcStatus); if provided
+                   then result ARF is taken from there instead of calculating it
     """
 
-    def __init__(self, corpus, corpus_fullname, conc):
+    def __init__(self, corpus, corpus_fullname, conc, calc_status=None):
         self.corpus = corpus
         self.corpus_fullname = corpus_fullname
         self.conc = conc
+        self.calc_status = calc_status
 
     def kwicpage(self, args):
         """
@@ -288,34 +417,89 @@ class Kwic(object):
         else:
             pagination.last_page = 1
 
-        out.concsize = self.conc.size()
+        for k, v in self.get_result_stats().items():
+            setattr(out, k, v)
+        if args.hidenone:
+            self._hide_none(out.Lines)
+        out.pagination = pagination.export()
+        return dict(out)
 
-        if is_subcorpus(self.corpus):
-            out.result_arf = ''
-        else:
-            out.result_arf = round(self.conc.compute_ARF(), 2)
+    def get_result_stats(self):
+        """
+        Returns basic concordance result information (size, ARF, i.p.m.). In case
+        a calculation status is available, ARF is never calculated here (i.e. it
+        can be None if the value has not been stored yet).
 
+        returns:
+        a dict(concsize=..., result_arf=..., result_relative_freq=...)
+        """
         if is_subcorpus(self.corpus):
+            result_arf = ''
             corpsize = self.corpus.search_size(
             )  # TODO this is unverified solution trying to bypass possible manatee bug
         else:
+            if self.calc_status is not None:
+                result_arf = self.calc_status.arf if self.calc_status.has_arf() else None
+            else:
+                result_arf = round(self.conc.compute_ARF(), 2)
             corpsize = self.corpus.size()
-        out.result_relative_freq = round(
-            self.conc.size() / (float(corpsize) / 1e6), 2)
-        if args.hidenone:
-            for line, part in itertools.product(out.Lines, ('Kwic', 'Left', 'Right')):
-                for item in line[part]:
-                    item['str'] = item['str'].replace('===NONE===', '')
-        out.pagination = pagination.export()
-        return dict(out)
+        return dict(concsize=self.conc.size(), result_arf=result_arf,
+                    result_relative_freq=round(self.conc.size() / (float(corpsize) / 1e6), 2))
+
+    @staticmethod
+    def _hide_none(lines):
+        for line, part in itertools.product(lines, ('Kwic', 'Left', 'Right')):
+            for item in line[part]:
+                item['str'] = item['str'].replace('===NONE===', '')
+
+    def kwiclines_chunks(self, args, chunk_size):
+        """
+        Generates KWIC lines (including lines of aligned corpora) of a range specified
+        by args (see KwicPageArgs.calc_fromline(), KwicPageArgs.calc_toline()) in chunks
+        of max. chunk_size lines. Unlike kwicpage(), only the lines are produced and
+        there is always just a single chunk kept in memory.
 
-    def add_aligns(self, result, args):
+        arguments:
+            args -- a KwicPageArgs instance
+            chunk_size -- max. number of lines per chunk
+
+        returns:
+        a generator of KwicPageData instances (only Lines, KWICCorps and CorporaColumns are set)
+        """
+        args.refs = getattr(args, 'refs', '').replace('.MAP_OUP', '')
+        fromline = args.calc_fromline()
+        toline = args.calc_toline()
+        # aligned corpora added by the first add_aligns() call must be handled the same way in all chunks
+        corps_with_colls = None
+        if args.alignlist:
+            aligned = manatee.StrVector()
+            self.conc.get_aligned(aligned)
+            corps_with_colls = [c for c in aligned]
+        for chunk_start in range(fromline, toline, chunk_size):
+            chunk_end = min(chunk_start + chunk_size, toline)
+            if args.alignlist and chunk_start > fromline:
+                # add_aligns() leaves the concordance switched to the last aligned corpus
+                self.conc.switch_aligned(self.conc.orig_corp.get_conffile())
+            out = KwicPageData()
+            out.Lines = self.kwiclines(args.create_kwicline_args(fromline=chunk_start, toline=chunk_end))
+            self.add_aligns(out, args.create_kwicline_args(speech_segment=None, fromline=chunk_start,
+                                                          toline=chunk_end), corps_with_colls)
+            if len(out.CorporaColumns) == 0:
+                out.CorporaColumns = [dict(n=self.corpus.corpname, label=self.corpus.get_conf('NAME'))]
+                out.KWICCorps = [self.corpus.corpname]
+            if args.hidenone:
+                self._hide_none(out.Lines)
+            yield out
+
+    def add_aligns(self, result, args, corps_with_colls=None):
         """
         Adds lines from aligned corpora. Method modifies passed KwicPageData instance by setting
         respective attributes.
 
         arguments:
         result -- KwicPageData type is required
+        corps_with_colls -- corpora aligned with the concordance before any call of the method
+                            (if None then the current state of the concordance is used)
         """
         def create_empty_cell():
             return {'rightsize': 0, 'hitlen': ';hitlen=9', 'Right': [], 'Kwic': [], 'linegroup': '_', 'leftsize': 0,
@@ -328,9 +512,12 @@ class Kwic(object):
         if not args.alignlist:
             return
         al_lines = []
-        corps_with_colls = manatee.StrVector()
-        self.conc.get_aligned(corps_with_colls)
-        result.KWICCorps = [c for c in corps_with_colls]
+        aligned = manatee.StrVector()
+        self.conc.get_aligned(aligned)
+        aligned = [c for c in aligned]
+        if corps_with_colls is None:
+            corps_with_colls = aligned
+        result.KWICCorps = list(corps_with_colls)
         if self.corpus.corpname not in result.KWICCorps:
             result.KWICCorps = [self.corpus.corpname] + result.KWICCorps
         result.CorporaColumns = [dict(n=c.get_conffile(), label=c.get_conf('NAME') or c.get_conffile())
@@ -341,9 +528,10 @@ class Kwic(object):
                 self.conc.switch_aligned(al_corp.get_conffile())
                 al_lines.append(self.kwiclines(args))
             else:
-                self.conc.switch_aligned(self.conc.orig_corp.get_conffile())
-                self.conc.add_aligned(al_corp.get_conffile())
-                self.conc.switch_aligned(al_corp.get_conffile())
+                if al_corpname not in aligned:
+                    self.conc.switch_aligned(self.conc.orig_corp.get_conffile())
+                    self.conc.add_aligned(al_corpname)
+                self.conc.switch_aligned(al_corpname)
                 al_lines.append(
                     self.kwiclines(args.copy(leftctx='0', rightctx='0', attrs='word', ctxattrs=''))
                 )
@@ -355,47 +543,6 @@ class Kwic(object):
         for i, line in enumerate(result.Lines):
             line['Align'] = aligns[i]
 
-    def separate_speech_struct_from_tag(self, speech_segment, text):
-        """
-        Removes structural attribute related to speech file identification.
-        E.g. getting input "<seg foo=bar speechfile=1234.wav time=1234>lorem ipsum</seg>" and
-        having configuration directive "speech_segment == seg.speechfile" the function
-        returns "<seg foo=bar time=1234>lorem ipsum</seg>"
-
-        arguments:
-        speech_segment -- 2-tuple (struct_name, attr_name)
-        text -- a string to be processed
-
-        returns:
-        2-tuple (modified string, structural attribute value)
-        """
-        import re
-
-        if self.speech_segment_has_audio(speech_segment):
-            pattern = r"^(<%s\s+.*)%s=([^\s>]+)(\s.+|>)$" % tuple(speech_segment)
-            srch = re.search(pattern, text)
-            if srch is not None:
-                return srch.group(1).rstrip() + srch.group(3), srch.group(2)
-        return text, ''
-
-    @staticmethod
-    def remove_tag_from_line(line, tag_name):
-        """
-        arguments:
-        line -- list of dicts containing at least the key 'str'
-          line as used in postproc_kwicline
-        tag_name -- str
-
-        returns:
-        the same object as the 'line' parameter
-        """
-        import re
-
-        for item in line:
-            item['str'] = re.sub('<%s[^>]*>' % tag_name, '', re.sub(
-                '</%s>' % tag_name, '', item['str']))
-        return line
-
     @staticmethod
     def line_parts_contain_speech(line_left, line_right):
         """
@@ -406,61 +553,6 @@ class Kwic(object):
                 return True
         return False
 
-    def update_speech_boundaries(self, speech_segment, line, column, filter_speech_tag, prev_speech_id=None):
-        """
-        arguments:
-        speech_attr -- 2-tuple (struct_name, attr_name)
-        line -- list of dicts {'str': '...', 'class': '...'}
-        column -- str, one of {'left', 'kwic', 'right'}; specifies position according to KWIC
-        filter_speech_tag -- if True then whole speech tag is removed else only its 'speech attribute'
-        prev_speech_id -- str identifier of the previously processed speech segment
-
-        | left                 | kwic                     | right     |
-        ---------------------------------------------------------------
-        |  <sp>....</sp> <sp>..|..</sp> <sp>..</sp> <sp>..|..</sp>    |
-
-        Returns:
-        2-tuple: modified line and the last speech id (which is necessary to obtain proper speech ID in case of partial
-        segment on the "left" part of a concordance line and similarly in case of a partial segment on the "right"
-        part of a concordance line).
-
-        """
-        newline = []
-        speech_struct_str = speech_segment[0] if speech_segment and len(
-            speech_segment) > 0 else None
-        fragment_separator = '<%s' % speech_struct_str
-        last_fragment = None
-        last_speech_id = prev_speech_id
-
-        for item in line:
-            fragments = [x for x in re.split('(<%s[^>]*>|</%s>)' % (speech_struct_str, speech_struct_str), item['str'])
-                         if x != '']
-            for fragment in fragments:
-                frag_ext, speech_id = self.separate_speech_struct_from_tag(speech_segment, fragment)
-                if not speech_id:
-                    speech_id = last_speech_id
-                else:
-                    last_speech_id = speech_id
-                newline_item = {
-                    'str': frag_ext,
-                    'class': item['class']
-                }
-                if frag_ext.startswith(fragment_separator):
-                    newline_item['open_link'] = {'speech_path': speech_id}
-                elif frag_ext.endswith('</%s>' % speech_struct_str):
-                    newline_item['close_link'] = {'speech_path': speech_id}
-                newline.append(newline_item)
-                last_fragment = newline_item
-        # we have to treat specific situations related to the end of the
-        # concordance line
-        if (last_fragment is not None and
-                re.search('^<%s(>|[^>]+>)$' % speech_struct_str, last_fragment['str']) and
-                column == 'right'):
-            del(last_fragment['open_link'])
-        if filter_speech_tag:
-            self.remove_tag_from_line(newline, speech_struct_str)
-        return newline, last_speech_id
-
     @staticmethod
     def non1hitlen(hitlen):
         return '' if hitlen == 1 else '%i' % hitlen
@@ -548,6 +640,7 @@ class Kwic(object):
         maxrightsize = 0
         filter_out_speech_tag = args.speech_segment and args.speech_segment[0] not in args.structs \
             and speech_struct_attr_name in all_structs
+        speech_tokenizer = SpeechTokenizer(args.speech_segment, filter_out_speech_tag)
 
         i = args.fromline
         while kl.nextline():
@@ -558,19 +651,9 @@ class Kwic(object):
                 leftmost_speech_id = speech_struct_attr.pos2str(kl.get_ctxbeg())
             else:
                 leftmost_speech_id = None
-            leftwords, last_left_speech_id = self.update_speech_boundaries(args.speech_segment,
-                                                                           tokens2strclass(
-                                                                               kl.get_left()),
-                                                                           'left', filter_out_speech_tag,
-                                                                           leftmost_speech_id)
-            kwicwords, last_left_speech_id = self.update_speech_boundaries(args.speech_segment,
-                                                                           tokens2strclass(
-                                                                               kl.get_kwic()),
-                                                                           'kwic',
-                                                                           filter_out_speech_tag,
-                                                                           last_left_speech_id)
-            rightwords = self.update_speech_boundaries(args.speech_segment, tokens2strclass(kl.get_right()), 'right',
-                                                       filter_out_speech_tag, last_left_speech_id)[0]
+            leftwords, kwicwords, rightwords = speech_tokenizer.process_line(
+                tokens2strclass(kl.get_left()), tokens2strclass(kl.get_kwic()),
+                tokens2strclass(kl.get_right()), leftmost_speech_id)
 
             if args.attr_vmode == 'mouseover' or args.attr_vmode == 'multiline':
                 postproc_tokens = leftwords + kwicwords + rightwords
@@ -634,36 +717,15 @@ class Kwic(object):
         a list of dicts with following structure (example):
             [{'page': 1, 'label': u'a'}, {'page': 1, 'label': u'A'}, {'page': 2, 'label': u'b'},...]
         """
-        crit = ''
-        for qq in q:
-            if qq.startswith('s') and not qq.startswith('s*'):
-                crit = qq[1:]
+        crit = get_sort_crit(q)
         if not crit:
             return []
-        vals = manatee.StrVector()
-        idx = manatee.IntVector()
-        if '.' in crit.split('/')[0]:
-            just_letters = False
-        else:
-            just_letters = True
-        self.conc.sort_idx(crit, vals, idx, just_letters)
-        out = [(v, pos / pagesize + 1) for v, pos in zip(vals, idx)]
-        if just_letters:
-            result = []
-            keys = []
-            for v, p in out:
-                if not v[0] in keys:
-                    result.append((v[0], p))
-                    keys.append(v[0])
-            out = result
+        return self.sort_idx_pages(self.conc.get_sort_idx_items(crit), pagesize)
 
-        ans = []
-        for v, p in out:
-            try:
-                ans.append({'page': p, 'label': v})
-            except UnicodeDecodeError:
-                # Without manatee.set_encoding, manatee appears to produce
-                # few extra undecodable items. Ignoring them produces
-                # the same result as in case of official Bonito app.
-                pass
-        return ans
+    @staticmethod
+    def sort_idx_pages(items, pagesize):
+        """
+        Transform (label, line index) pairs (see PyConc.get_sort_idx_items()) into
+        page shortcuts (see get_sort_idx()).
+        """
+        return [{'page': pos // pagesize + 1, 'label': v} for v, pos in items]
@@ -27,6 +27,7 @@ the instance of AbstractConcCache is request-dependent.
 import abc
 from typing import Dict, Any, List, Optional, Union, Tuple
 from manatee import Corpus
+from plugins.abstract.general_storage import Subscription
 
 import os
 import time
@@ -43,8 +44,9 @@ class CalcStatus(object):
 
     def __init__(self, task_id: Optional[str] = None, pid: Optional[int] = None, created: Optional[int] = None,
                  last_upd: Optional[int] = None, concsize: Optional[int] = 0, fullsize: Optional[int] = 0,
-                 relconcsize: Optional[int] = 0, arf: Optional[float] = 0,
-                 error: Union[str, BaseException, None] = None, finished: Optional[bool] = False) -> None:
+                 relconcsize: Optional[int] = 0, arf: Optional[float] = None,
+                 error: Union[str, BaseException, None] = None, finished: Optional[bool] = False,
+                 arf_task_id: Optional[str] = None) -> None:
         self.task_id: Optional[str] = task_id
         self.pid = pid if pid else os.getpid()
         self.created = created if created else int(time.time())
@@ -55,6 +57,8 @@ class CalcStatus(object):
         self.arf = arf
         self.error: str = str(error) if isinstance(error, BaseException) else error
         self.finished = finished
+        # an ID of a running background ARF calculation (see conclib.search.get_stored_calc_status)
+        self.arf_task_id: Optional[str] = arf_task_id
 
     def to_dict(self) -> Dict[str, Any]:
         return dict(self.__dict__)
@@ -68,6 +72,14 @@ class CalcStatus(object):
                                        f', limit: {time_limit})')
         return None
 
+    def has_arf(self) -> bool:
+        """
+        Test whether the status contains a valid result ARF. Entries written by older
+        versions of KonText store 0 instead of a missing value so a zero ARF counts
+        as valid only for an empty concordance.
+        """
+        return self.arf is not None and (self.arf > 0 or not self.concsize)
+
     def has_some_result(self, minsize: int) -> bool:
         return minsize == -1 and self.finished or self.concsize >= minsize
 
@@ -82,10 +94,14 @@ class CalcStatus(object):
         return self
 
 
+# (stored concordance size, calculation status, cache file path)
+ConcCacheEntry = Tuple[int, CalcStatus, str]
+
+
 class AbstractConcCache(abc.ABC):
 
     @abc.abstractmethod
-    def get_stored_size(self, subchash: str, q: QueryType) -> Union[int, None]:
+    def get_stored_size(self, subchash: Optional[str], q: QueryType) -> Union[int, None]:
         """
         Return stored concordance size.
         The method should return None if no record is found at all.
@@ -97,9 +113,32 @@ class AbstractConcCache(abc.ABC):
         """
 
     @abc.abstractmethod
-    def get_calc_status(self, subchash: str, query: QueryType) -> CalcStatus:
+    def get_calc_status(self, subchash: Optional[str], query: QueryType) -> Optional[CalcStatus]:
         pass
 
+    def get_entries(self, subchash: Optional[str], queries: List[QueryType]) -> List[Optional[ConcCacheEntry]]:
+        """
+        Return cache entries for multiple queries at once (typically for all
+        the prefixes of a query chain). Entries are returned in the order of
+        the passed queries, missing entries are represented by None.
+
+        Implementations should override this with a bulk operation (the default
+        one just calls single-entry methods repeatedly).
+
+        arguments:
+        subchash -- a md5 hash generated from subcorpus identifier by
+                    CorpusManager.get_Corpus()
+        queries -- a list of queries (i.e. a list of lists of query elements)
+        """
+        ans: List[Optional[ConcCacheEntry]] = []
+        for q in queries:
+            status = self.get_calc_status(subchash, q)
+            size = self.get_stored_size(subchash, q) if status is not None else None
+            path = self.cache_file_path(subchash, q) if size is not None else None
+            ans.append((size, status, path) if status is not None and size is not None and path is not None
+                       else None)
+        return ans
+
     @abc.abstractmethod
     def refresh_map(self):
         """
@@ -115,7 +154,7 @@ class AbstractConcCache(abc.ABC):
         """
 
     @abc.abstractmethod
-    def cache_file_path(self, subchash: str, q: QueryType) -> Optional[str]:
+    def cache_file_path(self, subchash: Optional[str], q: QueryType) -> Optional[str]:
         """
         Return a path to a cache file matching provided subcorpus hash and query
         elements. If there is no entry matching (subchash, q) then None must be
@@ -127,7 +166,8 @@ class AbstractConcCache(abc.ABC):
         """
 
     @abc.abstractmethod
-    def add_to_map(self, subchash: Optional[str], query: QueryType, size: int, calc_status: CalcStatus = None) -> Tuple[str, CalcStatus]:
+    def add_to_map(self, subchash: Optional[str], query: QueryType, size: int,
+                   calc_status: Optional[CalcStatus] = None) -> Tuple[str, Optional[CalcStatus]]:
         """
         Add or update a cache map entry
 
@@ -173,8 +213,63 @@ class AbstractConcCache(abc.ABC):
 
     @abc.abstractmethod
     def update_calc_status(self, subchash: Optional[str], query: Tuple[str, ...], **kw):
+        """
+        Update calculation status of an existing entry. Implementations supporting
+        watch_calc_status() should notify all the watching parties here.
+        """
+
+    def get_kwic_page(self, subchash: Optional[str], q: QueryType, page_key: str) -> Optional[Dict[str, Any]]:
+        """
+        Return cached data of a KWIC page (see kwiclib.Kwic.kwicpage()) of a concordance
+        specified by subchash and q. The page_key identifies page arguments
+        (see kwiclib.KwicPageArgs.create_cache_key()). If there is no such page
+        stored, None must be returned.
+
+        Cached pages must be invalidated along with their concordance entry
+        (del_entry(), del_full_entry() and any cleanup procedures).
+
+        The default implementation does not cache KWIC pages at all.
+        """
+        return None
+
+    def store_kwic_page(self, subchash: Optional[str], q: QueryType, page_key: str, data: Dict[str, Any]):
+        """
+        Store data of a KWIC page. Please note that only pages of finished concordances
+        should be stored. See get_kwic_page().
+        """
         pass
 
+    def get_sort_idx(self, subchash: Optional[str], q: QueryType, crit: str) -> Optional[List[Tuple[str, int]]]:
+        """
+        Return a cached sort index (see conclib.pyconc.PyConc.get_sort_idx_items()) of
+        a concordance specified by subchash and q sorted by crit. If there is no such
+        index stored, None must be returned.
+
+        Cached indices must be invalidated along with their concordance entry
+        (just like KWIC pages - see get_kwic_page()).
+
+        The default implementation does not cache sort indices at all.
+        """
+        return None
+
+    def store_sort_idx(self, subchash: Optional[str], q: QueryType, crit: str, items: List[Tuple[str, int]]):
+        """
+        Store a sort index of a concordance. See get_sort_idx().
+        """
+        pass
+
+    def watch_calc_status(self, subchash: Optional[str], query: Tuple[str, ...]) -> Subscription:
+        """
+        Return a subscription allowing a caller to block until the calculation
+        status of a specified entry changes (see update_calc_status). To prevent
+        lost notifications, a caller should obtain the subscription first and
+        only then read the current status.
+
+        The default implementation provides no notifications at all
+        (i.e. a caller falls back to polling).
+        """
+        return Subscription()
+
 
 class AbstractCacheMappingFactory(abc.ABC):
     """
@@ -17,11 +17,52 @@
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
 
 import abc
-from typing import Union, List, Dict
+import time
+from contextlib import contextmanager
+from typing import Union, List, Dict, Iterator
 
 Serializable = Union[int, float, str, bool, list, dict, None]
 
 
+class Subscription(object):
+    """
+    A subscription to a notification channel (see KeyValueStorage.subscribe()).
+
+    This default implementation is used by storages without any notification
+    support. It is not able to receive anything so the wait() method just
+    sleeps for a gradually increasing period of time (i.e. the waiting party
+    falls back to polling).
+    """
+
+    def __init__(self):
+        self._num_waits = 0
+
+    def wait(self, timeout: float) -> bool:
+        """
+        Block until a message is published to the subscribed channel
+        or until the timeout (in seconds) elapses.
+
+        returns:
+        True if a message has been (or may have been) received, False in case
+        of a timeout
+        """
+        self._num_waits += 1
+        time.sleep(min(timeout, self._num_waits * 0.1))
+        return False
+
+    def close(self):
+        """
+        Unsubscribe from the channel and release all the related resources
+        """
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
 class KeyValueStorage(abc.ABC):
     """
     A general key-value storage is a core data storage for KonText and its default
@@ -118,6 +159,21 @@ class KeyValueStorage(abc.ABC):
         field -- hash table entry key
         """
 
+    def hash_get_multi(self, key: str, fields: List[str]) -> List[Serializable]:
+        """
+        Get values of multiple fields from a hash table stored under the passed key.
+        Values are returned in the order of the passed fields, missing fields are
+        represented by None.
+
+        Implementations should override this with a single round-trip
+        operation (the default one just calls hash_get() repeatedly).
+
+        arguments:
+        key -- data access key
+        fields -- a list of hash table entry keys
+        """
+        return [self.hash_get(key, field) for field in fields]
+
     @abc.abstractmethod
     def hash_set(self, key: str, field: str, value: Serializable):
         """
@@ -221,6 +277,43 @@ class KeyValueStorage(abc.ABC):
         key -- data access key
         """
 
+    @contextmanager
+    def batch(self) -> Iterator['KeyValueStorage']:
+        """
+        Return a context manager grouping all the write operations performed
+        by the current thread within the block so the storage can apply them
+        at once (e.g. in a single transaction). Blocks can be nested.
+        The default implementation applies each operation immediately.
+        """
+        yield self
+
+    def publish(self, channel: str, message: Serializable):
+        """
+        Send a message to all the parties subscribed to a channel.
+        The default implementation does nothing (subscribers fall back
+        to polling - see Subscription).
+
+        arguments:
+        channel -- a channel name
+        message -- a value to be sent
+        """
+        pass
+
+    def subscribe(self, channel: str) -> Subscription:
+        """
+        Subscribe to a notification channel. Please note that messages
+        published before the subscription is created are not guaranteed
+        to be received so a typical waiting party should subscribe first
+        and only then check for the state it is waiting for.
+
+        arguments:
+        channel -- a channel name
+
+        returns:
+        a Subscription instance (usable also as a context manager)
+        """
+        return Subscription()
+
     def get_instance(self, plugin_id):
         """
         Return the current instance of the plug-in
@@ -34,28 +34,15 @@ def import_user_redis(data):
 
 
 def import_user_sqlite3(data):
-    import sqlite3
-    db = sqlite3.connect(db_conf['default:db_path'])
-    cursor = db.cursor()
-    cursor.execute('BEGIN')
+    from plugins.sqlite3_db import DefaultDb
+    db = DefaultDb(db_conf)
     data['pwd_hash'] = mk_pwd_hash_default(data['pwd']) if data['pwd'] else None
     del data['pwd']
-    cursor.execute('INSERT INTO data (key, value, expires) VALUES (?, ?, -1)', ('corplist:user:{0}'.format(data['id']),
-                                                                                json.dumps(data.get('permitted_corpora', []))))
+    db.set('corplist:user:{0}'.format(data['id']), data.get('permitted_corpora', []))
     del data['permitted_corpora']
-    cursor.execute('INSERT INTO data (key, value, expires) VALUES (?, ?, -1)', ('user:{0}'.format(data['id']),
-                                                                                json.dumps(data)))
-    cursor.execute('SELECT value FROM data WHERE key = ?', ('user_index',))
-    tmp = cursor.fetchone()
-    if not tmp:
-        uindex = {}
-    else:
-        uindex = json.loads(tmp[0])
-    uindex[data['username']] = 'user:{0}'.format(data['id'])
-
-    cursor.execute('INSERT OR REPLACE INTO data (key, value, expires) VALUES (?, ?, -1)',
-                   ('user_index', json.dumps(uindex)))
-    cursor.execute('COMMIT')
+    db.set('user:{0}'.format(data['id']), data)
+    # (hash_set converts a possible legacy user_index record stored as a whole)
+    db.hash_set('user_index', data['username'], 'user:{0}'.format(data['id']))
     print(('Installed user {}'.format(data['username'])))
 
 
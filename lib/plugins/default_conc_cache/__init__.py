@@ -33,13 +33,13 @@ element conc_cache {
 """
 import os
 import hashlib
-from typing import Union, Tuple, Optional
+from typing import Union, Tuple, Optional, List, Dict, Any
 import manatee
 
 import plugins
-from plugins.abstract.conc_cache import AbstractConcCache, AbstractCacheMappingFactory, CalcStatus
+from plugins.abstract.conc_cache import AbstractConcCache, AbstractCacheMappingFactory, CalcStatus, ConcCacheEntry
 from plugins import inject
-from plugins.abstract.general_storage import KeyValueStorage
+from plugins.abstract.general_storage import KeyValueStorage, Subscription
 
 CachedConcInfo = Tuple[int, CalcStatus, str]
 
@@ -67,23 +67,50 @@ class DefaultCacheMapping(AbstractConcCache):
 
     Mapping looks like this:
     md5(subchash, q) => [stored_conc_size, calc_status, hash_of(subchash, q[0])]
+
+    To be able to remove all the entries derived from a single base query
+    without scanning the whole mapping, there is also a secondary index
+    (one hash per base query):
+    hash_of(subchash, q[0]) => {md5(subchash, q): True, ...}
+
+    Entries created by older versions of the plug-in are not indexed. Until the cleanup
+    task adds them to the index (and marks the corpus via Q0_INDEX_READY_KEY_TEMPLATE),
+    del_full_entry() searches the whole mapping.
+
+    Already rendered KWIC pages and sort indices of finished concordances are stored
+    along with the entries (and removed together with them):
+    md5(subchash, q) => {page_key: page_data, ..., 'sort_idx:' + crit: [[label, line], ...], ...}
     """
 
     KEY_TEMPLATE = 'conc_cache:%s'
 
+    Q0_INDEX_KEY_TEMPLATE = 'conc_cache_q0:%s:%s'
+
+    Q0_INDEX_READY_KEY_TEMPLATE = 'conc_cache_q0_ready:%s'
+
+    STATUS_CHANNEL_TEMPLATE = 'conc_cache_status:%s:%s'
+
+    KWIC_PAGES_KEY_TEMPLATE = 'conc_cache_kwic:%s:%s'
+
+    # just a safety limit in case a cleanup procedure leaves some pages behind
+    KWIC_PAGES_TTL = 3600 * 24
+
     def __init__(self, cache_dir: str, corpus: manatee.Corpus, db: KeyValueStorage):
         self._cache_root_dir = cache_dir
         self._corpus = corpus
         self._db = db
 
-    def _get_entry(self, subchash, q) -> Union[CachedConcInfo, None]:
-        val = self._db.hash_get(self._mk_key(), _uniqname(subchash, q))
+    @staticmethod
+    def _decode_entry(val) -> Union[CachedConcInfo, None]:
         if val:
             if type(val[1]) is not dict:
                 return None
             return val[0], CalcStatus(**val[1]), val[2]
         return None
 
+    def _get_entry(self, subchash, q) -> Union[CachedConcInfo, None]:
+        return self._decode_entry(self._db.hash_get(self._mk_key(), _uniqname(subchash, q)))
+
     def _set_entry(self, subchash, q, data: CachedConcInfo):
         tmp = [data[0], data[1].to_dict(), data[2]]
         self._db.hash_set(self._mk_key(), _uniqname(subchash, q), tmp)
@@ -91,6 +118,18 @@ class DefaultCacheMapping(AbstractConcCache):
     def _mk_key(self) -> str:
         return DefaultCacheMapping.KEY_TEMPLATE % self._corpus.corpname
 
+    def _mk_q0_index_key(self, q0hash: str) -> str:
+        return DefaultCacheMapping.Q0_INDEX_KEY_TEMPLATE % (self._corpus.corpname, q0hash)
+
+    def _mk_q0_index_ready_key(self) -> str:
+        return DefaultCacheMapping.Q0_INDEX_READY_KEY_TEMPLATE % self._corpus.corpname
+
+    def _mk_kwic_pages_key(self, entry_key: str) -> str:
+        return DefaultCacheMapping.KWIC_PAGES_KEY_TEMPLATE % (self._corpus.corpname, entry_key)
+
+    def _mk_status_channel(self, subchash: Optional[str], q: Tuple[str, ...]) -> str:
+        return DefaultCacheMapping.STATUS_CHANNEL_TEMPLATE % (self._corpus.corpname, _uniqname(subchash, q))
+
     def get_stored_calc_status(self, subchash: Optional[str], q: Tuple[str, ...]) -> Union[CalcStatus, None]:
         val = self._get_entry(subchash, q)
         return val[1] if val else None
@@ -99,6 +138,14 @@ class DefaultCacheMapping(AbstractConcCache):
         val = self._get_entry(subchash, q)
         return val[0] if val else None
 
+    def get_entries(self, subchash: Optional[str], queries: List[Tuple[str, ...]]) -> List[Optional[ConcCacheEntry]]:
+        ans = []
+        stored = self._db.hash_get_multi(self._mk_key(), [_uniqname(subchash, q) for q in queries])
+        for q, val in zip(queries, stored):
+            entry = self._decode_entry(val)
+            ans.append((entry[0], entry[1], self._create_cache_file_path(subchash, q)) if entry else None)
+        return ans
+
     def refresh_map(self):
         """
         TODO change the name to something meaningful
@@ -119,7 +166,8 @@ class DefaultCacheMapping(AbstractConcCache):
             return self._create_cache_file_path(subchash, q)
         return None
 
-    def add_to_map(self, subchash: Optional[str], query: Tuple[str, ...], size: int, calc_status: CalcStatus = None) -> Tuple[str, CalcStatus]:
+    def add_to_map(self, subchash: Optional[str], query: Tuple[str, ...], size: int,
+                   calc_status: Optional[CalcStatus] = None) -> Tuple[str, Optional[CalcStatus]]:
         """
         TODO: the current implementation has serious issues
         regarding hidden arguments and cache status relationships
@@ -132,8 +180,14 @@ class DefaultCacheMapping(AbstractConcCache):
             if storedsize < size:
                 self._set_entry(subchash, query, (size, stored_calc_status, q0hash))
         else:
+            if calc_status is None:
+                raise ValueError('calc_status must be provided for a new cache entry')
             stored_calc_status = None
-            self._set_entry(subchash, query, (size, calc_status, _uniqname(subchash, query[:1])))
+            q0hash = _uniqname(subchash, query[:1])
+            self._set_entry(subchash, query, (size, calc_status, q0hash))
+            self._db.hash_set(self._mk_q0_index_key(q0hash), _uniqname(subchash, query), True)
+            # pages possibly left by a previous (removed) entry must not be used
+            self._db.remove(self._mk_kwic_pages_key(_uniqname(subchash, query)))
         return self._create_cache_file_path(subchash, query), stored_calc_status
 
     def get_calc_status(self, subchash: Optional[str], query: Tuple[str, ...]) -> Union[CalcStatus, None]:
@@ -148,15 +202,50 @@ class DefaultCacheMapping(AbstractConcCache):
             storedsize, stored_calc_status, q0hash = stored_data
             stored_calc_status.update(**kw)
             self._set_entry(subchash, query, (storedsize, stored_calc_status, q0hash))
+            self._db.publish(self._mk_status_channel(subchash, query), stored_calc_status.finished)
+
+    def watch_calc_status(self, subchash: Optional[str], query: Tuple[str, ...]) -> Subscription:
+        return self._db.subscribe(self._mk_status_channel(subchash, query))
+
+    def get_kwic_page(self, subchash: Optional[str], q: Tuple[str, ...], page_key: str) -> Optional[Dict[str, Any]]:
+        ans = self._db.hash_get(self._mk_kwic_pages_key(_uniqname(subchash, q)), page_key)
+        return ans if isinstance(ans, dict) and ans else None  # some DB plug-ins return {} for a missing hash
+
+    def store_kwic_page(self, subchash: Optional[str], q: Tuple[str, ...], page_key: str, data: Dict[str, Any]):
+        key = self._mk_kwic_pages_key(_uniqname(subchash, q))
+        self._db.hash_set(key, page_key, data)
+        self._db.set_ttl(key, DefaultCacheMapping.KWIC_PAGES_TTL)
+
+    def get_sort_idx(self, subchash: Optional[str], q: Tuple[str, ...], crit: str) -> Optional[List[Tuple[str, int]]]:
+        ans = self._db.hash_get(self._mk_kwic_pages_key(_uniqname(subchash, q)), 'sort_idx:' + crit)
+        return [(item[0], item[1]) for item in ans] if isinstance(ans, list) else None
+
+    def store_sort_idx(self, subchash: Optional[str], q: Tuple[str, ...], crit: str, items: List[Tuple[str, int]]):
+        key = self._mk_kwic_pages_key(_uniqname(subchash, q))
+        self._db.hash_set(key, 'sort_idx:' + crit, items)
+        self._db.set_ttl(key, DefaultCacheMapping.KWIC_PAGES_TTL)
 
     def del_entry(self, subchash: Optional[str], q: Tuple[str, ...]):
-        self._db.hash_del(self._mk_key(), _uniqname(subchash, q))
+        entry_key = _uniqname(subchash, q)
+        self._db.hash_del(self._mk_key(), entry_key)
+        self._db.hash_del(self._mk_q0_index_key(_uniqname(subchash, q[:1])), entry_key)
+        self._db.remove(self._mk_kwic_pages_key(entry_key))
 
     def del_full_entry(self, subchash: Optional[str], q: Tuple[str, ...]):
-        for k, stored in list(self._db.hash_get_all(self._mk_key()).items()):
-            if _uniqname(subchash, q[:1]) == stored[2]:  # stored[2] = q0hash
-                # original record's key must be used (k ~ entry_key match can be partial)
-                self._db.hash_del(self._mk_key(), k)  # must use direct access here (no del_entry())
+        q0hash = _uniqname(subchash, q[:1])
+        index_key = self._mk_q0_index_key(q0hash)
+        if self._db.exists(self._mk_q0_index_ready_key()):
+            entry_keys = set(self._db.hash_get_all(index_key).keys())
+        else:
+            # some entries may not be indexed yet (see cleanup.py)
+            entry_keys = set(k for k, stored in self._db.hash_get_all(self._mk_key()).items()
+                             if type(stored) is list and len(stored) > 2 and stored[2] == q0hash)
+        entry_keys.add(_uniqname(subchash, q))
+        entry_keys.add(q0hash)
+        for k in entry_keys:
+            self._db.hash_del(self._mk_key(), k)  # must use direct access here (no del_entry())
+            self._db.remove(self._mk_kwic_pages_key(k))
+        self._db.remove(index_key)
 
 
 class CacheMappingFactory(AbstractCacheMappingFactory):
@@ -183,7 +272,10 @@ class CacheMappingFactory(AbstractCacheMappingFactory):
         def conc_cache_cleanup(ttl, subdir, dry_run, corpus_id=None):
             return run_cleanup(root_dir=self._cache_dir,
                                corpus_id=corpus_id, ttl=ttl, subdir=subdir, dry_run=dry_run,
-                               db_plugin=self._db, entry_key_gen=lambda c: DefaultCacheMapping.KEY_TEMPLATE % c)
+                               db_plugin=self._db, entry_key_gen=lambda c: DefaultCacheMapping.KEY_TEMPLATE % c,
+                               q0_index_key_gen=lambda c, q0h: DefaultCacheMapping.Q0_INDEX_KEY_TEMPLATE % (c, q0h),
+                               q0_index_ready_key_gen=lambda c: DefaultCacheMapping.Q0_INDEX_READY_KEY_TEMPLATE % c,
+                               kwic_pages_key_gen=lambda c, h: DefaultCacheMapping.KWIC_PAGES_KEY_TEMPLATE % (c, h))
 
         def conc_cache_monitor(min_file_age, free_capacity_goal, free_capacity_trigger, elastic_conf):
             """
@@ -200,6 +292,8 @@ class CacheMappingFactory(AbstractCacheMappingFactory):
             """
             return run_monitor(root_dir=self._cache_dir, db_plugin=self._db,
                                entry_key_gen=lambda c: DefaultCacheMapping.KEY_TEMPLATE % c,
+                               q0_index_key_gen=lambda c, q0h: DefaultCacheMapping.Q0_INDEX_KEY_TEMPLATE % (c, q0h),
+                               kwic_pages_key_gen=lambda c, h: DefaultCacheMapping.KWIC_PAGES_KEY_TEMPLATE % (c, h),
                                min_file_age=min_file_age, free_capacity_goal=free_capacity_goal,
                                free_capacity_trigger=free_capacity_trigger, elastic_conf=elastic_conf)
 
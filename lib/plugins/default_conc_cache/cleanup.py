@@ -87,11 +87,15 @@ class CacheFiles(object):
 
 class CacheCleanup(CacheFiles):
 
-    def __init__(self, db, root_path, corpus, ttl, subdir, entry_key_gen):
+    def __init__(self, db, root_path, corpus, ttl, subdir, entry_key_gen, q0_index_key_gen=None,
+                 kwic_pages_key_gen=None, q0_index_ready_key_gen=None):
         super(CacheCleanup, self).__init__(root_path, subdir, corpus)
         self._db = db
         self._ttl = ttl
         self._entry_key_gen = entry_key_gen
+        self._q0_index_key_gen = q0_index_key_gen
+        self._kwic_pages_key_gen = kwic_pages_key_gen
+        self._q0_index_ready_key_gen = q0_index_ready_key_gen
         self._num_processed = 0
         self._num_removed = 0
 
@@ -104,6 +108,28 @@ class CacheCleanup(CacheFiles):
                 'count': len(v)
             }))
 
+    def _del_entry(self, corpus_id, cache_key, item_hash, stored):
+        self._db.hash_del(cache_key, item_hash)
+        if self._q0_index_key_gen is not None and type(stored) is list and len(stored) > 2:
+            self._db.hash_del(self._q0_index_key_gen(corpus_id, stored[2]), item_hash)
+        if self._kwic_pages_key_gen is not None:
+            self._db.remove(self._kwic_pages_key_gen(corpus_id, item_hash))
+
+    def _backfill_q0_index(self, corpus_id, cache_map):
+        """
+        Adds entries created before the secondary (base query => entries) index
+        was introduced to the index. This is done only once per corpus.
+        """
+        if self._q0_index_key_gen is None or self._q0_index_ready_key_gen is None:
+            return
+        ready_key = self._q0_index_ready_key_gen(corpus_id)
+        if self._db.exists(ready_key):
+            return
+        for item_hash, stored in list(cache_map.items()):
+            if type(stored) is list and len(stored) > 2:
+                self._db.hash_set(self._q0_index_key_gen(corpus_id, stored[2]), item_hash, True)
+        self._db.set(ready_key, True)
+
     def run(self, dry_run=False):
         """
         Performs the clean-up operation by taking the following sequence of steps:
@@ -118,6 +144,7 @@ class CacheCleanup(CacheFiles):
            2.3 if there are still some files to be deleted it means that they are 'unbound'
                (= there is no record in the respective cache map file);
                 these files are also deleted with a warning
+           2.4 remaining records not indexed by their base query yet are added to the index
 
         Please note that this algorithm is unable to remove stale cache map entries as long
         as there is no existing file within a matching directory (e.g. there is a bunch
@@ -150,19 +177,23 @@ class CacheCleanup(CacheFiles):
             cache_map = self._db.hash_get_all(cache_key)
             if cache_map:
                 try:
-                    for item_hash, _ in list(cache_map.items()):
+                    for item_hash, stored in list(cache_map.items()):
                         if item_hash in to_del:
                             if not dry_run:
                                 os.unlink(to_del[item_hash])
-                                self._db.hash_del(cache_key, item_hash)
+                                self._del_entry(corpus_id, cache_key, item_hash, stored)
+                                del cache_map[item_hash]
                             else:
                                 del to_del[item_hash]
                             num_deleted += 1
                         elif item_hash not in real_file_hashes:
                             if not dry_run:
-                                self._db.hash_del(cache_key, item_hash)
+                                self._del_entry(corpus_id, cache_key, item_hash, stored)
+                                del cache_map[item_hash]
                             logging.getLogger().warn(
                                 'deleted stale cache map entry [%s][%s]' % (cache_key, item_hash))
+                    if not dry_run:
+                        self._backfill_q0_index(corpus_id, cache_map)
                 except Exception as ex:
                     logging.getLogger().warn('Failed to process cache map file (will be deleted): %s' % (ex,))
                     self._db.remove(cache_key)
@@ -181,7 +212,9 @@ class CacheCleanup(CacheFiles):
         return ans
 
 
-def run(root_dir, corpus_id, ttl, subdir, dry_run, db_plugin, entry_key_gen):
+def run(root_dir, corpus_id, ttl, subdir, dry_run, db_plugin, entry_key_gen, q0_index_key_gen=None,
+        kwic_pages_key_gen=None, q0_index_ready_key_gen=None):
     proc = CacheCleanup(db=db_plugin, root_path=root_dir, corpus=corpus_id, ttl=ttl, subdir=subdir,
-                        entry_key_gen=entry_key_gen)
+                        entry_key_gen=entry_key_gen, q0_index_key_gen=q0_index_key_gen,
+                        kwic_pages_key_gen=kwic_pages_key_gen, q0_index_ready_key_gen=q0_index_ready_key_gen)
     return proc.run(dry_run=dry_run)
@@ -36,6 +36,12 @@ if __name__ == '__main__':
     def mk_key(corpus_id):
         return DefaultCacheMapping.KEY_TEMPLATE % corpus_id
 
+    def mk_q0_index_key(corpus_id, q0hash):
+        return DefaultCacheMapping.Q0_INDEX_KEY_TEMPLATE % (corpus_id, q0hash)
+
+    def mk_kwic_pages_key(corpus_id, entry_hash):
+        return DefaultCacheMapping.KWIC_PAGES_KEY_TEMPLATE % (corpus_id, entry_hash)
+
     parser = argparse.ArgumentParser(description='A script to control UCNK concordance cache')
     parser.add_argument('--dry-run', '-d', action='store_true',
                         help='Just analyze, do not modify anything')
@@ -60,4 +66,5 @@ if __name__ == '__main__':
     root_dir = autoconf.settings.get('plugins', 'conc_cache')['default:cache_dir']
 
     cleanup.run(root_dir=root_dir, corpus_id=args.corpus, ttl=args.ttl, subdir=args.subdir,
-                dry_run=args.dry_run, db_plugin=plugins.runtime.DB.instance, entry_key_gen=mk_key)
+                dry_run=args.dry_run, db_plugin=plugins.runtime.DB.instance, entry_key_gen=mk_key,
+                q0_index_key_gen=mk_q0_index_key, kwic_pages_key_gen=mk_kwic_pages_key)
@@ -40,7 +40,7 @@ class Record(object):
 class Monitor(object):
 
     def __init__(self, root_dir, db_plugin, entry_key_gen, min_file_age, free_capacity_goal, free_capacity_trigger,
-                 elastic_conf):
+                 elastic_conf, q0_index_key_gen=None, kwic_pages_key_gen=None):
         """
         arguments:
             root_dir -- cache root directory
@@ -52,10 +52,17 @@ class Monitor(object):
             free_capacity_trigger -- a maximum disk free capacity which triggers file removal process
             elastic_conf -- a tuple (URL, index, type) containing ElasticSearch server, index and document type
                             configuration for storing monitoring info; if None then the function is disabled
+            q0_index_key_gen -- a function generating a key of the secondary (base query => entries)
+                                index for a specific corpus and base query hash (if None then
+                                the index is not updated)
+            kwic_pages_key_gen -- a function generating a key of cached KWIC pages for a specific
+                                  corpus and cache entry hash (if None then the pages are not removed)
         """
         self._root_dir = root_dir
         self.db_plugin = db_plugin
         self.entry_key_gen = entry_key_gen
+        self.q0_index_key_gen = q0_index_key_gen
+        self.kwic_pages_key_gen = kwic_pages_key_gen
         self.min_file_age = min_file_age
         self.free_capacity_goal = free_capacity_goal
         self.free_capacity_trigger = free_capacity_trigger
@@ -109,6 +116,17 @@ class Monitor(object):
     def parse_conc_code(self, path):
         return self.entry_key_gen(os.path.basename(os.path.dirname(path))), os.path.basename(path)[:-len('.conc')]
 
+    def del_entry(self, path):
+        key, key2 = self.parse_conc_code(path)
+        if self.q0_index_key_gen is not None:
+            stored = self.db_plugin.hash_get(key, key2)
+            if type(stored) is list and len(stored) > 2:
+                self.db_plugin.hash_del(self.q0_index_key_gen(
+                    os.path.basename(os.path.dirname(path)), stored[2]), key2)
+        self.db_plugin.hash_del(key, key2)
+        if self.kwic_pages_key_gen is not None:
+            self.db_plugin.remove(self.kwic_pages_key_gen(os.path.basename(os.path.dirname(path)), key2))
+
     def find_rm_candidates(self):
         rmlist = sorted([v for v in self._data if v.age > self.min_file_age],
                         key=lambda v: v.size * v.age, reverse=True)
@@ -117,8 +135,7 @@ class Monitor(object):
         errors = []
         while i < len(rmlist) and total < self.free_capacity_goal:
             try:
-                key, key2 = self.parse_conc_code(rmlist[i].path)
-                self.db_plugin.hash_del(key, key2)
+                self.del_entry(rmlist[i].path)
                 os.unlink(rmlist[i].path)
                 total += rmlist[i].size
                 i += 1
@@ -132,11 +149,12 @@ class Monitor(object):
 
 
 def run(db_plugin, entry_key_gen, root_dir, min_file_age, free_capacity_goal, free_capacity_trigger,
-        elastic_conf=None):
+        elastic_conf=None, q0_index_key_gen=None, kwic_pages_key_gen=None):
     """
     See Monitor.__init__() for arguments. 
     """
     monitor = Monitor(root_dir=root_dir, db_plugin=db_plugin, entry_key_gen=entry_key_gen,
                       min_file_age=min_file_age, free_capacity_goal=free_capacity_goal,
-                      free_capacity_trigger=free_capacity_trigger, elastic_conf=elastic_conf)
+                      free_capacity_trigger=free_capacity_trigger, elastic_conf=elastic_conf,
+                      q0_index_key_gen=q0_index_key_gen, kwic_pages_key_gen=kwic_pages_key_gen)
     return monitor.run()
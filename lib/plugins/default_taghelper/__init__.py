@@ -94,8 +94,8 @@ class Taghelper(AbstractTaghelper):
                 elif tagset.tagset_type == 'keyval':
                     self._loaders[(corpus_name, tagset.tagset_name)] = KeyvalTagVariantLoader(
                         corpus_name=corpus_name, tagset_name=tagset.tagset_name,
-                        tags_src_dir=self._conf['default:tags_src_dir'],
-                    )
+                        cache_dir=self._conf['default:tags_cache_dir'],
+                        tags_src_dir=self._conf['default:tags_src_dir'])
                     self._fetchers[(corpus_name, tagset.tagset_name)] = KeyvalSelectionFetcher()
                 else:
                     self._loaders[(corpus_name, tagset.tagset_name)] = NullTagVariantLoader()
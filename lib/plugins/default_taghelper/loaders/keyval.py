@@ -18,26 +18,194 @@
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
 
 import os
+import json
 import pickle
 from collections import defaultdict
 
+import numpy as np
+
 from plugins.abstract.taghelper import AbstractTagsetInfoLoader
 
 
+class KeyvalIndex(object):
+    """
+    An inverted index of key-value tag variants. Each feature (a (key, value) pair)
+    is mapped to a sorted array of IDs of variants containing the feature and each
+    variant is mapped to a sorted array of codes of its features. Both mappings
+    are stored in a CSR-like form (offsets + concatenated items).
+    """
+
+    def __init__(self, features, feat_offsets, feat_variants, var_offsets, var_features):
+        """
+        arguments:
+        features -- a list of (key, value) pairs (indices = feature codes)
+        feat_offsets -- offsets of features' posting lists in feat_variants
+        feat_variants -- concatenated sorted arrays of variant IDs
+        var_offsets -- offsets of variants' features in var_features
+        var_features -- concatenated sorted arrays of feature codes
+        """
+        self._features = features
+        self._codes = dict((f, i) for i, f in enumerate(features))
+        self._feat_offsets = feat_offsets
+        self._feat_variants = feat_variants
+        self._var_offsets = var_offsets
+        self._var_features = var_features
+        keys = sorted(set(k for k, _ in features))
+        self._key_ids = dict((k, i) for i, k in enumerate(keys))
+        self._feat_keys = np.array([self._key_ids[k] for k, _ in features], dtype=np.int32)
+
+    @property
+    def num_variants(self):
+        return len(self._var_offsets) - 1
+
+    @staticmethod
+    def build(variations):
+        """
+        arguments:
+        variations -- a list of variants where each variant is a collection of (key, value) pairs
+        """
+        variations = [set(tuple(f) for f in variation) for variation in variations]
+        features = sorted(set(f for variation in variations for f in variation))
+        codes = dict((f, i) for i, f in enumerate(features))
+        postings = [[] for _ in features]
+        var_offsets = [0]
+        var_features = []
+        for var_id, variation in enumerate(variations):
+            var_codes = sorted(codes[f] for f in variation)
+            for code in var_codes:
+                postings[code].append(var_id)
+            var_features.extend(var_codes)
+            var_offsets.append(len(var_features))
+        feat_offsets = np.cumsum([0] + [len(p) for p in postings])
+        feat_variants = [var_id for p in postings for var_id in p]
+        return KeyvalIndex(features=features,
+                           feat_offsets=np.array(feat_offsets, dtype=np.int64),
+                           feat_variants=np.array(feat_variants, dtype=np.int32),
+                           var_offsets=np.array(var_offsets, dtype=np.int64),
+                           var_features=np.array(var_features, dtype=np.int32))
+
+    def save(self, path):
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as fw:
+            np.savez_compressed(fw, features=np.array(json.dumps(self._features)),
+                                feat_offsets=self._feat_offsets, feat_variants=self._feat_variants,
+                                var_offsets=self._var_offsets, var_features=self._var_features)
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def load(path):
+        with np.load(path) as data:
+            return KeyvalIndex(features=[tuple(f) for f in json.loads(data['features'].item())],
+                               feat_offsets=data['feat_offsets'], feat_variants=data['feat_variants'],
+                               var_offsets=data['var_offsets'], var_features=data['var_features'])
+
+    def all_values(self):
+        """
+        Return all the values of all the keys as a dict {key: [value1, value2,...]}
+        """
+        ans = defaultdict(list)
+        for key, value in self._features:
+            ans[key].append(value)
+        return dict(ans)
+
+    def find_variants(self, filter_values):
+        """
+        Find IDs of variants matching a filter (OR logic for values of the same key,
+        AND logic across keys)
+
+        arguments:
+        filter_values -- a dict {key: [value1, value2,...]}
+
+        returns:
+        a sorted array of variant IDs
+        """
+        mask = np.ones(self.num_variants, dtype=bool)
+        for key, values in filter_values.items():
+            key_mask = np.zeros(self.num_variants, dtype=bool)
+            for value in values:
+                code = self._codes.get((key, value))
+                if code is not None:
+                    key_mask[self._feat_variants[self._feat_offsets[code]:self._feat_offsets[code + 1]]] = True
+            mask &= key_mask
+        return np.nonzero(mask)[0]
+
+    def possible_values(self, var_ids, filter_keys):
+        """
+        Derive possible values of non-filter keys for a set of variants. Variants are
+        grouped by their filter features and only values available in all the groups
+        are returned (i.e. the values are supported by all possible filter combinations).
+
+        arguments:
+        var_ids -- a sorted array of variant IDs (see find_variants())
+        filter_keys -- a collection of keys used in the filter
+
+        returns:
+        a dict {key: [value1, value2,...]}
+        """
+        if len(var_ids) == 0:
+            return {}
+        starts = self._var_offsets[var_ids]
+        lengths = self._var_offsets[var_ids + 1] - starts
+        owners = np.repeat(np.arange(len(var_ids)), lengths)
+        feat_pos = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        codes = self._var_features[np.repeat(starts, lengths) + feat_pos]
+        filter_key_ids = [self._key_ids[k] for k in filter_keys if k in self._key_ids]
+        is_filter = np.isin(self._feat_keys[codes], filter_key_ids)
+
+        # group variants by their filter features (rows of a padded matrix)
+        f_owners = owners[is_filter]
+        num_filter = np.bincount(f_owners, minlength=len(var_ids))
+        if len(f_owners) > 0:
+            rank = np.arange(len(f_owners)) - np.repeat(np.cumsum(num_filter) - num_filter, num_filter)
+            signatures = np.full((len(var_ids), num_filter.max()), -1, dtype=np.int32)
+            signatures[f_owners, rank] = codes[is_filter]
+            _, groups = np.unique(signatures, axis=0, return_inverse=True)
+            groups = groups.reshape(-1)
+        else:
+            groups = np.zeros(len(var_ids), dtype=np.int64)
+        num_groups = groups.max() + 1
+
+        # values available in all the groups
+        pairs = np.unique(groups[owners[~is_filter]].astype(np.int64) * len(self._features) + codes[~is_filter])
+        group_counts = np.bincount(pairs % len(self._features), minlength=len(self._features))
+        ans = defaultdict(list)
+        for code in np.nonzero(group_counts == num_groups)[0]:
+            key, value = self._features[code]
+            ans[key].append(value)
+        return dict(ans)
+
+
 class KeyvalTagVariantLoader(AbstractTagsetInfoLoader):
 
-    def __init__(self, corpus_name, tagset_name, tags_src_dir):
+    def __init__(self, corpus_name, tagset_name, cache_dir, tags_src_dir):
         self.corpus_name = corpus_name
         self.tagset_name = tagset_name
         self.variants_file_path = os.path.join(tags_src_dir, tagset_name, corpus_name)
-        self.initial_values = None if self.is_enabled() else []
+        self.cache_dir = os.path.join(cache_dir, tagset_name, corpus_name)
+        self._index = None
+        self._initial_values = None
 
     def _initialize_tags(self):
-        with open(self.variants_file_path, 'r') as f:
-            self.initial_values = pickle.load(f)
+        """
+        Load the inverted index of tag variants. The index is built from the variants
+        file once and cached as a binary file (which is rebuilt once the variants
+        file is updated).
+        """
+        if not self.is_enabled():
+            self._index = KeyvalIndex.build([])
+            return
+        path = os.path.join(self.cache_dir, 'keyval-index.npz')
+        if os.path.exists(path) and os.stat(path).st_mtime >= os.stat(self.variants_file_path).st_mtime:
+            self._index = KeyvalIndex.load(path)
+        else:
+            with open(self.variants_file_path, 'rb') as f:
+                self._index = KeyvalIndex.build(pickle.load(f))
+            if not os.path.exists(self.cache_dir):
+                os.makedirs(self.cache_dir, 0o775)
+            self._index.save(path)
 
     def get_variant(self, filter_values, lang):
-        if self.initial_values is None:
+        if self._index is None:
             self._initialize_tags()
 
         # possible values with all filters applied
@@ -50,7 +218,7 @@ class KeyvalTagVariantLoader(AbstractTagsetInfoLoader):
         return {'keyval_tags': possible_values}
 
     def get_initial_values(self, lang):
-        if self.initial_values is None:
+        if self._index is None:
             self._initialize_tags()
         return {'keyval_tags': self.get_possible_values()}
 
@@ -59,37 +227,11 @@ class KeyvalTagVariantLoader(AbstractTagsetInfoLoader):
 
     def get_possible_values(self, filter_values=None):
         """
-        Filter possible feature values from initial_values according to user selection
+        Filter possible feature values according to user selection
         """
-
         if filter_values is not None:
-            # filter OR logic for values of the same category, AND logic across categories
-            variations = list([x for x in self.initial_values if all(
-                any(
-                    (key, value) in x
-                    for value in values
-                )
-                for key, values in list(filter_values.items())
-            )])
-
-            # we can allow only keyval features, that are supported by all possible filter combinations
-            # for this we use set intersection
-            possible_keyval_indexed = defaultdict(set)
-            for variation in variations:
-                index = tuple(sorted([x for x in variation if x[0] in filter_values]))
-                values = set([x for x in variation if x[0] not in filter_values])
-                possible_keyval_indexed[index].update(values)
-            possible_keyval = set.intersection(*list(possible_keyval_indexed.values()))
-
-            # transformation to dict of lists
-            possible_values = defaultdict(list)
-            for key, value in possible_keyval:
-                possible_values[key].append(value)
-        else:
-            # transformation of initial values to dict of lists of unique values
-            possible_values = defaultdict(set)
-            for variation in self.initial_values:
-                for key, value in variation:
-                    possible_values[key].add(value)
-
-        return {k: list(v) for k, v in list(possible_values.items())}
+            var_ids = self._index.find_variants(filter_values)
+            return self._index.possible_values(var_ids, list(filter_values.keys()))
+        if self._initial_values is None:
+            self._initial_values = self._index.all_values()
+        return dict((k, list(v)) for k, v in self._initial_values.items())
@@ -49,6 +49,9 @@ class PositionalTagVariantLoader(AbstractTagsetInfoLoader):
         ('!', r'\!')
     )
 
+    # pattern elements preventing a position-by-position evaluation of a pattern
+    REGEXP_META_CHARS = ('|', '*', '+', '?', '(', ')', '{', '}', '^', '$', '\\', '[', ']')
+
     def __init__(self, corpus_name, tagset_name, cache_dir, tags_src_dir, cache_clear_interval,
                  taglist_path):
         """
@@ -60,6 +63,8 @@ class PositionalTagVariantLoader(AbstractTagsetInfoLoader):
         self.cache_clear_interval = cache_clear_interval
         self.taglist_path = taglist_path
         self.initial_values = {}
+        self._tag_descriptions = {}
+        self._variants_index = None
 
     def get_variant(self, user_selection, lang):
         """
@@ -106,16 +111,7 @@ class PositionalTagVariantLoader(AbstractTagsetInfoLoader):
             os.unlink(path)
 
         if not os.path.exists(path):
-            cache_path_items = os.path.dirname(path).split('/')
-            if cache_path_items[0] == '':
-                cache_path_items[0] = '/'
-            else:
-                cache_path_items.insert(0, './')
-            tst_path = ''
-            for s in cache_path_items:
-                tst_path += '%s/' % s
-                if not os.path.exists(tst_path):
-                    os.mkdir(tst_path, 0o775)
+            self._create_cache_dir()
             ans = [set() for i in range(tagset['num_pos'])]
             with open(self.variants_file_path) as fr:
                 for line in fr:
@@ -164,28 +160,21 @@ class PositionalTagVariantLoader(AbstractTagsetInfoLoader):
                                 for position in tagset['values']])
         required_pattern = required_pattern.replace('-', '.')
         char_replac_tab = dict(self.__class__.SPEC_CHAR_REPLACEMENTS)
-        patt = re.compile(required_pattern)
-        matching_tags = []
-        with open(self.variants_file_path) as fr:
-            for line in fr:
-                line = line.strip() + (tagset['num_pos'] - len(line.strip())) * '-'
-                if patt.match(line):
-                    matching_tags.append(line)
+        tag_elms = re.findall(r'\\[\*\?\^\.!]|\[[^\]]+\]|[^-]|-', required_pattern)
+        position_values = self._find_position_values(required_pattern, tag_elms, tagset['num_pos'])
 
         ans = defaultdict(lambda: set())
-        tag_elms = re.findall(r'\\[\*\?\^\.!]|\[[^\]]+\]|[^-]|-', required_pattern)
         translation_tables = [dict(tagset['values'][i]) for i in range(len(tag_elms))]
 
-        for item in matching_tags:
-            for i in range(len(tag_elms)):
-                value = ''.join(
-                    [char_replac_tab[x] if x in char_replac_tab else x for x in item[i]])
-                if item[i] == '-':
+        for i, chars in enumerate(position_values):
+            for char in chars:
+                value = char_replac_tab.get(char, char)
+                if char == '-':
                     ans[i].add(('-', ''))
-                elif item[i] in translation_tables[i]:
-                    ans[i].add((value, '%s - %s' % (item[i], translation_tables[i][item[i]])))
+                elif char in translation_tables[i]:
+                    ans[i].add((value, '%s - %s' % (char, translation_tables[i][char])))
                 else:
-                    ans[i].add((value, '%s - %s' % (item[i], item[i])))
+                    ans[i].add((value, '%s - %s' % (char, char)))
 
         for key in ans:
             i = int(key)
@@ -200,6 +189,115 @@ class PositionalTagVariantLoader(AbstractTagsetInfoLoader):
             ans[key] = sorted(ans[key], key=cmp_to_key(cmp_by_seq)) if ans[key] is not None else None
         return {'tags': ans, 'labels': []}
 
+    def _find_position_values(self, required_pattern, tag_elms, num_pos):
+        """
+        Find values available at individual positions of tag variants matching
+        a pattern. Patterns consisting of single-character elements (a character,
+        an escaped character, '.' or a character class) are evaluated using
+        the variants index (see _get_variants_index()) by AND-ing bitsets
+        of matching values. Other patterns are searched in the variants file.
+
+        arguments:
+        required_pattern -- a tag pattern (regular expression) with '-' already replaced by '.'
+        tag_elms -- elements (= positions) of the pattern
+        num_pos -- number of tagset positions
+
+        returns:
+        a list (one item per pattern element) of sets of values or an empty list
+        if no variant matches
+        """
+        if ''.join(tag_elms) != required_pattern or any(elm in self.REGEXP_META_CHARS for elm in tag_elms):
+            return self._scan_position_values(required_pattern, len(tag_elms), num_pos)
+        index, all_variants = self._get_variants_index(num_pos)
+        mask = all_variants
+        for i, elm in enumerate(tag_elms):
+            if elm == '.':
+                continue
+            try:
+                elm_patt = re.compile(elm)
+            except re.error:
+                return self._scan_position_values(required_pattern, len(tag_elms), num_pos)
+            selected = 0
+            for char, bitset in (index[i].items() if i < len(index) else ()):
+                if elm_patt.fullmatch(char):
+                    selected |= bitset
+            mask &= selected
+            if not mask:
+                return []
+        if len(tag_elms) > len(index):
+            return []
+        return [set(char for char, bitset in index[i].items() if bitset & mask)
+                for i in range(len(tag_elms))]
+
+    def _scan_position_values(self, required_pattern, num_elms, num_pos):
+        """
+        A fallback for _find_position_values() matching the pattern
+        against all the lines of the variants file.
+        """
+        patt = re.compile(required_pattern)
+        ans = [set() for i in range(num_elms)]
+        found = False
+        with open(self.variants_file_path) as fr:
+            for line in fr:
+                line = line.strip() + (num_pos - len(line.strip())) * '-'
+                if patt.match(line):
+                    found = True
+                    for i in range(num_elms):
+                        ans[i].add(line[i])
+        return ans if found else []
+
+    def _get_variants_index(self, num_pos):
+        """
+        Return an index of tag variants in the form of a list (= positions) of
+        dicts {value: bitset of variants (= file lines) with the value at the position}
+        along with a bitset of all the variants. Bitsets are Python integers.
+
+        The index is created once and cached (as a JSON file next to initial values
+        files) until the cache clear interval passes or the variants file is updated.
+        Once loaded, the index is kept in memory for the lifetime of the process.
+        """
+        if self._variants_index is None:
+            path = os.path.join(self.cache_dir, 'variants-index.json')
+            data = None
+            try:
+                st = os.stat(path)
+                if (time.time() - st.st_ctime <= float(self.cache_clear_interval) and
+                        st.st_mtime >= os.stat(self.variants_file_path).st_mtime):
+                    with open(path, 'r') as fr:
+                        data = json.load(fr)
+            except (OSError, ValueError):  # missing or unreadable file => recreate
+                data = None
+            if data is not None:
+                index = [dict((char, int(bitset, 16)) for char, bitset in position.items())
+                         for position in data['positions']]
+                num_variants = data['num_variants']
+            else:
+                index = []
+                num_variants = 0
+                with open(self.variants_file_path) as fr:
+                    for line in fr:
+                        line = line.strip() + (num_pos - len(line.strip())) * '-'
+                        for i, char in enumerate(line):
+                            if i == len(index):
+                                index.append(defaultdict(int))
+                            index[i][char] |= 1 << num_variants
+                        num_variants += 1
+                index = [dict(position) for position in index]
+                self._create_cache_dir()
+                # other processes may read the file concurrently so it must be replaced atomically
+                tmp_path = '{0}.{1}.tmp'.format(path, os.getpid())
+                with open(tmp_path, 'w') as fw:
+                    json.dump(dict(num_variants=num_variants,
+                                   positions=[dict((char, '%x' % bitset) for char, bitset in position.items())
+                                              for position in index]), fw)
+                os.replace(tmp_path, path)
+            self._variants_index = (index, (1 << num_variants) - 1)
+        return self._variants_index
+
+    def _create_cache_dir(self):
+        if not os.path.exists(self.cache_dir):
+            os.makedirs(self.cache_dir, 0o775)
+
     def _load_tag_descriptions(self, tagset_name, lang):
         """
         arguments:
@@ -214,6 +312,11 @@ class PositionalTagVariantLoader(AbstractTagsetInfoLoader):
           * 'num_pos' : [number of tagset positions]
         """
         lang = lang.split('_')[0]
+        if (tagset_name, lang) not in self._tag_descriptions:
+            self._tag_descriptions[(tagset_name, lang)] = self._parse_tag_descriptions(tagset_name, lang)
+        return self._tag_descriptions[(tagset_name, lang)]
+
+    def _parse_tag_descriptions(self, tagset_name, lang):
         with open(self.taglist_path) as fr:
             xml = etree.parse(fr)
         root = xml.find('/tagsets/tagset[@ident="%s"]' % tagset_name)
@@ -0,0 +1,120 @@
+# Copyright (c) 2020 Charles University, Faculty of Arts,
+#                    Institute of the Czech National Corpus
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; version 2
+# dated June, 1991.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+"""
+Tests of the key-value tag variant loader - results obtained via the inverted
+index must be the same as the ones of the original set intersection algorithm.
+"""
+
+import os
+import pickle
+import random
+import shutil
+import tempfile
+import unittest
+from collections import defaultdict
+
+from plugins.default_taghelper.loaders.keyval import KeyvalIndex, KeyvalTagVariantLoader
+
+FEATURES = {
+    'POS': ['N', 'V', 'A', 'D'],
+    'Case': ['1', '2', '3'],
+    'Gender': ['M', 'F', 'N'],
+    'Number': ['S', 'P'],
+    'Tense': ['Pres', 'Past']
+}
+
+
+def set_intersection_values(variations, filter_values):
+    """
+    The original algorithm: variants matching the filter are grouped by their filter
+    features and only values available in all the groups are returned.
+    """
+    variations = [x for x in variations if all(any((key, value) in x for value in values)
+                                               for key, values in filter_values.items())]
+    if len(variations) == 0:
+        return {}
+    possible_keyval_indexed = defaultdict(set)
+    for variation in variations:
+        index = tuple(sorted([x for x in variation if x[0] in filter_values]))
+        possible_keyval_indexed[index].update([x for x in variation if x[0] not in filter_values])
+    possible_values = defaultdict(list)
+    for key, value in set.intersection(*possible_keyval_indexed.values()):
+        possible_values[key].append(value)
+    return dict(possible_values)
+
+
+def normalize(values):
+    return dict((k, sorted(v)) for k, v in values.items())
+
+
+class KeyvalLoaderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.rnd = random.Random(2)
+
+    def _random_variations(self):
+        ans = set()
+        for _ in range(self.rnd.randint(1, 60)):
+            keys = self.rnd.sample(sorted(FEATURES), self.rnd.randint(1, 4))
+            ans.add(tuple(sorted((k, self.rnd.choice(FEATURES[k])) for k in keys)))
+        return [list(v) for v in ans]
+
+    def _random_filter(self):
+        return dict((k, self.rnd.sample(FEATURES[k], self.rnd.randint(1, 2)))
+                    for k in self.rnd.sample(sorted(FEATURES), self.rnd.randint(1, 3)))
+
+    def test_index_vs_set_intersection(self):
+        for _ in range(200):
+            variations = self._random_variations()
+            index = KeyvalIndex.build(variations)
+            for _ in range(20):
+                filter_values = self._random_filter()
+                ans = index.possible_values(index.find_variants(filter_values), list(filter_values.keys()))
+                self.assertEqual(normalize(ans), normalize(set_intersection_values(variations, filter_values)),
+                                 'variations: {0}, filter: {1}'.format(variations, filter_values))
+
+    def test_empty_match(self):
+        variations = [[('POS', 'N'), ('Case', '1')], [('POS', 'V'), ('Tense', 'Past')]]
+        index = KeyvalIndex.build(variations)
+        filter_values = {'POS': ['A']}
+        self.assertEqual(len(index.find_variants(filter_values)), 0)
+        self.assertEqual(index.possible_values(index.find_variants(filter_values), ['POS']), {})
+        self.assertEqual(set_intersection_values(variations, filter_values), {})
+
+    def test_cached_index(self):
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            os.makedirs(os.path.join(tmp_dir, 'src', 'ts'))
+            variations = self._random_variations()
+            with open(os.path.join(tmp_dir, 'src', 'ts', 'corp'), 'wb') as fw:
+                pickle.dump(variations, fw)
+            loaders = [KeyvalTagVariantLoader('corp', 'ts', os.path.join(tmp_dir, 'cache'),
+                                              os.path.join(tmp_dir, 'src')) for _ in range(2)]
+            initial = [normalize(loader.get_initial_values('en')['keyval_tags']) for loader in loaders]
+            self.assertTrue(os.path.isfile(os.path.join(tmp_dir, 'cache', 'ts', 'corp', 'keyval-index.npz')))
+            self.assertEqual(initial[0], initial[1])
+            for _ in range(20):
+                filter_values = self._random_filter()
+                self.assertEqual(normalize(loaders[1].get_possible_values(filter_values)),
+                                 normalize(set_intersection_values(variations, filter_values)))
+        finally:
+            shutil.rmtree(tmp_dir)
+
+
+if __name__ == '__main__':
+    unittest.main()
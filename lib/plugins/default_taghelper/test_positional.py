@@ -0,0 +1,99 @@
+# Copyright (c) 2020 Charles University, Faculty of Arts,
+#                    Institute of the Czech National Corpus
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; version 2
+# dated June, 1991.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+"""
+Tests of the positional tag variant loader - results obtained via the variants
+index must be the same as the ones obtained by scanning the variants file.
+"""
+
+import os
+import random
+import re
+import shutil
+import tempfile
+import unittest
+
+from plugins.default_taghelper.loaders.positional import PositionalTagVariantLoader
+
+NUM_POS = 5
+
+# possible values of individual positions ('-' = undefined)
+POSITION_VALUES = ('ABCDN', '-abc', '-xyz*', '-12?^', '-!}.')
+
+
+def escape_value(char):
+    return re.escape(char) if char != '-' else '.'
+
+
+class PositionalLoaderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.rnd = random.Random(1)
+        os.makedirs(os.path.join(self.tmp_dir, 'src', 'ts'))
+        variants = set()
+        for _ in range(400):
+            num_pos = self.rnd.randint(3, NUM_POS)
+            variants.add(''.join(self.rnd.choice(v) for v in POSITION_VALUES[:num_pos]).rstrip('-') or 'A')
+        with open(os.path.join(self.tmp_dir, 'src', 'ts', 'corp'), 'w') as fw:
+            fw.write('\n'.join(sorted(variants)) + '\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _create_loader(self):
+        return PositionalTagVariantLoader('corp', 'ts', os.path.join(self.tmp_dir, 'cache'),
+                                          os.path.join(self.tmp_dir, 'src'), 3600, None)
+
+    def _random_tag_elms(self):
+        ans = []
+        for i in range(self.rnd.randint(1, NUM_POS + 1)):
+            values = POSITION_VALUES[i % NUM_POS]
+            r = self.rnd.random()
+            if r < 0.4:
+                ans.append('.')
+            elif r < 0.7:
+                ans.append(escape_value(self.rnd.choice(values)))
+            else:
+                ans.append('[{0}]'.format(''.join(re.escape(c) for c in self.rnd.sample(values, 2) if c != '-')))
+        return [elm if elm != '[]' else '.' for elm in ans]
+
+    def _assert_same_values(self, loader, tag_elms):
+        pattern = ''.join(tag_elms)
+        self.assertEqual(loader._find_position_values(pattern, tag_elms, NUM_POS),
+                         loader._scan_position_values(pattern, len(tag_elms), NUM_POS),
+                         'pattern: {0}'.format(pattern))
+
+    def test_index_vs_scan(self):
+        loader = self._create_loader()
+        for _ in range(1000):
+            self._assert_same_values(loader, self._random_tag_elms())
+
+    def test_cached_index_vs_scan(self):
+        self._create_loader()._get_variants_index(NUM_POS)
+        loader = self._create_loader()  # loads the index from the cache file
+        for _ in range(300):
+            self._assert_same_values(loader, self._random_tag_elms())
+
+    def test_no_match(self):
+        loader = self._create_loader()
+        self._assert_same_values(loader, ['Q', '.'])
+        self.assertEqual(loader._find_position_values('Q.', ['Q', '.'], NUM_POS), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -35,6 +35,10 @@ Required XML configuration: please see config.rng
 import json
 import logging
 import os
+import threading
+import time
+from multiprocessing import TimeoutError
+from multiprocessing.pool import ThreadPool
 import manatee
 
 import plugins
@@ -118,10 +122,30 @@ def add_structattr_support(corp, attrs, token_id):
 
 class DefaultTokenConnect(AbstractTokenConnect):
 
-    def __init__(self, providers, corparch):
+    DEFAULT_MAX_PARALLEL_FETCHES = 4
+
+    DEFAULT_FETCH_TIMEOUT = 15
+
+    def __init__(self, providers, corparch, max_parallel_fetches=DEFAULT_MAX_PARALLEL_FETCHES,
+                 fetch_timeout=DEFAULT_FETCH_TIMEOUT):
         self._corparch = corparch
         self._providers = providers
         self._cache_path = None
+        self._max_parallel_fetches = max_parallel_fetches
+        self._fetch_timeout = fetch_timeout
+        self._fetch_pool = None
+        self._fetch_pool_pid = None
+        self._fetch_pool_lock = threading.Lock()
+
+    def _get_fetch_pool(self):
+        """
+        Return a per-process pool of threads used to fetch providers' data concurrently
+        """
+        with self._fetch_pool_lock:
+            if self._fetch_pool is None or self._fetch_pool_pid != os.getpid():
+                self._fetch_pool = ThreadPool(self._max_parallel_fetches)
+                self._fetch_pool_pid = os.getpid()
+            return self._fetch_pool
 
     def map_providers(self, providers):
         return [self._providers[ident] + (is_kwic_view,) for ident, is_kwic_view in providers]
@@ -147,6 +171,10 @@ class DefaultTokenConnect(AbstractTokenConnect):
         def fetch_any_attr(corp, att, t_id, num_t):
             return fetch_posattr(corp, att, t_id, num_t)
 
+        # providers are fetched concurrently; results are collected in the configured order
+        pool = self._get_fetch_pool()
+        deadline = time.time() + self._fetch_timeout
+        jobs = []
         for backend, frontend, is_kwic_view in self.map_providers(providers):
             try:
                 args = {}
@@ -159,9 +187,20 @@ class DefaultTokenConnect(AbstractTokenConnect):
                         args[s][sa] = v
                     else:
                         args[attr] = v
-                data, status = backend.fetch(corpora, token_id, num_tokens, args, lang)
-                ans.append(frontend.export_data(data, status, lang, is_kwic_view).to_dict())
+                jobs.append((frontend, is_kwic_view, pool.apply_async(
+                    backend.fetch, (corpora, token_id, num_tokens, args, lang))))
             except TypeError as ex:
+                jobs.append((frontend, is_kwic_view, ex))
+
+        for frontend, is_kwic_view, job in jobs:
+            try:
+                if isinstance(job, Exception):
+                    raise job
+                data, status = job.get(timeout=max(0, deadline - time.time()))
+                ans.append(frontend.export_data(data, status, lang, is_kwic_view).to_dict())
+            except (TypeError, TimeoutError) as ex:
+                if isinstance(ex, TimeoutError):
+                    ex = 'provider did not respond in {0} s'.format(self._fetch_timeout)
                 logging.getLogger(__name__).error('TokenConnect backend error: {0}'.format(ex))
                 err_frontend = ErrorFrontend(dict(heading=frontend.headings))
                 ans.append(err_frontend.export_data(
@@ -221,8 +260,13 @@ def setup_providers(plg_conf):
 
 @plugins.inject(plugins.runtime.CORPARCH)
 def create_instance(settings, corparch):
-    providers, cache_path = setup_providers(settings.get('plugins', 'token_connect'))
-    tok_det = DefaultTokenConnect(providers, corparch)
+    plg_conf = settings.get('plugins', 'token_connect')
+    providers, cache_path = setup_providers(plg_conf)
+    tok_det = DefaultTokenConnect(
+        providers, corparch,
+        max_parallel_fetches=int(plg_conf.get('default:max_parallel_fetches',
+                                              DefaultTokenConnect.DEFAULT_MAX_PARALLEL_FETCHES)),
+        fetch_timeout=float(plg_conf.get('default:fetch_timeout', DefaultTokenConnect.DEFAULT_FETCH_TIMEOUT)))
     if cache_path:
         tok_det.set_cache_path(cache_path)
     return tok_det
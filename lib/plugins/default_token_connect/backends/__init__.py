@@ -22,18 +22,75 @@ import urllib.request
 import urllib.parse
 import urllib.error
 import logging
+import os
 import sqlite3
+import threading
+from collections import defaultdict
 from plugins.default_token_connect.backends.cache import cached
 
 from plugins.abstract.token_connect import AbstractBackend, BackendException
 
 
+class HTTPConnectionPool(object):
+    """
+    A per-process pool of keep-alive HTTP(S) connections keyed by (server, port, ssl).
+    A connection is always used by a single thread - it is removed from the pool
+    by acquire() and returned back by release() once its response is fully read.
+    """
+
+    def __init__(self, max_idle=8, timeout=15):
+        self._max_idle = max_idle
+        self._timeout = timeout
+        self._idle = defaultdict(list)
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+
+    def acquire(self, server, port, ssl):
+        with self._lock:
+            if self._pid != os.getpid():
+                # connections inherited from a parent process must not be shared
+                self._idle = defaultdict(list)
+                self._pid = os.getpid()
+            idle = self._idle[(server, port, ssl)]
+            if len(idle) > 0:
+                return idle.pop()
+        if ssl:
+            return http.client.HTTPSConnection(server, port=port, timeout=self._timeout)
+        return http.client.HTTPConnection(server, port=port, timeout=self._timeout)
+
+    def release(self, server, port, ssl, connection):
+        with self._lock:
+            idle = self._idle[(server, port, ssl)]
+            if self._pid == os.getpid() and len(idle) < self._max_idle:
+                idle.append(connection)
+                return
+        connection.close()
+
+
+connection_pool = HTTPConnectionPool()
+
+
 class SQLite3Backend(AbstractBackend):
+    """
+    Please note that providers may be fetched in parallel (see DefaultTokenConnect.fetch_data())
+    and sqlite3 connections cannot be shared among threads, so each thread opens its own connection.
+    """
+
     def __init__(self, conf, ident):
         super(SQLite3Backend, self).__init__(ident)
-        self._db = sqlite3.connect(conf['path'])
+        self._db_path = conf['path']
+        self._local = threading.local()
         self._query_tpl = conf['query']
 
+    @property
+    def _db(self):
+        if not hasattr(self._local, 'db'):
+            self._local.db = sqlite3.connect(self._db_path)
+        return self._local.db
+
+    def get_required_attrs(self):
+        return ['word', 'lemma']  # see the query parameters in fetch()
+
     @cached
     def fetch(self, corpora, token_id, num_tokens, query_args, lang):
         cur = self._db.cursor()
@@ -73,12 +130,37 @@ class HTTPBackend(AbstractBackend):
         return 200 <= response.status < 300
 
     def create_connection(self):
-        if self._conf['ssl']:
-            return http.client.HTTPSConnection(
-                self._conf['server'], port=self._conf['port'], timeout=15)
-        else:
-            return http.client.HTTPConnection(
-                self._conf['server'], port=self._conf['port'], timeout=15)
+        """
+        Return a (possibly already open) connection from the shared connection pool.
+        """
+        return connection_pool.acquire(self._conf['server'], self._conf['port'], self._conf['ssl'])
+
+    def send_request(self, path):
+        """
+        Send a GET request using a pooled keep-alive connection. In case a reused
+        connection has been closed by the server in the meantime, the request is
+        repeated once using a new connection.
+
+        returns:
+        a 2-tuple (response data, found flag) as produced by process_response()
+        """
+        conn_key = (self._conf['server'], self._conf['port'], self._conf['ssl'])
+        while True:
+            connection = self.create_connection()
+            reused = connection.sock is not None
+            try:
+                connection.request('GET', path)
+                ans = self.process_response(connection)
+            except ConnectionError:
+                connection.close()
+                if reused:
+                    continue
+                raise
+            except Exception:
+                connection.close()
+                raise
+            connection_pool.release(*conn_key, connection)
+            return ans
 
     def process_response(self, connection):
         response = connection.getresponse()
@@ -105,22 +187,17 @@ class HTTPBackend(AbstractBackend):
 
     @cached
     def fetch(self, corpora, token_id, num_tokens, query_args, lang):
-        connection = self.create_connection()
+        args = dict(
+            ui_lang=self.enc_val(lang), corpus=self.enc_val(corpora[0]),
+            corpus2=self.enc_val(corpora[1] if len(corpora) > 1 else ''),
+            token_id=token_id, num_tokens=num_tokens,
+            **dict((k, dict((k2, self.enc_val(v2)) for k2, v2 in list(v.items())) if type(v) is dict else self.enc_val(v)
+                    ) for k, v in list(query_args.items())))
+        logging.getLogger(__name__).debug('HTTP Backend args: {0}'.format(args))
+
         try:
-            args = dict(
-                ui_lang=self.enc_val(lang), corpus=self.enc_val(corpora[0]),
-                corpus2=self.enc_val(corpora[1] if len(corpora) > 1 else ''),
-                token_id=token_id, num_tokens=num_tokens,
-                **dict((k, dict((k2, self.enc_val(v2)) for k2, v2 in list(v.items())) if type(v) is dict else self.enc_val(v)
-                        ) for k, v in list(query_args.items())))
-            logging.getLogger(__name__).debug('HTTP Backend args: {0}'.format(args))
+            query_string = self._conf['path'].format(**args)
+        except KeyError as ex:
+            raise BackendException('Failed to build query - value {0} not found'.format(ex))
 
-            try:
-                query_string = self._conf['path'].format(**args)
-            except KeyError as ex:
-                raise BackendException('Failed to build query - value {0} not found'.format(ex))
-
-            connection.request('GET', query_string)
-            return self.process_response(connection)
-        finally:
-            connection.close()
+        return self.send_request(query_string)
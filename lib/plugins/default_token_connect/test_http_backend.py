@@ -0,0 +1,166 @@
+# Copyright (c) 2020 Charles University, Faculty of Arts,
+#                    Institute of the Czech National Corpus
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; version 2
+# dated June, 1991.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.
+
+"""
+Tests of HTTP backends and concurrent provider fetching against a local mock server
+"""
+
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+import unittest
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from socketserver import ThreadingMixIn
+
+from plugins.default_token_connect import DefaultTokenConnect, init_provider
+from plugins.default_token_connect.test_cache_token_connect import MockCorpus
+
+
+class MockRequestHandler(BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        super(MockRequestHandler, self).setup()
+        with self.server.lock:
+            self.server.num_connections += 1
+
+    def do_GET(self):
+        delay, lemma = self.path.strip('/').split('/')
+        time.sleep(float(delay))
+        body = 'response for {0}'.format(lemma).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class MockServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(self):
+        HTTPServer.__init__(self, ('127.0.0.1', 0), MockRequestHandler)
+        self.lock = threading.Lock()
+        self.num_connections = 0
+
+
+def create_provider(ident, port, delay):
+    return init_provider({
+        'ident': ident,
+        'heading': {'en_US': ident},
+        'backend': 'plugins.default_token_connect.backends.HTTPBackend',
+        'frontend': 'plugins.default_token_connect.frontends.RawHtmlFrontend',
+        'conf': {
+            'server': '127.0.0.1',
+            'path': '/%s/{lemma}' % delay,
+            'ssl': False,
+            'port': port,
+            'attrs': ['lemma']
+        }
+    }, ident)
+
+
+def create_sqlite_provider(ident, db_path):
+    return init_provider({
+        'ident': ident,
+        'heading': {'en_US': ident},
+        'backend': 'plugins.default_token_connect.backends.SQLite3Backend',
+        'frontend': 'plugins.default_token_connect.frontends.RawHtmlFrontend',
+        'conf': {
+            'path': db_path,
+            'query': 'SELECT data FROM entry WHERE word = ? AND lemma = ?'
+        }
+    }, ident)
+
+
+class HTTPBackendTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = MockServer()
+        self.server_thread = threading.Thread(target=self.server.serve_forever)
+        self.server_thread.start()
+        port = self.server.server_address[1]
+        self.providers = dict(fast=create_provider('fast', port, 0),
+                              slow1=create_provider('slow1', port, 0.3),
+                              slow2=create_provider('slow2', port, 0.3))
+        self.corpus = MockCorpus({1: 'lemma1', 2: 'lemma2'})
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.server_thread.join()
+        shutil.rmtree(self.tmp_dir)
+
+    def test_keep_alive(self):
+        """
+        repeated requests to the same server should reuse a single connection
+        """
+        backend = self.providers['fast'][0]
+        for token_id in range(5):
+            data, status = backend.fetch(['corpus'], token_id, 1, dict(lemma='lemma1'), 'en_US')
+            self.assertEqual(data, 'response for lemma1')
+            self.assertTrue(status)
+        self.assertEqual(self.server.num_connections, 1)
+
+    def test_parallel_fetch(self):
+        """
+        slow providers should be fetched concurrently with results returned in configured order
+        """
+        tok_conn = DefaultTokenConnect(self.providers, None)
+        t0 = time.time()
+        word, ans = tok_conn.fetch_data([('slow1', False), ('fast', False), ('slow2', False)], self.corpus,
+                                        ['corpus'], 2, 1, 'en_US')
+        self.assertLess(time.time() - t0, 0.55)
+        self.assertEqual([x['heading'] for x in ans], ['slow1', 'fast', 'slow2'])
+        self.assertEqual([x['contents'] for x in ans], [[('__html', 'response for lemma2')]] * 3)
+
+    def test_fetch_timeout(self):
+        """
+        a provider exceeding the time limit should be reported as failed
+        """
+        tok_conn = DefaultTokenConnect(self.providers, None, fetch_timeout=0.1)
+        word, ans = tok_conn.fetch_data([('fast', False), ('slow1', False)], self.corpus,
+                                        ['corpus'], 1, 1, 'en_US')
+        self.assertEqual([x['renderer'] for x in ans], ['raw-html', 'error'])
+
+    def test_parallel_fetch_sqlite(self):
+        """
+        an SQLite provider should work when fetched from worker threads
+        """
+        db_path = os.path.join(self.tmp_dir, 'tc.db')
+        with sqlite3.connect(db_path) as db:
+            db.execute('CREATE TABLE entry (word TEXT, lemma TEXT, data TEXT)')
+            db.execute("INSERT INTO entry VALUES ('lemma2', 'lemma2', 'sqlite entry')")
+        providers = dict(self.providers, sqlite=create_sqlite_provider('sqlite', db_path))
+        tok_conn = DefaultTokenConnect(providers, None)
+        for _ in range(3):
+            word, ans = tok_conn.fetch_data([('sqlite', False), ('fast', False)], self.corpus,
+                                            ['corpus'], 2, 1, 'en_US')
+            self.assertEqual([x['contents'] for x in ans],
+                             [[('__html', 'sqlite entry')], [('__html', 'response for lemma2')]])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -39,6 +39,16 @@ class AbstractExport(object):
     def raw_content(self):
         raise NotImplementedError()
 
+    def pop_content(self):
+        """
+        Return content written since the last call (or since the beginning)
+        and release it from the internal buffer. Writers which are able to produce
+        their output incrementally (e.g. CSV) should implement the method so
+        large data sets can be streamed. The default implementation returns None
+        which means the output is available only via raw_content().
+        """
+        return None
+
     def writerow(self, line_num, *lang_rows):
         raise NotImplementedError()
 
@@ -56,6 +56,11 @@ class CSVExport(AbstractExport):
     def raw_content(self):
         return ''.join(self.csv_buff.rows)
 
+    def pop_content(self):
+        ans = ''.join(self.csv_buff.rows)
+        self.csv_buff.rows = []
+        return ans
+
     def write_ref_headings(self, data):
         self.csv_writer.writerow(data)
 
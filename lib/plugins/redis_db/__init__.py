@@ -27,8 +27,34 @@ required XML: please see config.rng
 """
 
 import json
+import time
 import redis
-from plugins.abstract.general_storage import KeyValueStorage
+from plugins.abstract.general_storage import KeyValueStorage, Subscription
+
+
+class RedisSubscription(Subscription):
+    """
+    A subscription based on Redis PUBLISH/SUBSCRIBE
+    """
+
+    def __init__(self, redis_client, channel):
+        super().__init__()
+        self._pubsub = redis_client.pubsub(ignore_subscribe_messages=True)
+        self._pubsub.subscribe(channel)
+
+    def wait(self, timeout):
+        deadline = time.time() + timeout
+        while True:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return False
+            # please note that get_message() may return None before the timeout
+            # elapses (e.g. in case of an ignored subscribe confirmation message)
+            if self._pubsub.get_message(timeout=remaining) is not None:
+                return True
+
+    def close(self):
+        self._pubsub.close()
 
 
 class RedisDb(KeyValueStorage):
@@ -122,6 +148,18 @@ class RedisDb(KeyValueStorage):
         v = self.redis.hget(key, field)
         return json.loads(v) if v else None
 
+    def hash_get_multi(self, key, fields):
+        """
+        Gets values of multiple fields from a hash table (see Redis HMGET)
+
+        arguments:
+        key -- data access key
+        fields -- a list of hash table entry keys
+        """
+        if len(fields) == 0:
+            return []
+        return [json.loads(v) if v else None for v in self.redis.hmget(key, fields)]
+
     def hash_set(self, key, field, value):
         """
         Puts a value into a hash table stored under the passed key
@@ -252,6 +290,19 @@ class RedisDb(KeyValueStorage):
             new_mapping[name] = json.dumps(mapping[name])
         return self.redis.hmset(key, new_mapping)
 
+    def publish(self, channel, message):
+        """
+        Send a JSON-serialized message to a channel
+        (see Redis PUBLISH)
+        """
+        self.redis.publish(channel, json.dumps(message))
+
+    def subscribe(self, channel):
+        """
+        Subscribe to a channel (see Redis SUBSCRIBE)
+        """
+        return RedisSubscription(self.redis, channel)
+
 
 def create_instance(conf):
     """
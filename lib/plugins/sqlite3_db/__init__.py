@@ -29,20 +29,154 @@ NoSQL engines like MongoDB, CouchDB, Redis etc.
 Please note that this concrete solution is not suitable for environments
 with high concurrency (hundreds or more simultaneous users).
 
-The sqlite3 plugin stores data in a single table called "data" with the following structure:
+Notifications (publish/subscribe) are implemented using a process-local condition
+variable combined with watching the database file for changes (which is the only
+way how to get notified about writes performed by other processes).
+
+The sqlite3 plugin stores data in the following tables:
 CREATE TABLE data (key text PRIMARY KEY, value text, expires integer)
+CREATE TABLE hash_data (key text, field text, value text, PRIMARY KEY (key, field))
+CREATE TABLE list_data (key text, idx integer, value text, PRIMARY KEY (key, idx))
+CREATE TABLE expiry (key text PRIMARY KEY, expires integer)
+
+Hashes and lists are stored with one row per field/item so operations
+on single fields/items do not have to load and rewrite whole objects
+(the 'idx' column of 'list_data' defines only the order of items, not
+their positions). Expiration of hashes and lists is stored in the 'expiry'
+table. Expired data are ignored by reads and removed lazily (once a
+respective key is written to and by a periodic purge). The database
+runs in the WAL mode so readers do not block a writer and vice versa.
+Each write operation is committed separately unless it is performed within
+a batch() block - then all the writes of the block are committed at once
+(with WAL and 'synchronous = NORMAL', a commit does not wait for a disk sync).
+
+Hashes and lists stored in the 'data' table by older versions of the
+plug-in (or via set()) are still readable and they are converted once
+they are modified via hash/list operations.
 """
 
 import threading
 import json
 import time
+import os
+from contextlib import contextmanager
 
 import sqlite3
 
-from plugins.abstract.general_storage import KeyValueStorage
+from plugins.abstract.general_storage import KeyValueStorage, Subscription
 
 thread_local = threading.local()
 
+_channels_lock = threading.Lock()
+
+# channel name => [condition, number of messages published so far, number of subscribers]
+_channels = {}
+
+
+def _acquire_channel(channel):
+    with _channels_lock:
+        if channel not in _channels:
+            _channels[channel] = [threading.Condition(), 0, 0]
+        _channels[channel][2] += 1
+        return _channels[channel]
+
+
+def _release_channel(channel):
+    """
+    Unregister a subscriber. A channel is removed once its last subscriber leaves.
+    """
+    with _channels_lock:
+        ch = _channels.get(channel)
+        if ch is not None:
+            ch[2] -= 1
+            if ch[2] <= 0:
+                del _channels[channel]
+
+
+class FileWatchSubscription(Subscription):
+    """
+    A subscription which is notified either directly by a publisher running
+    within the same process or (with a short delay) by a change of the database
+    file(s) caused by any other process.
+    """
+
+    CHECK_INTERVAL = 0.05
+
+    def __init__(self, db_path, channel):
+        super().__init__()
+        self._watched_files = (db_path, db_path + '-wal')
+        self._channel_name = channel
+        self._channel = _acquire_channel(channel)
+        self._last_stamp = self._files_stamp()
+        self._last_num_msgs = self._channel[1]
+
+    def _files_stamp(self):
+        ans = []
+        for path in self._watched_files:
+            try:
+                st = os.stat(path)
+                ans.append((st.st_mtime_ns, st.st_size))
+            except OSError:
+                ans.append(None)
+        return tuple(ans)
+
+    def wait(self, timeout):
+        deadline = time.time() + timeout
+        cond = self._channel[0]
+        with cond:
+            while True:
+                stamp = self._files_stamp()
+                if stamp != self._last_stamp or self._channel[1] != self._last_num_msgs:
+                    self._last_stamp = stamp
+                    self._last_num_msgs = self._channel[1]
+                    return True
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return False
+                cond.wait(min(remaining, self.CHECK_INTERVAL))
+
+    def close(self):
+        if self._channel is not None:
+            _release_channel(self._channel_name)
+            self._channel = None
+
+
+SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS data (key text PRIMARY KEY, value text, expires integer)',
+    'CREATE TABLE IF NOT EXISTS hash_data (key text, field text, value text, PRIMARY KEY (key, field))',
+    'CREATE TABLE IF NOT EXISTS list_data (key text, idx integer, value text, PRIMARY KEY (key, idx))',
+    'CREATE TABLE IF NOT EXISTS expiry (key text PRIMARY KEY, expires integer)')
+
+# how often (in seconds) a process removes all the expired data
+PURGE_INTERVAL = 300
+
+# max. number of fields queried at once by hash_get_multi (SQLite allows 999 host parameters by default)
+HASH_GET_MULTI_CHUNK_SIZE = 500
+
+
+def _alive(table):
+    """
+    Returns an SQL condition matching non-expired rows of a hash/list table
+    (expects the current time as a parameter)
+    """
+    return ('NOT EXISTS (SELECT 1 FROM expiry WHERE expiry.key = {0}.key '
+            'AND -1 < expiry.expires AND expiry.expires < ?)').format(table)
+
+
+def _list_range(length, from_idx, to_idx):
+    """
+    Transforms redis-like list range (i.e. including the value at the end index)
+    into a (start, stop) pair of non-negative indices.
+    """
+    if to_idx < 0:
+        to_idx = (length + 1 + to_idx)
+        if to_idx < 0:
+            to_idx = -length - 1
+    else:
+        to_idx += 1
+    start, stop = slice(from_idx, to_idx).indices(length)[:2]
+    return start, max(start, stop)
+
 
 class DefaultDb(KeyValueStorage):
     def __init__(self, conf):
@@ -51,90 +185,280 @@ class DefaultDb(KeyValueStorage):
         conf -- a dictionary containing 'settings' module compatible configuration of the plug-in
         """
         self.conf = conf
+        self._last_purge = time.time()
 
     def _conn(self):
         """
         Returns thread-local connection
         """
         if not hasattr(thread_local, 'conn'):
-            thread_local.conn = sqlite3.connect(self.conf.get('default:db_path'))
+            conn = sqlite3.connect(self.conf.get('default:db_path'))
+            conn.execute('PRAGMA journal_mode = WAL')
+            conn.execute('PRAGMA synchronous = NORMAL')
+            self.create_schema(conn)
+            thread_local.conn = conn
         return thread_local.conn
 
-    def _delete_expired(self, key):
-        cursor = self._conn().cursor()
-        cursor.execute('SELECT expires FROM data WHERE key = ?', (key,))
-        ans = cursor.fetchone()
-        if ans and -1 < ans[0] < time.time():
-            cursor.execute('DELETE FROM data WHERE key = ?', (key,))
-            self._conn().commit()
-        return None
+    @contextmanager
+    def _transaction(self):
+        """
+        Returns a context manager providing a connection for a write operation.
+        Outside of a batch, the operation is committed (or rolled back) on exit.
+        Within a batch, it is left to the outermost batch() block.
+        """
+        conn = self._conn()
+        if getattr(thread_local, 'batch_depth', 0) > 0:
+            yield conn
+        else:
+            with conn:
+                yield conn
+
+    @contextmanager
+    def batch(self):
+        """
+        Performs all the write operations of the block (and of nested blocks)
+        in a single transaction committed once the outermost block is left.
+        In case of an error, the whole transaction is rolled back.
+        """
+        depth = getattr(thread_local, 'batch_depth', 0)
+        conn = self._conn()
+        thread_local.batch_depth = depth + 1
+        try:
+            if depth > 0:
+                yield self
+            else:
+                with conn:
+                    yield self
+        finally:
+            thread_local.batch_depth = depth
+
+    @staticmethod
+    def create_schema(conn):
+        """
+        Creates all the tables used by the plug-in (if they do not exist yet)
+        """
+        with conn:
+            for sql in SCHEMA:
+                conn.execute(sql)
+
+    def _purge_expired(self, conn):
+        """
+        Removes all the expired data. To keep writes cheap, this
+        is performed at most once per PURGE_INTERVAL seconds.
+        """
+        now = time.time()
+        if now - self._last_purge < PURGE_INTERVAL:
+            return
+        self._last_purge = now
+        conn.execute('DELETE FROM data WHERE -1 < expires AND expires < ?', (now,))
+        for table in ('hash_data', 'list_data'):
+            conn.execute('DELETE FROM {0} WHERE key IN (SELECT key FROM expiry WHERE -1 < expires AND expires < ?)'
+                         .format(table), (now,))
+        conn.execute('DELETE FROM expiry WHERE -1 < expires AND expires < ?', (now,))
+
+    @staticmethod
+    def _delete_key(conn, key):
+        for table in ('data', 'hash_data', 'list_data', 'expiry'):
+            conn.execute('DELETE FROM {0} WHERE key = ?'.format(table), (key,))
+
+    def _prepare_collection(self, conn, key, is_list):
+        """
+        Prepares a hash (or a list) stored under the key for in-place modification -
+        i.e. expired data are removed and data stored in the 'data' table are
+        converted to respective rows.
+        """
+        self._purge_expired(conn)
+        now = time.time()
+        row = conn.execute('SELECT expires FROM expiry WHERE key = ?', (key,)).fetchone()
+        if row and -1 < row[0] < now:
+            self._delete_key(conn, key)
+        if is_list and conn.execute('SELECT 1 FROM hash_data WHERE key = ? LIMIT 1', (key,)).fetchone():
+            raise TypeError('There is no list with key %s' % key)
+        row = conn.execute('SELECT value, expires FROM data WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return
+        conn.execute('DELETE FROM data WHERE key = ?', (key,))
+        if -1 < row[1] < now:
+            return
+        data = json.loads(row[0])
+        if is_list:
+            if type(data) is not list:
+                raise TypeError('There is no list with key %s' % key)
+            conn.executemany('INSERT INTO list_data (key, idx, value) VALUES (?, ?, ?)',
+                             [(key, i, json.dumps(v)) for i, v in enumerate(data)])
+        elif type(data) is dict:
+            conn.executemany('INSERT OR REPLACE INTO hash_data (key, field, value) VALUES (?, ?, ?)',
+                             [(key, k, json.dumps(v)) for k, v in list(data.items())])
+        if row[1] > -1:
+            conn.execute('INSERT OR REPLACE INTO expiry (key, expires) VALUES (?, ?)', (key, row[1]))
 
     def _load_raw_data(self, key):
-        self._delete_expired(key)
+        """
+        Returns a (value, expires) pair of a non-expired value stored in the 'data' table
+        """
         cursor = self._conn().cursor()
-        cursor.execute('SELECT value, expires FROM data WHERE key = ?', (key,))
-        ans = cursor.fetchone()
-        if ans:
-            return ans
-        return None
+        cursor.execute('SELECT value, expires FROM data WHERE key = ? AND NOT (-1 < expires AND expires < ?)',
+                       (key, time.time()))
+        return cursor.fetchone()
 
-    def _save_raw_data(self, path, data):
+    def _load_stored_list(self, key):
+        """
+        Returns a list stored in the 'data' table (or None if there is no such value)
+        """
+        raw_data = self._load_raw_data(key)
+        if raw_data is None:
+            if self._hash_exists(key):
+                raise TypeError('There is no list with key %s' % key)
+            return None
+        data = json.loads(raw_data[0])
+        if type(data) is not list:
+            raise TypeError('There is no list with key %s' % key)
+        return data
+
+    def _load_stored_hash(self, key):
+        """
+        Returns a hash stored in the 'data' table (or None if there is no such value)
+        """
+        raw_data = self._load_raw_data(key)
+        if raw_data is None:
+            return None
+        data = json.loads(raw_data[0])
+        return data if type(data) is dict else None
+
+    def _hash_exists(self, key):
         cursor = self._conn().cursor()
-        cursor.execute('INSERT OR REPLACE INTO data (key, value, expires) VALUES (?, ?, ?)',
-                       (path, data, -1))
-        self._conn().commit()
+        cursor.execute('SELECT 1 FROM hash_data WHERE key = ? AND ' + _alive('hash_data') + ' LIMIT 1',
+                       (key, time.time()))
+        return cursor.fetchone() is not None
 
-    def rename(self, key, new_key):
-        self._delete_expired(key)
+    def _load_hash(self, key):
+        cursor = self._conn().cursor()
+        cursor.execute('SELECT field, value FROM hash_data WHERE key = ? AND ' + _alive('hash_data'),
+                       (key, time.time()))
+        return dict((field, json.loads(value)) for field, value in cursor.fetchall())
+
+    def _get_expires(self, key):
         cursor = self._conn().cursor()
-        cursor.execute('UPDATE data SET key = ? WHERE key = ?', (new_key, key))
-        self._conn().commit()
+        cursor.execute('SELECT expires FROM expiry WHERE key = ?', (key,))
+        ans = cursor.fetchone()
+        return ans[0] if ans else -1
+
+    def rename(self, key, new_key):
+        with self._transaction() as conn:
+            self._purge_expired(conn)
+            self._delete_key(conn, new_key)
+            for table in ('data', 'hash_data', 'list_data', 'expiry'):
+                conn.execute('UPDATE {0} SET key = ? WHERE key = ?'.format(table), (new_key, key))
 
     def list_get(self, key, from_idx=0, to_idx=-1):
-        data = []
-        raw_data = self._load_raw_data(key)
-        if raw_data is not None:
-            data = json.loads(raw_data[0])
-            if type(data) is not list:
-                raise TypeError('There is no list with key %s' % key)
-            # simulate redis behavior - return values including the one at the end index:
-            if to_idx < 0:
-                to_idx = (len(data) + 1 + to_idx)
-                if to_idx < 0:
-                    to_idx = -len(data) - 1
-            else:
-                to_idx += 1
-            data = data[from_idx:to_idx]
-        return data
+        now = time.time()
+        cursor = self._conn().cursor()
+        if from_idx >= 0 and to_idx == -1:
+            start, limit = from_idx, -1
+        else:
+            start, stop = _list_range(self._list_len(key, now), from_idx, to_idx)
+            limit = stop - start
+        cursor.execute('SELECT value FROM list_data WHERE key = ? AND ' + _alive('list_data') +
+                       ' ORDER BY idx LIMIT ? OFFSET ?', (key, now, limit, start))
+        ans = [json.loads(row[0]) for row in cursor.fetchall()]
+        if len(ans) == 0:
+            data = self._load_stored_list(key)
+            if data is not None:
+                start, stop = _list_range(len(data), from_idx, to_idx)
+                ans = data[start:stop]
+        return ans
 
     def list_append(self, key, value):
-        data = self.list_get(key)
-        data.append(value)
-        self.set(key, data)
+        with self._transaction() as conn:
+            self._prepare_collection(conn, key, is_list=True)
+            conn.execute('INSERT INTO list_data (key, idx, value) '
+                         'VALUES (?, COALESCE((SELECT MAX(idx) FROM list_data WHERE key = ?), -1) + 1, ?)',
+                         (key, key, json.dumps(value)))
 
     def list_pop(self, key):
-        data = self.list_get(key)
-        ans = data.pop(0)
-        self.set(key, data)
-        return ans
+        with self._transaction() as conn:
+            self._prepare_collection(conn, key, is_list=True)
+            row = conn.execute('SELECT idx, value FROM list_data WHERE key = ? ORDER BY idx LIMIT 1',
+                               (key,)).fetchone()
+            if row is None:
+                raise IndexError('pop from empty list')
+            conn.execute('DELETE FROM list_data WHERE key = ? AND idx = ?', (key, row[0]))
+        return json.loads(row[1])
+
+    def _list_len(self, key, now):
+        cursor = self._conn().cursor()
+        cursor.execute('SELECT COUNT(*) FROM list_data WHERE key = ? AND ' + _alive('list_data'), (key, now))
+        return cursor.fetchone()[0]
 
     def list_len(self, key):
-        return len(self.list_get(key))
+        ans = self._list_len(key, time.time())
+        if ans == 0:
+            data = self._load_stored_list(key)
+            ans = len(data) if data is not None else 0
+        return ans
+
+    def _get_list_item_idx(self, conn, key, position):
+        row = conn.execute('SELECT idx FROM list_data WHERE key = ? ORDER BY idx LIMIT 1 OFFSET ?',
+                           (key, position)).fetchone()
+        return row[0] if row else None
 
     def list_set(self, key, idx, value):
-        data = self.list_get(key)
-        data[idx] = value
-        self.set(key, data)
+        with self._transaction() as conn:
+            self._prepare_collection(conn, key, is_list=True)
+            if idx < 0:
+                idx += self._list_len(key, time.time())
+            item_idx = self._get_list_item_idx(conn, key, idx) if idx >= 0 else None
+            if item_idx is None:
+                raise IndexError('list assignment index out of range')
+            conn.execute('UPDATE list_data SET value = ? WHERE key = ? AND idx = ?', (json.dumps(value), key, item_idx))
 
     def list_trim(self, key, keep_left, keep_right):
-        data = self.list_get(key, keep_left, keep_right)
-        self.set(key, data)
+        with self._transaction() as conn:
+            self._prepare_collection(conn, key, is_list=True)
+            start, stop = _list_range(self._list_len(key, time.time()), keep_left, keep_right)
+            if start == stop:
+                conn.execute('DELETE FROM list_data WHERE key = ?', (key,))
+            else:
+                conn.execute('DELETE FROM list_data WHERE key = ? AND (idx < ? OR idx > ?)',
+                             (key, self._get_list_item_idx(conn, key, start),
+                              self._get_list_item_idx(conn, key, stop - 1)))
 
     def hash_get(self, key, field):
-        data = self.get(key)
-        if type(data) is not dict:
-            return {}
-        return data.get(field, None)
+        cursor = self._conn().cursor()
+        cursor.execute('SELECT value FROM hash_data WHERE key = ? AND field = ? AND ' + _alive('hash_data'),
+                       (key, field, time.time()))
+        ans = cursor.fetchone()
+        if ans is not None:
+            return json.loads(ans[0])
+        data = self._load_stored_hash(key)
+        if data is not None:
+            return data.get(field, None)
+        return None if self._hash_exists(key) else {}
+
+    def hash_get_multi(self, key, fields):
+        """
+        Gets values of multiple fields from a hash table. Only the requested
+        rows are loaded (the 'IN' lists are split to stay within the SQLite
+        limit of host parameters).
+
+        arguments:
+        key -- data access key
+        fields -- a list of hash table entry keys
+        """
+        if len(fields) == 0:
+            return []
+        now = time.time()
+        cursor = self._conn().cursor()
+        data = {}
+        uniq_fields = list(set(fields))
+        for i in range(0, len(uniq_fields), HASH_GET_MULTI_CHUNK_SIZE):
+            chunk = uniq_fields[i:i + HASH_GET_MULTI_CHUNK_SIZE]
+            cursor.execute('SELECT field, value FROM hash_data WHERE key = ? AND field IN ({0}) AND {1}'.format(
+                ', '.join('?' * len(chunk)), _alive('hash_data')), [key] + chunk + [now])
+            data.update((field, json.loads(value)) for field, value in cursor.fetchall())
+        if len(data) == 0 and not self._hash_exists(key):
+            data = self._load_stored_hash(key) or {}
+        return [data.get(field, None) for field in fields]
 
     def hash_set(self, key, field, value):
         """
@@ -145,21 +469,20 @@ class DefaultDb(KeyValueStorage):
         field -- hash table entry key
         value -- a value to be stored
         """
-        data = self.get(key)
-        if type(data) is not dict:
-            data = {}
-        data[field] = value
-        self.set(key, data)
+        with self._transaction() as conn:
+            self._prepare_collection(conn, key, is_list=False)
+            conn.execute('DELETE FROM list_data WHERE key = ?', (key,))
+            conn.execute('INSERT OR REPLACE INTO hash_data (key, field, value) VALUES (?, ?, ?)',
+                         (key, field, json.dumps(value)))
 
     def hash_del(self, key, field):
-        sdata = self._load_raw_data(key)
-        data = json.loads(sdata[0])
-        if field in data:
-            del data[field]
-        if len(data):
-            self._save_raw_data(key, json.dumps(data))
-        else:
-            self.remove(key)
+        if not self._hash_exists(key) and self._load_stored_hash(key) is None:
+            return
+        with self._transaction() as conn:
+            self._prepare_collection(conn, key, is_list=False)
+            conn.execute('DELETE FROM hash_data WHERE key = ? AND field = ?', (key, field))
+            if conn.execute('SELECT COUNT(*) FROM hash_data WHERE key = ?', (key,)).fetchone()[0] == 0:
+                conn.execute('DELETE FROM expiry WHERE key = ?', (key,))
 
     def hash_get_all(self, key):
         """
@@ -169,8 +492,10 @@ class DefaultDb(KeyValueStorage):
         arguments:
         key -- data access key
         """
-        sdata = self._load_raw_data(key)
-        return json.loads(sdata[0]) if sdata is not None else {}
+        ans = self._load_hash(key)
+        if len(ans) == 0:
+            ans = self._load_stored_hash(key) or {}
+        return ans
 
     def get(self, key, default=None):
         """
@@ -190,6 +515,13 @@ class DefaultDb(KeyValueStorage):
                 data['__timestamp__'] = raw_data[1]
                 data['__key__'] = key
             return data
+        data = self._load_hash(key)
+        if len(data) > 0:
+            data['__timestamp__'] = self._get_expires(key)
+            data['__key__'] = key
+            return data
+        if self._list_len(key, time.time()) > 0:
+            return self.list_get(key)
         return default
 
     def set(self, key, data):
@@ -205,7 +537,10 @@ class DefaultDb(KeyValueStorage):
                       for k, v in list(data.items()) if not k.startswith('__') and not k.endswith('__'))
         else:
             d2 = data
-        self._save_raw_data(key, json.dumps(d2))
+        with self._transaction() as conn:
+            self._purge_expired(conn)
+            self._delete_key(conn, key)
+            conn.execute('INSERT INTO data (key, value, expires) VALUES (?, ?, ?)', (key, json.dumps(d2), -1))
 
     def remove(self, key):
         """
@@ -214,10 +549,8 @@ class DefaultDb(KeyValueStorage):
         arguments:
         key -- an access key
         """
-        conn = self._conn()
-        cursor = conn.cursor()
-        cursor.execute('DELETE FROM data WHERE key = ?', (key,))
-        conn.commit()
+        with self._transaction() as conn:
+            self._delete_key(conn, key)
 
     def exists(self, key):
         """
@@ -229,9 +562,12 @@ class DefaultDb(KeyValueStorage):
         returns:
         boolean answer
         """
-        self._delete_expired(key)
+        now = time.time()
         cursor = self._conn().cursor()
-        cursor.execute('SELECT COUNT(*) FROM data WHERE key = ?', (key,))
+        cursor.execute('SELECT EXISTS (SELECT 1 FROM data WHERE key = ? AND NOT (-1 < expires AND expires < ?)) '
+                       'OR EXISTS (SELECT 1 FROM hash_data WHERE key = ? AND ' + _alive('hash_data') + ') '
+                       'OR EXISTS (SELECT 1 FROM list_data WHERE key = ? AND ' + _alive('list_data') + ')',
+                       (key, now, key, now, key, now))
         return cursor.fetchone()[0] > 0
 
     def set_ttl(self, key, ttl):
@@ -241,26 +577,28 @@ class DefaultDb(KeyValueStorage):
         arguments:
         key -- data access key
         ttl -- number of seconds to wait before the value is removed
-        (please note that set/update actions reset the timer to zero)
+        (please note that set actions reset the timer to zero)
         """
-        self._delete_expired(key)
-        if self.exists(key):
-            cursor = self._conn().cursor()
-            cursor.execute('UPDATE data SET expires = ? WHERE key = ?', (time.time() + ttl, key))
-            self._conn().commit()
+        if not self.exists(key):
+            return None
+        with self._transaction() as conn:
+            expires = time.time() + ttl
+            if conn.execute('UPDATE data SET expires = ? WHERE key = ?', (expires, key)).rowcount == 0:
+                conn.execute('INSERT OR REPLACE INTO expiry (key, expires) VALUES (?, ?)', (key, expires))
         return None
 
     def get_ttl(self, key):
-        cursor = self._conn().cursor()
-        cursor.execute('SELECT expires FROM data WHERE key = ?', (key,))
-        return cursor.fetchone()[0]
+        raw_data = self._load_raw_data(key)
+        if raw_data is not None:
+            return raw_data[1]
+        return self._get_expires(key)
 
     def clear_ttl(self, key):
-        self._delete_expired(key)
-        if self.exists(key):
-            cursor = self._conn().cursor()
-            cursor.execute('UPDATE data SET expires = -1 WHERE key = ?', (key,))
-            self._conn().commit()
+        if not self.exists(key):
+            return None
+        with self._transaction() as conn:
+            conn.execute('UPDATE data SET expires = -1 WHERE key = ?', (key,))
+            conn.execute('DELETE FROM expiry WHERE key = ?', (key,))
         return None
 
     def incr(self, key, amount=1):
@@ -268,11 +606,12 @@ class DefaultDb(KeyValueStorage):
         Increments the value of 'key' by 'amount'.  If no key exists,
         the value will be initialized as 'amount'
         """
-        val = self.get(key)
-        if val is None:
-            val = 0
-        val += amount
-        self.set(key, val)
+        with self.batch():
+            val = self.get(key)
+            if val is None:
+                val = 0
+            val += amount
+            self.set(key, val)
         return val
 
     def hash_set_map(self, key, mapping):
@@ -280,9 +619,30 @@ class DefaultDb(KeyValueStorage):
         Set key to value within hash 'name' for each corresponding
         key and value from the 'mapping' dict.
         """
-        self.set(key, mapping)
+        with self._transaction() as conn:
+            self._purge_expired(conn)
+            self._delete_key(conn, key)
+            conn.executemany('INSERT INTO hash_data (key, field, value) VALUES (?, ?, ?)',
+                             [(key, k, json.dumps(v)) for k, v in list(mapping.items())])
         return True
 
+    def publish(self, channel, message):
+        """
+        Notify subscribers within the current process directly. Subscribers
+        from other processes are notified by the database file change
+        (i.e. there is no way to pass the message itself to them).
+        """
+        with _channels_lock:
+            ch = _channels.get(channel)
+        if ch is None:  # no subscribers within the current process
+            return
+        with ch[0]:
+            ch[1] += 1
+            ch[0].notify_all()
+
+    def subscribe(self, channel):
+        return FileWatchSubscription(self.conf.get('default:db_path'), channel)
+
 
 def create_instance(conf):
     """
@@ -21,12 +21,15 @@ It is recommended to install Unidecode package (pip install Unidecode)
 """
 
 import re
+import os
 import json
 from functools import wraps
 from hashlib import md5
 from functools import partial
-from collections import defaultdict, OrderedDict, Iterable
+from collections import OrderedDict, Iterable
 import sqlite3
+import threading
+import time
 import logging
 try:
     from unidecode import unidecode
@@ -44,17 +47,45 @@ import strings
 from controller import exposed
 from actions import concordance
 from . import query
+from .bitmap import BitmapIndex
 
 
-CACHE_MAIN_KEY = 'liveattrs_cache:%s'
+CACHE_ENTRY_KEY = 'liveattrs_cache:%s:%s'
+
+# {cache_key: last access time, ...}
+CACHE_INDEX_KEY = 'liveattrs_cache_idx:%s'
+
+# number of cached entries of a corpus (i.e. an upper estimate of the index size)
+CACHE_SIZE_KEY = 'liveattrs_cache_size:%s'
+
+DEFAULT_CACHE_TTL = 3600 * 24
+
+# min. interval (in seconds) between two expiration/access time updates
+# of the same cache entry performed by a single process
+CACHE_TOUCH_INTERVAL = 60
+
+DEFAULT_CACHE_MAX_ENTRIES = 5000
+
+# once the cache limit is exceeded, least recently used entries are evicted
+# until the number of entries drops to this fraction of the limit
+CACHE_EVICTION_RATIO = 0.9
+
+# size of memory-mapped I/O used to read live attributes databases
+DB_MMAP_SIZE = 268435456
 
 
 def create_cache_key(attr_map, max_attr_list_size, aligned_corpora, autocomplete_attr, limit_lists):
     """
-    Generates a cache key based on the relevant parameters.
+    Generates a cache key based on the relevant parameters. The key
+    does not depend on the order of attributes, their values and aligned
+    corpora as neither of them affects the result.
     Returned value is hashed.
     """
-    return md5(f'{attr_map}{max_attr_list_size}{aligned_corpora}{autocomplete_attr}{limit_lists}'.encode('utf-8')).hexdigest()
+    norm_attrs = sorted(((k, sorted(v) if isinstance(v, (list, tuple)) else v) for k, v in attr_map.items()),
+                        key=lambda x: x[0])
+    norm_key = json.dumps([norm_attrs, max_attr_list_size, sorted(aligned_corpora or []), autocomplete_attr,
+                           limit_lists], sort_keys=True)
+    return md5(norm_key.encode('utf-8')).hexdigest()
 
 
 def cached(f):
@@ -66,17 +97,14 @@ def cached(f):
     """
     @wraps(f)
     def wrapper(self, plugin_api, corpus, attr_map, aligned_corpora=None, autocomplete_attr=None, limit_lists=True):
-        if len(attr_map) < 2:
-            key = create_cache_key(attr_map, self.max_attr_list_size, aligned_corpora,
-                                   autocomplete_attr, limit_lists)
-            ans = self.from_cache(corpus.corpname, key)
-            if ans:
-                return ans
+        key = create_cache_key(attr_map, self.max_attr_list_size, aligned_corpora,
+                               autocomplete_attr, limit_lists)
+        ans = self.from_cache(corpus.corpname, key)
+        if ans:
+            ans['aligned'] = aligned_corpora  # the cached entry may come from a differently ordered list
+            return ans
         ans = f(self, plugin_api, corpus, attr_map, aligned_corpora, autocomplete_attr, limit_lists)
-        if len(attr_map) < 2:
-            key = create_cache_key(attr_map, self.max_attr_list_size,
-                                   aligned_corpora, autocomplete_attr, limit_lists)
-            self.to_cache(corpus.corpname, key, ans)
+        self.to_cache(corpus.corpname, key, ans)
         return self.export_num_strings(ans)
     return wrapper
 
@@ -101,40 +129,115 @@ def attr_val_autocomplete(self, request):
                                      autocomplete_attr=request.form['patternAttr'])
 
 
+class ConnectionPool(object):
+    """
+    Provides per-thread read-only connections to live attributes databases.
+    As sqlite3 connections cannot be shared among threads (check_same_thread),
+    each thread opens its own connection to a database once and then reuses it
+    (along with its cache of prepared statements) for all the subsequent queries.
+    """
+
+    def __init__(self, mmap_size=DB_MMAP_SIZE):
+        self._local = threading.local()
+        self._mmap_size = mmap_size
+
+    def _connect(self, db_path):
+        conn = sqlite3.connect(db_path, check_same_thread=True)
+        conn.row_factory = sqlite3.Row
+        conn.create_function('ktx_lower', 1, lambda x: unidecode(x.lower()))
+        conn.execute('PRAGMA query_only = ON')
+        conn.execute('PRAGMA mmap_size = {0}'.format(int(self._mmap_size)))
+        return conn
+
+    def get(self, db_path):
+        """
+        Return a connection to a database specified by db_path owned by the current thread.
+        """
+        connections = getattr(self._local, 'connections', None)
+        if connections is None:
+            connections = {}
+            self._local.connections = connections
+        if db_path not in connections:
+            connections[db_path] = self._connect(db_path)
+        return connections[db_path]
+
+
 class LiveAttributes(AbstractLiveAttributes):
 
     def __init__(self, corparch, db, max_attr_list_size, empty_val_placeholder,
-                 max_attr_visible_chars):
+                 max_attr_visible_chars, cache_ttl=DEFAULT_CACHE_TTL,
+                 cache_max_entries=DEFAULT_CACHE_MAX_ENTRIES, bitmap_index_dir=None):
         self.corparch = corparch
         self.kvdb = db
+        self._cache_ttl = cache_ttl
+        self._cache_max_entries = cache_max_entries
+        self._cache_last_touch = {}
+        self._cache_stats = {}
         self.max_attr_list_size = max_attr_list_size
         self.empty_val_placeholder = empty_val_placeholder
-        self.databases = {}
+        self.db_paths = {}
+        self._db_pool = ConnectionPool()
         self.shorten_value = partial(strings.shorten, nice=True)
         self._max_attr_visible_chars = max_attr_visible_chars
+        self._bitmap_index_dir = bitmap_index_dir
+        self._bitmap_indices = {}
 
     def export_actions(self):
         return {concordance.Actions: [filter_attributes, attr_val_autocomplete]}
 
+    def export_tasks(self):
+        """
+        Export tasks for Celery worker(s)
+        """
+        def build_bitmap_index(corpus_id):
+            """
+            (Re)build a bitmap index (see bitmap.BitmapIndex) of a corpus. The task
+            should be run each time the live attributes database of the corpus changes
+            (until then, the plug-in ignores an outdated index).
+            """
+            db = self.db('en_US', corpus_id)
+            if db is None or not self._bitmap_index_dir:
+                return dict(message='bitmap index not configured for {0}'.format(corpus_id))
+            index = BitmapIndex.build(db, corpus_id)
+            index.save(self._mk_bitmap_index_path(corpus_id))
+            return dict(message='OK', num_items=len(index))
+        return build_bitmap_index,
+
+    def _mk_bitmap_index_path(self, corpus_id):
+        return os.path.join(self._bitmap_index_dir, '{0}.npz'.format(corpus_id.replace('/', '__')))
+
+    def _get_bitmap_index(self, user_lang, corpname):
+        """
+        Returns a bitmap index of a corpus or None if there is no up to date
+        index available (i.e. the database must be used).
+        """
+        if not self._bitmap_index_dir or self.db(user_lang, corpname) is None:
+            return None
+        index_path = self._mk_bitmap_index_path(corpname)
+        try:
+            index_mtime = os.path.getmtime(index_path)
+            if index_mtime < os.path.getmtime(self.db_paths[corpname]):
+                return None
+        except OSError:
+            return None
+        if corpname not in self._bitmap_indices or self._bitmap_indices[corpname][0] != index_mtime:
+            self._bitmap_indices[corpname] = (index_mtime, BitmapIndex.load(index_path))
+        return self._bitmap_indices[corpname][1]
+
     def db(self, user_lang, corpname):
         """
         Returns thread-local database connection to a sqlite3 database
+        (or None if there is no database configured for the corpus)
 
         arguments:
         user_lang -- user language (e.g. en_US)
         corpname -- corpus id
         """
-        if corpname not in self.databases:
-            db_path = self.corparch.get_corpus_info(
+        if corpname not in self.db_paths:
+            self.db_paths[corpname] = self.corparch.get_corpus_info(
                 user_lang, corpname).get('metadata', {}).get('database')
-            if db_path:
-                self.databases[corpname] = sqlite3.connect(db_path)
-                self.databases[corpname].row_factory = sqlite3.Row
-                self.databases[corpname].create_function(
-                    'ktx_lower', 1, lambda x: unidecode(x.lower()))
-            else:
-                self.databases[corpname] = None
-        return self.databases[corpname]
+        db_path = self.db_paths[corpname]
+        return self._db_pool.get(db_path) if db_path else None
 
     def is_enabled_for(self, plugin_api, corpname):
         """
@@ -168,7 +271,10 @@ class LiveAttributes(AbstractLiveAttributes):
         """
         Loads a value from cache. The key is whole attribute_map as selected
         by a user. But there is no guarantee that all the keys and values will be
-        used as a key.
+        used as a key. A found entry has its expiration time and access time
+        (used for LRU eviction) refreshed (at most once per CACHE_TOUCH_INTERVAL
+        by a single process). Cache hits and misses are counted within the process
+        only (see get_cache_stats()) so a lookup does not write into the storage.
 
         arguments:
         key -- a cache key
@@ -176,20 +282,76 @@ class LiveAttributes(AbstractLiveAttributes):
         returns:
         a stored value matching provided argument or None if nothing is found
         """
-        v = self.kvdb.hash_get(CACHE_MAIN_KEY % (corpname,), key)
-        return LiveAttributes.export_num_strings(v) if v else None
+        entry_key = CACHE_ENTRY_KEY % (corpname, key)
+        v = self.kvdb.get(entry_key)
+        if v:
+            self._touch_cache_entry(corpname, key)
+            self._count_cache_access(corpname, 'hits')
+            return LiveAttributes.export_num_strings(v)
+        self._count_cache_access(corpname, 'misses')
+        return None
+
+    def _count_cache_access(self, corpname, result):
+        stats = self._cache_stats.setdefault(corpname, dict(hits=0, misses=0))
+        stats[result] += 1
+
+    def _touch_cache_entry(self, corpname, key):
+        now = time.time()
+        if now - self._cache_last_touch.get((corpname, key), 0) < CACHE_TOUCH_INTERVAL:
+            return
+        if len(self._cache_last_touch) >= self._cache_max_entries:
+            self._cache_last_touch = {}
+        self._cache_last_touch[(corpname, key)] = now
+        with self.kvdb.batch():
+            index_key = CACHE_INDEX_KEY % (corpname,)
+            self.kvdb.set_ttl(CACHE_ENTRY_KEY % (corpname, key), self._cache_ttl)
+            self.kvdb.hash_set(index_key, key, now)
+            self.kvdb.set_ttl(index_key, self._cache_ttl)
 
     def to_cache(self, corpname, key, values):
         """
         Stores a data object "values" into the cache. The key is whole attribute_map as selected
         by a user. But there is no guarantee that all the keys and values will be
-        used as a key.
+        used as a key. In case the number of cached entries of the corpus exceeds
+        the configured limit, least recently used entries are removed until
+        the number drops to CACHE_EVICTION_RATIO of the limit (i.e. the whole
+        index is read and sorted only once per many inserts). All the writes
+        are performed as a single storage batch.
 
         arguments:
         key -- a cache key
         values -- a dictionary with arbitrary nesting level
         """
-        self.kvdb.hash_set(CACHE_MAIN_KEY % (corpname,), key, values)
+        with self.kvdb.batch():
+            entry_key = CACHE_ENTRY_KEY % (corpname, key)
+            self.kvdb.set(entry_key, values)
+            self.kvdb.set_ttl(entry_key, self._cache_ttl)
+            index_key = CACHE_INDEX_KEY % (corpname,)
+            is_new = self.kvdb.hash_get(index_key, key) is None
+            now = time.time()
+            self._cache_last_touch[(corpname, key)] = now
+            self.kvdb.hash_set(index_key, key, now)
+            self.kvdb.set_ttl(index_key, self._cache_ttl)
+            if not is_new:
+                return
+            size_key = CACHE_SIZE_KEY % (corpname,)
+            size = self.kvdb.incr(size_key)
+            self.kvdb.set_ttl(size_key, self._cache_ttl)
+            if size > self._cache_max_entries:
+                index = self.kvdb.hash_get_all(index_key) or {}
+                num_evicted = max(0, len(index) - int(self._cache_max_entries * CACHE_EVICTION_RATIO))
+                for k, _ in sorted(index.items(), key=lambda x: x[1])[:num_evicted]:
+                    self.kvdb.remove(CACHE_ENTRY_KEY % (corpname, k))
+                    self.kvdb.hash_del(index_key, k)
+                self.kvdb.set(size_key, len(index) - num_evicted)
+                self.kvdb.set_ttl(size_key, self._cache_ttl)
+
+    def get_cache_stats(self, corpname):
+        """
+        Returns numbers of cache hits and misses for a corpus
+        as counted by the current process.
+        """
+        return dict(self._cache_stats.get(corpname, dict(hits=0, misses=0)))
 
     @staticmethod
     def export_key(k):
@@ -238,6 +400,12 @@ class LiveAttributes(AbstractLiveAttributes):
         return [id_attr.split('.')[0]] if id_attr else []
 
     def get_subc_size(self, plugin_api, corpus, attr_map):
+        bitmap_index = self._get_bitmap_index(plugin_api.user_lang, corpus.corpname)
+        if bitmap_index is not None:
+            mask = bitmap_index.create_mask(
+                [[(self.import_key(k), v) for v in vlist] for k, vlist in list(attr_map.items()) if len(vlist) > 0])
+            if mask is not None:
+                return bitmap_index.sum_poscount(mask)
         db = self.db(plugin_api.user_lang, corpus.corpname)
         attr_where = [corpus.corpname]
         attr_where_tmpl = ['corpus_id = ?']
@@ -294,45 +462,51 @@ class LiveAttributes(AbstractLiveAttributes):
                                            aligned_corpora=aligned_corpora,
                                            autocomplete_attr=self.import_key(autocomplete_attr),
                                            empty_val_placeholder=self.empty_val_placeholder)
-        data_iterator = query.DataIterator(
-            self.db(plugin_api.user_lang, corpus.corpname), query_builder)
+        data_iterator = self._find_in_bitmap_index(plugin_api.user_lang, corpus.corpname, query_builder,
+                                                   aligned_corpora)
+        if data_iterator is None:
+            data_iterator = query.DataIterator(
+                self.db(plugin_api.user_lang, corpus.corpname), query_builder)
 
         # initialize result dictionary
         ans = dict((attr, set()) for attr in srch_attrs)
         ans['poscount'] = 0
 
-        # 1) values collected one by one are collected in tmp_ans and then moved to 'ans' with some exporting tweaks
-        # 2) in case of values exceeding max. allowed list size we just accumulate their size directly to ans[attr]
-        # {attr_id: {attr_val: num_positions,...},...}
-        tmp_ans = defaultdict(lambda: defaultdict(lambda: 0))
         shorten_val = partial(self.shorten_value,
                               length=self.calc_max_attr_val_visible_chars(corpus_info))
-        bib_id = self.import_key(corpus_info.metadata.id_attr)
-
-        # here we iterate through [(row1, key1), (row1, key2),..., (row1, keyM), (row2, key1), (row2, key2),...]
-        for row, col_key in data_iterator:
-            if type(ans[col_key]) is set:
-                val_ident = row[bib_id] if col_key == bib_label else row[col_key]
-                attr_val = (shorten_val(str(row[col_key])),
-                            val_ident, row[col_key], 1)  # 1 = grouping
-                tmp_ans[col_key][attr_val] += row['poscount']
-            elif type(ans[col_key]) is int:
-                # we rely on proper 'ans' initialization here (in terms of types)
-                ans[col_key] += int(row[col_key])
-        # here we append position count information to the respective items
-        for attr, v in list(tmp_ans.items()):
-            for k, c in list(v.items()):
-                ans[attr].add(k + (c,))
+
+        # here we iterate through values already aggregated by the database:
+        # [(attr1, val1, ident1, poscount1), (attr1, val2, ident2, poscount2),..., ('poscount', None, None, total)]
+        for col_key, value, val_ident, poscount in data_iterator:
+            if col_key == 'poscount':
+                ans[col_key] = int(poscount) if poscount is not None else 0
+            else:
+                ans[col_key].add((shorten_val(str(value)), val_ident, value, 1, poscount))  # 1 = grouping
         # now each line contains: (shortened_label, identifier, label, num_grouped_items, num_positions)
         # where num_grouped_items is initialized to 1
         if corpus_info.metadata.group_duplicates:
             self._group_bib_items(ans, bib_label)
-        tmp_ans.clear()
         return self._export_attr_values(data=ans, aligned_corpora=aligned_corpora,
                                         expand_attrs=expand_attrs,
                                         collator_locale=corpus_info.collator_locale,
                                         max_attr_list_size=self.max_attr_list_size if limit_lists else None)
 
+    def _find_in_bitmap_index(self, user_lang, corpname, query_builder, aligned_corpora):
+        """
+        Try to evaluate a query using a bitmap index. Returns aggregated rows in the
+        same form as query.DataIterator or None if there is no index available or the
+        query cannot be evaluated by the index (e.g. in case of patterns).
+        """
+        bitmap_index = self._get_bitmap_index(user_lang, corpname)
+        if bitmap_index is None:
+            return None
+        conditions = query_builder.create_conditions()
+        aggregated_attrs = query_builder.get_aggregated_attrs()
+        if conditions is None or not bitmap_index.has_attrs(a for attr in aggregated_attrs for a in attr):
+            return None
+        mask = bitmap_index.create_mask(conditions, aligned_corpora or ())
+        return bitmap_index.aggregate(mask, aggregated_attrs) if mask is not None else None
+
     def _export_attr_values(self, data, aligned_corpora, expand_attrs, collator_locale, max_attr_list_size):
         values = {}
         exported = dict(attr_values=values, aligned=aligned_corpora)
@@ -390,4 +564,8 @@ def create_instance(settings, corparch, db):
                           max_attr_list_size=settings.get_int('global', 'max_attr_list_size'),
                           empty_val_placeholder=settings.get(
                               'corpora', 'empty_attr_value_placeholder'),
-                          max_attr_visible_chars=int(la_settings.get('ucnk:max_attr_visible_chars', 20)))
+                          max_attr_visible_chars=int(la_settings.get('ucnk:max_attr_visible_chars', 20)),
+                          cache_ttl=int(la_settings.get('ucnk:cache_ttl', DEFAULT_CACHE_TTL)),
+                          cache_max_entries=int(la_settings.get('ucnk:cache_max_entries',
+                                                                DEFAULT_CACHE_MAX_ENTRIES)),
+                          bitmap_index_dir=la_settings.get('ucnk:bitmap_index_dir', None))
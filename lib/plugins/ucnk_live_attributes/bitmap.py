@@ -0,0 +1,224 @@
+# Copyright (c) 2020 Charles University, Faculty of Arts,
+#                    Institute of the Czech National Corpus
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; version 2
+# dated June, 1991.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.
+
+"""
+An optional precomputed index of the live attributes database allowing
+evaluation of attribute selections without querying the database.
+
+For each corpus, the index stores item rows in a columnar form: each
+attribute column is an array of value codes (0 = NULL) along with a list
+of respective values. Along with the 'poscount' column and bitmaps of
+items present in other (aligned) corpora, this allows to evaluate
+a selection as a set of vectorized bitmap operations.
+"""
+
+import json
+import os
+
+import numpy as np
+
+# columns of the 'item' table which are not indexed as attributes
+NON_ATTR_COLUMNS = ('id', 'item_id', 'corpus_id', 'poscount')
+
+FETCH_SIZE = 10000
+
+
+class BitmapIndex(object):
+
+    def __init__(self, corpus_id, poscount, columns, values, aligned):
+        """
+        arguments:
+        corpus_id -- an identifier of the corpus the index belongs to
+        poscount -- an array of numbers of positions of items
+        columns -- a dict {attr: array of value codes (0 = NULL)}
+        values -- a dict {attr: [None, value1, value2,...]} (indices = value codes)
+        aligned -- a dict {corpus_id: bool array of items present in the corpus}
+        """
+        self.corpus_id = corpus_id
+        self._poscount = poscount
+        self._columns = columns
+        self._values = values
+        self._aligned = aligned
+        self._lookup = {}
+
+    def __len__(self):
+        return len(self._poscount)
+
+    @staticmethod
+    def build(db, corpus_id):
+        """
+        Build an index of a corpus from a live attributes database
+
+        arguments:
+        db -- a sqlite3 connection
+        corpus_id -- a corpus identifier
+        """
+        cursor = db.cursor()
+        attrs = [row[1] for row in cursor.execute('PRAGMA table_info(\'item\')').fetchall()
+                 if row[1] not in NON_ATTR_COLUMNS]
+        values = dict((attr, [None]) for attr in attrs)
+        value_codes = dict((attr, {}) for attr in attrs)
+        codes = dict((attr, []) for attr in attrs)
+        item_ids = []
+        poscount = []
+        cursor.execute('SELECT item_id, poscount, {0} FROM item WHERE corpus_id = ? ORDER BY id'.format(
+            ', '.join(attrs)), (corpus_id,))
+        while True:
+            rows = cursor.fetchmany(FETCH_SIZE)
+            if not rows:
+                break
+            for row in rows:
+                item_ids.append(row[0])
+                poscount.append(row[1] if row[1] is not None else 0)
+                for i, attr in enumerate(attrs, 2):
+                    v = row[i]
+                    if v is None:
+                        codes[attr].append(0)
+                        continue
+                    code = value_codes[attr].get(v)
+                    if code is None:
+                        code = len(values[attr])
+                        value_codes[attr][v] = code
+                        values[attr].append(v)
+                    codes[attr].append(code)
+        aligned = {}
+        for row in cursor.execute('SELECT DISTINCT corpus_id FROM item WHERE corpus_id <> ?', (corpus_id,)).fetchall():
+            corp_items = set(x[0] for x in db.execute('SELECT item_id FROM item WHERE corpus_id = ?', (row[0],)))
+            aligned[row[0]] = np.array([iid is not None and iid in corp_items for iid in item_ids], dtype=bool)
+        return BitmapIndex(corpus_id=corpus_id,
+                           poscount=np.array(poscount, dtype=np.int64),
+                           columns=dict((attr, np.array(codes[attr], dtype=np.int32)) for attr in attrs),
+                           values=values,
+                           aligned=aligned)
+
+    def save(self, path):
+        """
+        Save the index to a file. The file is replaced atomically so
+        readers never encounter a partially written index.
+        """
+        columns = list(self._columns.keys())
+        aligned = list(self._aligned.keys())
+        meta = dict(corpus_id=self.corpus_id, columns=columns, values=self._values, aligned=aligned)
+        arrays = dict(meta=np.array(json.dumps(meta)), poscount=self._poscount)
+        for i, attr in enumerate(columns):
+            arrays['col{0}'.format(i)] = self._columns[attr]
+        for i, corp in enumerate(aligned):
+            arrays['aligned{0}'.format(i)] = np.packbits(self._aligned[corp])
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as fw:
+            np.savez_compressed(fw, **arrays)
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def load(path):
+        with np.load(path) as data:
+            meta = json.loads(data['meta'].item())
+            poscount = data['poscount']
+            columns = dict((attr, data['col{0}'.format(i)]) for i, attr in enumerate(meta['columns']))
+            aligned = dict((corp, np.unpackbits(data['aligned{0}'.format(i)])[:len(poscount)].astype(bool))
+                           for i, corp in enumerate(meta['aligned']))
+        return BitmapIndex(corpus_id=meta['corpus_id'], poscount=poscount, columns=columns,
+                           values=meta['values'], aligned=aligned)
+
+    def has_attrs(self, attrs):
+        return all(attr in self._columns for attr in attrs)
+
+    def _get_lookup(self, attr):
+        """
+        Return a dict {str(value): [code1, code2,...]} for an attribute. String values
+        are used as keys as selected values are always strings while the database may
+        return numbers for some columns.
+        """
+        if attr not in self._lookup:
+            lookup = {}
+            for code, v in enumerate(self._values[attr][1:], 1):
+                lookup.setdefault(str(v), []).append(code)
+            self._lookup[attr] = lookup
+        return self._lookup[attr]
+
+    def create_mask(self, conditions, aligned_corpora=()):
+        """
+        Create a bitmap of items matching provided conditions
+
+        arguments:
+        conditions -- a list of alternatives [[(attr, value), (attr, value),...],...]
+                      (see query.AttrArgs.export_conditions())
+        aligned_corpora -- a list of corpora matching items must be present in
+
+        returns:
+        a bool array or None if the index cannot evaluate the conditions
+        """
+        mask = np.ones(len(self), dtype=bool)
+        for alternatives in conditions:
+            if not self.has_attrs(attr for attr, _ in alternatives):
+                return None
+            selected = {}
+            for attr, value in alternatives:
+                sel = selected.setdefault(attr, np.zeros(len(self._values[attr]), dtype=bool))
+                sel[self._get_lookup(attr).get(str(value), [])] = True
+            alt_mask = np.zeros(len(self), dtype=bool)
+            for attr, sel in selected.items():
+                alt_mask |= sel[self._columns[attr]]
+            mask &= alt_mask
+        for corp in aligned_corpora:
+            if corp in self._aligned:
+                mask &= self._aligned[corp]
+            else:
+                mask[:] = False
+        return mask
+
+    def sum_poscount(self, mask):
+        """
+        Return total number of positions of selected items (or None if
+        nothing is selected - just like SQL SUM)
+        """
+        return int(self._poscount[mask].sum()) if mask.any() else None
+
+    def aggregate(self, mask, attrs):
+        """
+        Aggregate numbers of positions of distinct attribute values of selected items.
+        The result has the same form as rows produced by query.DataIterator.
+
+        arguments:
+        mask -- a bitmap of selected items (see create_mask())
+        attrs -- a list of pairs (attr, ident_attr) (see query.QueryBuilder.get_aggregated_attrs())
+
+        returns:
+        a list [(attr, value, ident, poscount),..., ('poscount', None, None, total)]
+        """
+        ans = []
+        sel_poscount = self._poscount[mask]
+        for attr, ident_attr in attrs:
+            codes = self._columns[attr][mask]
+            values = self._values[attr]
+            if ident_attr == attr:
+                counts = np.bincount(codes, minlength=len(values))
+                sums = np.bincount(codes, weights=sel_poscount, minlength=len(values))
+                for code in np.nonzero(counts[1:])[0] + 1:
+                    ans.append((attr, values[code], values[code], int(sums[code])))
+            else:
+                ident_values = self._values[ident_attr]
+                valid = codes > 0
+                pairs = codes[valid].astype(np.int64) * len(ident_values) + self._columns[ident_attr][mask][valid]
+                uniq_pairs, inverse = np.unique(pairs, return_inverse=True)
+                sums = np.bincount(inverse, weights=sel_poscount[valid], minlength=len(uniq_pairs))
+                for pair, s in zip(uniq_pairs, sums):
+                    code, ident_code = divmod(int(pair), len(ident_values))
+                    ans.append((attr, values[code], ident_values[ident_code], int(s)))
+        ans.append(('poscount', None, None, self.sum_poscount(mask)))
+        return ans
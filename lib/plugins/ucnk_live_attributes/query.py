@@ -94,6 +94,36 @@ class AttrArgs(object):
         sql_values.append(corpus_id)
         return ' AND '.join(where), sql_values
 
+    def export_conditions(self):
+        """
+        Exports data as a list of alternatives (the alternatives are in conjunction):
+        [[(column, value), (column, value),...],...]. Only exact value matches
+        can be exported this way.
+
+        returns:
+        a list of alternatives or None if there is a selection which cannot
+        be expressed as exact matching of values (patterns, ranges)
+        """
+        ans = []
+        for key, values in list(self.data.items()):
+            if type(values) is not list and type(values) is not tuple:
+                return None
+            key = key.replace('.', '_')
+            if key == self._bib_label and self._bib_label != self._autocomplete_attr:
+                key = self._bib_id
+            alternatives = []
+            for value in values:
+                if len(value) > 0 and value[0] == '@':
+                    column, value = self._bib_label, value[1:]
+                else:
+                    column = key
+                if '%' in value:
+                    return None
+                alternatives.append((column, self.import_value(value)))
+            if len(alternatives) > 0:
+                ans.append(alternatives)
+        return ans
+
 
 class QueryComponents(object):
     def __init__(self, sql_template, selected_attrs, hidden_attrs, where_values):
@@ -115,22 +145,41 @@ class QueryBuilder(object):
 
     @staticmethod
     def apply_prefix(values, prefix):
-        return ['%s.%s' % (prefix, v) for v in values]
+        return ['%s.%s AS %s' % (prefix, v, v) for v in values]
 
     # TODO redundant
     @staticmethod
     def import_key(k):
         return k.replace('.', '_', 1) if k is not None else k
 
-    def create_sql(self):
+    def _create_attr_args(self):
+        return AttrArgs(data=self._attr_map,
+                        bib_id=self.import_key(self._corpus_info.metadata.id_attr),
+                        bib_label=self.import_key(self._corpus_info.metadata.label_attr),
+                        autocomplete_attr=self._autocomplete_attr,
+                        empty_val_placeholder=self._empty_val_placeholder)
+
+    def create_conditions(self):
+        """
+        Export the selection as a list of alternatives (see AttrArgs.export_conditions())
+        """
+        return self._create_attr_args().export_conditions()
+
+    def get_aggregated_attrs(self):
+        """
+        Returns a list of pairs (attr, ident_attr) of attributes whose values
+        are aggregated (see create_aggregation_sql()). The ident_attr is a bibliography
+        item ID attribute in case of the bibliography label attribute and attr itself
+        otherwise.
+        """
         bib_id = self.import_key(self._corpus_info.metadata.id_attr)
         bib_label = self.import_key(self._corpus_info.metadata.label_attr)
-        attr_items = AttrArgs(data=self._attr_map,
-                              bib_id=bib_id,
-                              bib_label=bib_label,
-                              autocomplete_attr=self._autocomplete_attr,
-                              empty_val_placeholder=self._empty_val_placeholder)
-        where_sql, where_values = attr_items.export_sql('t1', self._corpus_info.id)
+        return [(attr, bib_id if attr == bib_label and bib_id else attr)
+                for attr in self._srch_attrs if attr != 'poscount']
+
+    def create_sql(self):
+        bib_id = self.import_key(self._corpus_info.metadata.id_attr)
+        where_sql, where_values = self._create_attr_args().export_sql('t1', self._corpus_info.id)
         join_sql = []
         i = 2
         for item in self._aligned_corpora:
@@ -154,24 +203,51 @@ class QueryBuilder(object):
                            % (', '.join(self.apply_prefix(selected_attrs, 't1')), ' '.join(join_sql))
         return QueryComponents(sql_template, selected_attrs, hidden_attrs, where_values)
 
+    def create_aggregation_sql(self):
+        """
+        Create a query which calculates numbers of positions of all the distinct
+        values of all the selected (non-hidden) attributes at once. Rows have
+        the form (attr, value, ident, poscount) where 'ident' is a bibliography
+        item ID in case of the bibliography label attribute and the value itself
+        otherwise. The 'poscount' attribute is represented by a single row
+        containing the total number of positions.
+        """
+        qc = self.create_sql()
+        aggregations = []
+        for attr, ident in self.get_aggregated_attrs():
+            aggregations.append(
+                "SELECT '{0}', {0}, {1}, SUM(poscount) FROM sel WHERE {0} IS NOT NULL GROUP BY {0}, {1}".format(
+                    attr, ident))
+        if 'poscount' in qc.selected_attrs:
+            aggregations.append("SELECT 'poscount', NULL, NULL, SUM(poscount) FROM sel")
+        sql_template = 'WITH sel AS ({0}) {1}'.format(qc.sql_template, ' UNION ALL '.join(aggregations))
+        return QueryComponents(sql_template, qc.selected_attrs, qc.hidden_attrs, qc.where_values)
+
 
 class DataIterator(object):
     """
-    This object represents an iterator which
-    goes through cartesian product of all the selected
-    lines and selected column names:
+    This object represents an iterator which goes through
+    aggregated values of all the selected attributes
+    (see QueryBuilder.create_aggregation_sql()):
+
+    [(attr1, value1, ident1, poscount1), (attr1, value2, ident2, poscount2), ..., ('poscount', None, None, total)]
 
-    [(row1, key1), (row1, key2), ..., (row1, keyM), (row2, key1), (row2, key2), ..., (rowN, keyM)]
+    Rows are fetched from the database in chunks of FETCH_SIZE items.
     """
 
+    FETCH_SIZE = 1000
+
     def __init__(self, db, query_builder):
         self._db = db
         self._query_builder = query_builder
 
     def __iter__(self):
-        qc = self._query_builder.create_sql()
+        qc = self._query_builder.create_aggregation_sql()
         cursor = self._db.cursor()
-        for item in cursor.execute(qc.sql_template, qc.where_values).fetchall():
-            for attr in qc.selected_attrs:
-                if item[attr] is not None and attr not in qc.hidden_attrs:
-                    yield item, attr
+        cursor.execute(qc.sql_template, qc.where_values)
+        while True:
+            rows = cursor.fetchmany(self.FETCH_SIZE)
+            if not rows:
+                break
+            for row in rows:
+                yield tuple(row)
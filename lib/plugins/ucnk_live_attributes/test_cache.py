@@ -0,0 +1,108 @@
+# Copyright (c) 2020 Charles University, Faculty of Arts,
+#                    Institute of the Czech National Corpus
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; version 2
+# dated June, 1991.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.
+
+"""
+Unittests for the ucnk_live_attributes cache
+"""
+import unittest
+from contextlib import contextmanager
+
+from plugins.ucnk_live_attributes import LiveAttributes, CACHE_INDEX_KEY
+
+
+class DummyKvdb(object):
+    """
+    A minimal in-memory key-value storage recording called write operations
+    """
+
+    def __init__(self):
+        self.data = {}
+        self.writes = []
+        self.num_hash_get_all = 0
+        self.num_batches = 0
+
+    @contextmanager
+    def batch(self):
+        self.num_batches += 1
+        yield self
+
+    def get(self, key, default=None):
+        return self.data.get(key, default)
+
+    def set(self, key, data):
+        self.writes.append(('set', key))
+        self.data[key] = data
+
+    def remove(self, key):
+        self.writes.append(('remove', key))
+        self.data.pop(key, None)
+
+    def incr(self, key, amount=1):
+        self.writes.append(('incr', key))
+        self.data[key] = self.data.get(key, 0) + amount
+        return self.data[key]
+
+    def set_ttl(self, key, ttl):
+        self.writes.append(('set_ttl', key))
+
+    def hash_get(self, key, field):
+        return self.data.get(key, {}).get(field)
+
+    def hash_set(self, key, field, value):
+        self.writes.append(('hash_set', key))
+        self.data.setdefault(key, {})[field] = value
+
+    def hash_del(self, key, field):
+        self.writes.append(('hash_del', key))
+        self.data.get(key, {}).pop(field, None)
+
+    def hash_get_all(self, key):
+        self.num_hash_get_all += 1
+        return dict(self.data.get(key, {}))
+
+
+class LiveAttributesCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.kvdb = DummyKvdb()
+        self.lattr = LiveAttributes(corparch=None, db=self.kvdb, max_attr_list_size=10, empty_val_placeholder='',
+                                    max_attr_visible_chars=20, cache_max_entries=10)
+
+    def test_eviction_in_batches(self):
+        for i in range(11):
+            self.lattr.to_cache('c1', 'k{0}'.format(i), {'v': i})
+        self.assertEqual(self.kvdb.num_hash_get_all, 1)
+        self.assertEqual(self.kvdb.num_batches, 11)
+        self.assertEqual(sorted(self.kvdb.data[CACHE_INDEX_KEY % ('c1',)].keys()),
+                         sorted('k{0}'.format(i) for i in range(2, 11)))
+        self.assertIsNone(self.lattr.from_cache('c1', 'k0'))
+        self.lattr.to_cache('c1', 'k11', {'v': 11})
+        self.assertEqual(self.kvdb.num_hash_get_all, 1)
+
+    def test_lookup_does_not_write(self):
+        self.lattr.to_cache('c1', 'k0', {'v': 0})
+        num_writes = len(self.kvdb.writes)
+        self.assertEqual(self.lattr.from_cache('c1', 'k0'), {'v': 0})
+        self.assertIsNone(self.lattr.from_cache('c1', 'k1'))
+        self.assertEqual(len(self.kvdb.writes), num_writes)
+        self.assertEqual(self.lattr.get_cache_stats('c1'), dict(hits=1, misses=1))
+        self.assertEqual(self.lattr.get_cache_stats('c2'), dict(hits=0, misses=0))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+# Copyright (c) 2020 Charles University, Faculty of Arts,
+#                    Institute of the Czech National Corpus
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; version 2
+# dated June, 1991.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.
+
+"""
+Unittests for the ucnk_live_attributes query module
+"""
+import unittest
+import sqlite3
+from types import SimpleNamespace
+
+from plugins.ucnk_live_attributes.query import QueryBuilder, DataIterator
+from plugins.ucnk_live_attributes.bitmap import BitmapIndex
+
+
+class LiveAttrsDbTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.db = sqlite3.connect(':memory:')
+        self.db.row_factory = sqlite3.Row
+        self.db.create_function('ktx_lower', 1, lambda x: x.lower())
+        self.db.execute('CREATE TABLE item (id INTEGER PRIMARY KEY, item_id TEXT, corpus_id TEXT, doc_id TEXT, '
+                        'doc_title TEXT, doc_genre TEXT, poscount INTEGER)')
+        rows = [('i1', 'c1', 'd1', 'Foo', 'fiction', 10),
+                ('i2', 'c1', 'd2', 'Foo', 'fiction', 20),
+                ('i3', 'c1', 'd3', 'Bar', None, 5),
+                ('i4', 'c2', 'd4', 'Baz', 'news', 7)]
+        self.db.executemany('INSERT INTO item (item_id, corpus_id, doc_id, doc_title, doc_genre, poscount) '
+                            'VALUES (?, ?, ?, ?, ?, ?)', rows)
+        self.corpus_info = SimpleNamespace(id='c1', metadata=SimpleNamespace(id_attr='doc.id',
+                                                                             label_attr='doc.title'))
+
+    def tearDown(self):
+        self.db.close()
+
+    def _create_builder(self, attr_map):
+        return QueryBuilder(corpus_info=self.corpus_info, attr_map=attr_map,
+                            srch_attrs={'doc_title', 'doc_genre', 'poscount'}, aligned_corpora=[],
+                            autocomplete_attr=None, empty_val_placeholder='===')
+
+
+class DataIteratorTest(LiveAttrsDbTestCase):
+
+    def test_aggregation(self):
+        ans = sorted(DataIterator(self.db, self._create_builder({})), key=lambda x: (x[0], str(x[1]), str(x[2])))
+        self.assertEqual(ans, [('doc_genre', 'fiction', 'fiction', 30),
+                               ('doc_title', 'Bar', 'd3', 5),
+                               ('doc_title', 'Foo', 'd1', 10),
+                               ('doc_title', 'Foo', 'd2', 20),
+                               ('poscount', None, None, 35)])
+
+    def test_aggregation_with_filter(self):
+        ans = sorted(DataIterator(self.db, self._create_builder({'doc.genre': ['fiction']})),
+                     key=lambda x: (x[0], str(x[1]), str(x[2])))
+        self.assertEqual(ans, [('doc_genre', 'fiction', 'fiction', 30),
+                               ('doc_title', 'Foo', 'd1', 10),
+                               ('doc_title', 'Foo', 'd2', 20),
+                               ('poscount', None, None, 30)])
+
+
+class BitmapIndexTest(LiveAttrsDbTestCase):
+
+    def _find(self, attr_map, aligned_corpora=()):
+        qb = self._create_builder(attr_map)
+        index = BitmapIndex.build(self.db, 'c1')
+        mask = index.create_mask(qb.create_conditions(), aligned_corpora)
+        return sorted(index.aggregate(mask, qb.get_aggregated_attrs()), key=lambda x: (x[0], str(x[1]), str(x[2])))
+
+    def test_same_as_database(self):
+        for attr_map in ({}, {'doc.genre': ['fiction']}, {'doc.title': ['d1', '@Bar']}, {'doc.genre': ['===']}):
+            qb = self._create_builder(attr_map)
+            self.assertEqual(self._find(attr_map),
+                             sorted(DataIterator(self.db, qb), key=lambda x: (x[0], str(x[1]), str(x[2]))))
+
+    def test_aligned_corpora(self):
+        self.db.execute('INSERT INTO item (item_id, corpus_id, doc_id, poscount) VALUES (\'i2\', \'c2\', \'x\', 1)')
+        self.assertEqual(self._find({}, ['c2']), [('doc_genre', 'fiction', 'fiction', 20),
+                                                  ('doc_title', 'Foo', 'd2', 20),
+                                                  ('poscount', None, None, 20)])
+        self.assertEqual(self._find({}, ['c3']), [('poscount', None, None, None)])
+
+    def test_patterns_not_supported(self):
+        self.assertIsNone(self._create_builder({'doc.title': ['F%']}).create_conditions())
+
+
+if __name__ == '__main__':
+    unittest.main()
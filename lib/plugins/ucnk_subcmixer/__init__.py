@@ -16,8 +16,8 @@
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
 
 import json
+import logging
 from collections import defaultdict
-import struct
 
 from plugins.abstract.subcmixer import AbstractSubcMixer
 from plugins import inject
@@ -29,7 +29,7 @@ import corplib
 
 from .database import Database
 from .category_tree import CategoryTree, CategoryExpression
-from .metadata_model import MetadataModel
+from .metadata_model import MetadataModel, linprog_available
 
 
 @exposed(return_type='json', access_level=1, http_method='POST')
@@ -50,10 +50,8 @@ def subcmixer_create_subcorpus(ctrl, request):
     """
     Create a subcorpus in a low-level way.
     The action writes a list of 64-bit signed integers
-    to a file (just like Manatee does).
-    The current version does not optimize the
-    write by merging adjacent position intervals
-    (Manatee does this).
+    to a file (just like Manatee does) with adjacent
+    position intervals merged (see corplib.subcorpus_from_struct_indices).
     """
     if not request.form['subcname']:
         ctrl.add_system_message('error', 'Missing subcorpus name')
@@ -65,10 +63,7 @@ def subcmixer_create_subcorpus(ctrl, request):
         struct_indices = sorted([int(x) for x in request.form['ids'].split(',')])
         id_attr = request.form['idAttr'].split('.')
         attr = ctrl.corp.get_struct(id_attr[0])
-        with open(subc_path, 'wb') as fw:
-            for idx in struct_indices:
-                fw.write(struct.pack('<q', attr.beg(idx)))
-                fw.write(struct.pack('<q', attr.end(idx)))
+        corplib.subcorpus_from_struct_indices(subc_path, attr, struct_indices)
 
         pub_path = ctrl.prepare_subc_path(
             request.form['corpname'], request.form['subcname'], publish=publish) if publish else None
@@ -91,8 +86,9 @@ class SubcMixer(AbstractSubcMixer):
 
     CORPUS_MAX_SIZE = 500000000  # TODO
 
-    def __init__(self, corparch):
+    def __init__(self, corparch, solver):
         self._corparch = corparch
+        self._solver = solver
 
     @staticmethod
     def _calculate_real_sizes(cat_tree, sizes, total_size):
@@ -144,7 +140,7 @@ class SubcMixer(AbstractSubcMixer):
         cat_tree = CategoryTree(conditions, db, 'item', SubcMixer.CORPUS_MAX_SIZE)
         mm = MetadataModel(meta_db=db, category_tree=cat_tree,
                            id_attr=corpus_info.metadata.id_attr.replace('.', '_'))
-        corpus_items = mm.solve()
+        corpus_items = mm.solve(solver=self._solver)
 
         if corpus_items.size_assembled > 0:
             ans = {}
@@ -165,4 +161,10 @@ class SubcMixer(AbstractSubcMixer):
 
 @inject(plugins.runtime.CORPARCH)
 def create_instance(settings, corparch):
-    return SubcMixer(corparch)
+    plugin_conf = settings.get('plugins', 'subcmixer') or {}
+    solver = plugin_conf.get('ucnk:solver', 'pulp')
+    if solver == 'scipy' and not linprog_available():
+        logging.getLogger(__name__).warning(
+            'ucnk_subcmixer: scipy.optimize.linprog (HiGHS) not available, using PuLP solver instead')
+        solver = 'pulp'
+    return SubcMixer(corparch, solver=solver)
@@ -17,6 +17,33 @@
 
 import numpy as np
 import pulp
+try:
+    from scipy.optimize import linprog
+    from scipy.sparse import csr_matrix
+except ImportError:
+    linprog = None
+    csr_matrix = None
+
+# solver status codes of scipy.optimize.linprog mapped to PuLP's status labels
+LINPROG_STATUS = {0: 'Optimal', 1: 'Not Solved', 2: 'Infeasible', 3: 'Unbounded', 4: 'Undefined'}
+
+# the HiGHS solver accepts sparse matrices; it is available since scipy 1.6
+LINPROG_METHOD = 'highs'
+
+
+def linprog_available():
+    """
+    Test whether scipy.optimize.linprog is installed and supports
+    the LINPROG_METHOD solver (older scipy versions, e.g. the last
+    ones available for Python 3.6, raise 'Unknown solver').
+    """
+    if linprog is None:
+        return False
+    try:
+        linprog(c=[-1], A_ub=[[1]], b_ub=[1], bounds=(0, 1), method=LINPROG_METHOD, options={'presolve': False})
+    except ValueError:
+        return False
+    return True
 
 
 class CorpusComposition(object):
@@ -35,6 +62,57 @@ class CorpusComposition(object):
             if self.variables is not None else None)
 
 
+class SparseMatrix(object):
+    """
+    A minimal sparse matrix in the CSR (compressed sparse row) form
+
+    arguments:
+    rows -- a list of dicts {column index: value} (zero values are omitted)
+    num_cols -- number of matrix columns
+    """
+
+    def __init__(self, rows, num_cols):
+        self.shape = (len(rows), num_cols)
+        indptr = [0]
+        indices = []
+        data = []
+        for row in rows:
+            for j in sorted(row):
+                if row[j] != 0:
+                    indices.append(j)
+                    data.append(row[j])
+            indptr.append(len(indices))
+        self.indptr = np.array(indptr, dtype=np.int64)
+        self.indices = np.array(indices, dtype=np.int64)
+        self.data = np.array(data, dtype=np.float64)
+
+    def row(self, i):
+        """
+        Return column indices and values of non-zero items of the i-th row
+        """
+        return self.indices[self.indptr[i]:self.indptr[i + 1]], self.data[self.indptr[i]:self.indptr[i + 1]]
+
+    def row_dot(self, i, x):
+        indices, data = self.row(i)
+        return np.dot(data, np.asarray(x, dtype=np.float64)[indices])
+
+    def to_dense(self):
+        ans = np.zeros(self.shape)
+        for i in range(self.shape[0]):
+            indices, data = self.row(i)
+            ans[i][indices] = data
+        return ans
+
+    def to_scipy(self, num_rows=None):
+        """
+        Export first num_rows rows (all by default) as a scipy.sparse.csr_matrix
+        """
+        num_rows = self.shape[0] if num_rows is None else num_rows
+        end = self.indptr[num_rows]
+        return csr_matrix((self.data[:end], self.indices[:end], self.indptr[:num_rows + 1]),
+                          shape=(num_rows, self.shape[1]))
+
+
 class MetadataModel:
     """
     This class represents the linear optimization model for given categoryTree.
@@ -56,12 +134,14 @@ class MetadataModel:
         # no matter whether they have matching aligned counterparts
         self.num_texts = len(self.text_sizes)
         self.b = [0] * (self.c_tree.num_categories - 1)
-        self.A = np.zeros((self.c_tree.num_categories, self.num_texts))
+        # rows of the coefficient matrix as dicts {text index: value} (see SparseMatrix)
+        a_rows = [{} for _ in range(self.c_tree.num_categories)]
         used_ids = set()
-        self._init_ab(self.c_tree.root_node, used_ids)
+        self._init_ab(self.c_tree.root_node, used_ids, a_rows)
         # for items without aligned counterparts we create
         # conditions fulfillable only for x[i] = 0
-        self._init_ab_nonalign(used_ids)
+        self._init_ab_nonalign(used_ids, a_rows)
+        self.A = SparseMatrix(a_rows, self.num_texts)
 
     def _get_text_sizes(self):
         """
@@ -93,16 +173,15 @@ class MetadataModel:
             i += 1
         return sizes, id_map
 
-    def _init_ab_nonalign(self, used_ids):
+    def _init_ab_nonalign(self, used_ids, a_rows):
         # Now we process items with no aligned counterparts.
         # In this case we must define a condition which will be
         # fulfilled iff X[i] == 0
-        for k, v in list(self._id_map.items()):
-            if k not in used_ids:
-                for i in range(1, len(self.b)):
-                    self.A[i][v] = self.b[i] * 2 if self.b[i] > 0 else 10000
+        unused = [v for k, v in self._id_map.items() if k not in used_ids]
+        for i in range(1, len(self.b)):
+            a_rows[i].update(dict.fromkeys(unused, self.b[i] * 2 if self.b[i] > 0 else 10000))
 
-    def _init_ab(self, node, used_ids):
+    def _init_ab(self, node, used_ids, a_rows):
         """
         Initialization method for coefficient matrix (A) and vector of bounds (b)
         Recursively traverses all nodes of given categoryTree starting from its root.
@@ -111,6 +190,7 @@ class MetadataModel:
         args:
         node -- currently processed node of the categoryTree
         used_ids -- a set of ids used in previous nodes
+        a_rows -- rows of the coefficient matrix (a list of dicts {text index: value})
         """
         if node.metadata_condition is not None:
             sql_items = ['m1.{0} {1} ?'.format(mc.attr, mc.op)
@@ -126,19 +206,23 @@ class MetadataModel:
             sql_args += [mc.value for subl in node.metadata_condition for mc in subl]  # 'WHERE' args
             sql_args.append(self._db.corpus_id)
             self._db.execute(sql, sql_args)
-            for row in self._db.fetchall():
-                self.A[node.node_id - 1][self._id_map[row[0]]] = row[1]
-                used_ids.add(row[0])
+            rows = self._db.fetchall()
+            a_rows[node.node_id - 1].update((self._id_map[row[0]], row[1]) for row in rows)
+            used_ids.update(row[0] for row in rows)
             self.b[node.node_id - 1] = node.size
 
         if len(node.children) > 0:
             for child in node.children:
-                self._init_ab(child, used_ids)
+                self._init_ab(child, used_ids, a_rows)
 
-    def solve(self):
+    def solve(self, solver='pulp'):
         """
-        A method that converts the matrix notation of LP model to format used by PULP
-        library and solves it.
+        A method that solves the LP model either using the PULP library
+        or (solver = 'scipy') scipy.optimize.linprog which is fed directly
+        by the sparse coefficient matrix.
+
+        arguments:
+        solver -- either 'pulp' or 'scipy'
 
         returns:
         object representation of resulting composition
@@ -147,6 +231,26 @@ class MetadataModel:
         if sum(self.b) == 0:
             return CorpusComposition(None, [], 0, [], [], 0)
 
+        if solver == 'scipy':
+            status, variables = self._solve_linprog()
+        else:
+            status, variables = self._solve_pulp()
+
+        category_sizes = []
+        for c in range(0, self.c_tree.num_categories - 1):
+            cat_size = self._get_category_size(variables, c)
+            category_sizes.append(cat_size)
+        size_assembled = self._get_assembled_size(variables)
+
+        return CorpusComposition(status=status, variables=variables, size_assembled=size_assembled,
+                                 category_sizes=category_sizes, used_bounds=self.b, num_texts=sum(variables))
+
+    def _solve_pulp(self):
+        """
+        Convert the matrix notation of LP model to format used by PULP
+        library and solve it. Only non-zero coefficients are passed to
+        constraint expressions.
+        """
         x_min = 0
         x_max = 1
         num_conditions = len(self.b)
@@ -155,8 +259,9 @@ class MetadataModel:
         lp_prob += pulp.lpSum(x), 'Minimize_the_maximum'
         for i in range(num_conditions):
             label = 'Max_constraint_%d' % i
-            condition = pulp.lpSum([self.A[i][j] * x[j]
-                                    for j in range(self.num_texts)]) <= self.b[i]
+            indices, data = self.A.row(i)
+            condition = pulp.LpAffineExpression(
+                [(x[j], v) for j, v in zip(indices.tolist(), data.tolist())]) <= self.b[i]
             lp_prob += condition, label
 
         stat = lp_prob.solve()
@@ -169,19 +274,22 @@ class MetadataModel:
                 continue
             i = int(v.name[2:len(v.name)])
             variables[i] = np.round(v.varValue, decimals=0)
+        return pulp.LpStatus[stat], variables
 
-        category_sizes = []
-        for c in range(0, self.c_tree.num_categories - 1):
-            cat_size = self._get_category_size(variables, c)
-            category_sizes.append(cat_size)
-        size_assembled = self._get_assembled_size(variables)
-
-        return CorpusComposition(status=pulp.LpStatus[stat], variables=variables, size_assembled=size_assembled,
-                                 category_sizes=category_sizes, used_bounds=self.b, num_texts=sum(variables))
+    def _solve_linprog(self):
+        """
+        Solve the LP model using scipy.optimize.linprog (HiGHS)
+        """
+        if linprog is None:
+            raise RuntimeError('The \'scipy\' solver requires the scipy package')
+        res = linprog(c=-np.ones(self.num_texts), A_ub=self.A.to_scipy(len(self.b)), b_ub=self.b,
+                      bounds=(0, 1), method=LINPROG_METHOD)
+        variables = (np.round(res.x, decimals=0).tolist() if res.x is not None
+                     else [0] * self.num_texts)
+        return LINPROG_STATUS.get(res.status, 'Undefined'), variables
 
     def _get_assembled_size(self, results):
         return np.dot(results, self.text_sizes)
 
     def _get_category_size(self, results, cat_id):
-        category_sizes = self.A[cat_id][:]
-        return np.dot(results, category_sizes)
+        return self.A.row_dot(cat_id, results)
@@ -0,0 +1,93 @@
+# Copyright (c) 2020 Charles University, Faculty of Arts,
+#                    Institute of the Czech National Corpus
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; version 2
+# dated June, 1991.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.
+
+"""
+Unittests for the ucnk_subcmixer metadata model
+"""
+import os
+import sqlite3
+import tempfile
+import unittest
+
+from plugins.ucnk_subcmixer.database import Database
+from plugins.ucnk_subcmixer.category_tree import CategoryTree, CategoryExpression
+from plugins.ucnk_subcmixer.metadata_model import MetadataModel, SparseMatrix, linprog_available
+
+
+class MetadataModelTest(unittest.TestCase):
+
+    def setUp(self):
+        fd, self.db_path = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        conn = sqlite3.connect(self.db_path)
+        conn.execute('CREATE TABLE item (id INTEGER PRIMARY KEY, item_id TEXT, corpus_id TEXT, doc_id TEXT, '
+                     'doc_txtype TEXT, poscount INTEGER)')
+        rows = [('i1', 'c1', 'd1', 'fiction', 10),
+                ('i2', 'c1', 'd2', 'fiction', 20),
+                ('i3', 'c1', 'd3', 'fiction', 30),
+                ('i4', 'c1', 'd4', 'news', 10),
+                ('i5', 'c1', 'd5', 'news', 20),
+                ('i6', 'c1', 'd6', 'news', 90),
+                ('i7', 'c2', 'd7', 'news', 1000)]
+        conn.executemany('INSERT INTO item (item_id, corpus_id, doc_id, doc_txtype, poscount) '
+                         'VALUES (?, ?, ?, ?, ?)', rows)
+        conn.commit()
+        conn.close()
+        self.db = Database(db_path=self.db_path, table_name='item', corpus_id='c1', id_attr='doc.id',
+                           aligned_corpora=[])
+
+    def tearDown(self):
+        self.db.close()
+        os.unlink(self.db_path)
+
+    def _create_model(self):
+        conditions = [[0, None, 1, None],
+                      [1, 0, 0.5, CategoryExpression('doc.txtype', '==', 'fiction')],
+                      [2, 0, 0.5, CategoryExpression('doc.txtype', '==', 'news')]]
+        cat_tree = CategoryTree(conditions, self.db, 'item', 500000000)
+        return MetadataModel(meta_db=self.db, category_tree=cat_tree, id_attr='doc_id')
+
+    def test_sparse_matrix(self):
+        m = SparseMatrix([{0: 1, 2: 3}, {}, {1: 0, 3: 5}], 4)
+        self.assertEqual(m.data.tolist(), [1, 3, 5])
+        self.assertEqual(m.to_dense().tolist(), [[1, 0, 3, 0], [0, 0, 0, 0], [0, 0, 0, 5]])
+        self.assertEqual(m.row_dot(2, [1, 1, 1, 2]), 10)
+
+    def test_model_construction(self):
+        mm = self._create_model()
+        self.assertEqual(mm.text_sizes, [10, 20, 30, 10, 20, 90])
+        self.assertEqual(mm.b, [60, 60])
+        self.assertEqual(mm.A.to_dense()[:2].tolist(), [[10, 20, 30, 0, 0, 0], [0, 0, 0, 10, 20, 90]])
+
+    def _check_solution(self, ans):
+        self.assertEqual(ans.status, 'Optimal')
+        self.assertEqual(list(ans.variables), [1, 1, 1, 1, 1, 0])
+        self.assertEqual(ans.size_assembled, 90)
+        self.assertEqual(ans.category_sizes, [60, 30])
+        self.assertEqual(ans.num_texts, 5)
+
+    def test_solve_pulp(self):
+        self._check_solution(self._create_model().solve(solver='pulp'))
+
+    @unittest.skipUnless(linprog_available(), 'scipy.optimize.linprog (HiGHS) not available')
+    def test_solve_scipy(self):
+        self._check_solution(self._create_model().solve(solver='scipy'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -40,9 +40,28 @@ class MessagePage {
         this.layoutModel = layoutModel;
     }
 
+    /**
+     * In case the message replaces a page waiting for an unfinished
+     * background calculation, reload the page once the calculation
+     * is finished.
+     */
+    private reloadOnCalcFinished():void {
+        const taskId = this.layoutModel.getConf<string>('CalcPendingTaskId');
+        if (taskId) {
+            this.layoutModel.addOnAsyncTaskUpdate((itemList) => {
+                if (itemList.find(item => item.ident === taskId)) {
+                    const url = new URL(window.location.href);
+                    url.searchParams.set('calc_task_id', taskId);
+                    window.location.href = url.toString();
+                }
+            });
+        }
+    }
+
     init():void {
         this.layoutModel.init(
             () => {
+                this.reloadOnCalcFinished();
                 const plugin = this.layoutModel.pluginIsActive('issue_reporting') ?
                         issueReportingPlugin(this.layoutModel.pluginApi()) : null;
 
@@ -0,0 +1,178 @@
+# Copyright (c) 2020 Charles University, Faculty of Arts,
+#                    Institute of the Czech National Corpus
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; version 2
+# dated June, 1991.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.
+
+import os
+import re
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+
+import corplib
+from corplib import merge_intervals, subcorpus_from_struct_indices
+
+
+class DummyStructure(object):
+
+    def __init__(self, intervals):
+        self._intervals = intervals
+
+    def beg(self, idx):
+        return self._intervals[idx][0]
+
+    def end(self, idx):
+        return self._intervals[idx][1]
+
+
+class SubcorpusFromStructTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_merge_intervals(self):
+        begs, ends = merge_intervals(np.array([30, 0, 10, 15, 50], dtype=np.int64),
+                                     np.array([40, 10, 20, 18, 60], dtype=np.int64))
+        self.assertEqual(begs.tolist(), [0, 30, 50])
+        self.assertEqual(ends.tolist(), [20, 40, 60])
+
+    def test_merge_no_intervals(self):
+        begs, ends = merge_intervals(np.array([], dtype=np.int64), np.array([], dtype=np.int64))
+        self.assertEqual((len(begs), len(ends)), (0, 0))
+
+    def test_subcorpus_file(self):
+        path = os.path.join(self.tmp_dir, 'test.subc')
+        struct = DummyStructure([(0, 5), (5, 9), (12, 20), (30, 31)])
+        self.assertEqual(subcorpus_from_struct_indices(path, struct, [3, 1, 0, 2]), 3)
+        with open(path, 'rb') as fr:
+            data = np.frombuffer(fr.read(), dtype='<i8')
+        self.assertEqual(data.tolist(), [0, 9, 12, 20, 30, 31])
+
+
+class DummyIdGenerator(object):
+
+    def __init__(self, ids):
+        self._ids = ids
+        self._i = 0
+
+    def end(self):
+        return self._i >= len(self._ids)
+
+    def next(self):
+        self._i += 1
+        return self._ids[self._i - 1]
+
+
+class DummyPosAttr(object):
+
+    def __init__(self, values):
+        self._values = values
+
+    def id_range(self):
+        return len(self._values)
+
+    def regexp2ids(self, pattern, ignore_case, excl_pattern):
+        return DummyIdGenerator([i for i, v in enumerate(self._values) if re.fullmatch(pattern, v) and
+                                 not (excl_pattern and re.fullmatch(excl_pattern, v))])
+
+    def str2id(self, value):
+        return self._values.index(value) if value in self._values else -1
+
+    def id2str(self, idx):
+        return self._values[idx]
+
+
+class DummyCorpus(object):
+
+    def __init__(self, attr):
+        self._attr = attr
+
+    def get_attr(self, name):
+        return self._attr
+
+    def get_conf(self, key):
+        return '[^a-z]+' if key == 'NONWORDRE' else ''
+
+
+class WordlistTest(unittest.TestCase):
+
+    VALUES = ['a', 'b', 'c', 'd', '.', 'e', 'f', 'g']
+
+    FREQS = [5, 0, 3, 5, 10, 1, 5, 2]
+
+    def setUp(self):
+        self.corp = DummyCorpus(DummyPosAttr(self.VALUES))
+        patcher = mock.patch.object(corplib, '_get_attrfreq', return_value=np.array(self.FREQS, dtype=np.int64))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _wordlist(self, **kw):
+        args = dict(wlattr='word', wlpat='.*', wlminfreq=1, wlmaxitems=100, wlsort='')
+        args.update(kw)
+        return list(corplib.iter_wordlist(self.corp, **args))
+
+    def test_minfreq(self):
+        self.assertEqual(self._wordlist(wlminfreq=3), [('a', 5), ('c', 3), ('d', 5), ('f', 5)])
+        # values with zero frequency are never listed
+        self.assertEqual(self._wordlist(wlminfreq=0, wlpat='[a-c]'), [('a', 5), ('c', 3)])
+
+    def test_nonwords(self):
+        self.assertNotIn(('.', 10), self._wordlist())
+        self.assertIn(('.', 10), self._wordlist(include_nonwords=1))
+
+    def test_whitelist(self):
+        self.assertEqual(self._wordlist(wlpat='[a-d]', words={'a', 'c', 'x'}), [('a', 5), ('c', 3)])
+
+    def test_blacklist(self):
+        self.assertEqual(self._wordlist(wlpat='[a-d]', blacklist={'a', 'x'}), [('c', 3), ('d', 5)])
+
+    def test_from_list(self):
+        self.assertEqual(self._wordlist(words={'a', 'x', 'c'}), [('a', 5), ('c', 3)])
+        self.assertEqual(self._wordlist(words={'a', 'x', 'c'}, wlminfreq=0), [('a', 5), ('c', 3), ('x', 0)])
+        self.assertEqual(self._wordlist(words={'a', 'c', 'd'}, blacklist={'d'}, wlsort='f', wlmaxitems=1),
+                         [('a', 5)])
+
+    def test_top_k(self):
+        self.assertEqual(self._wordlist(wlsort='f', wlmaxitems=4), [('a', 5), ('d', 5), ('f', 5), ('c', 3)])
+        # ties are resolved in favour of values found first (i.e. lower IDs)
+        self.assertEqual(self._wordlist(wlsort='f', wlmaxitems=2), [('a', 5), ('d', 5)])
+        self.assertEqual(corplib._top_k(np.array([1, 5, 3, 5, 5]), 2).tolist(), [1, 3])
+
+    def test_chunk_boundaries(self):
+        expected = self._wordlist(wlpat='[a-z]', wlsort='f', wlmaxitems=3)
+        expected_len = corplib.get_wordlist_length(self.corp, 'word', '[a-z]', 'frq', 1, '', '', False)
+        for chunk_size in (1, 2, 3):
+            with mock.patch.object(corplib, 'WORDLIST_ID_CHUNK_SIZE', chunk_size):
+                self.assertEqual(self._wordlist(wlpat='[a-z]', wlsort='f', wlmaxitems=3), expected)
+                self.assertEqual(self._wordlist(wlpat='[a-z]', wlsort='f', wlmaxitems=1), [('a', 5)])
+                self.assertEqual(self._wordlist(wlpat='[a-z]', wlmaxitems=2), [('a', 5), ('c', 3)])
+                self.assertEqual(
+                    corplib.get_wordlist_length(self.corp, 'word', '[a-z]', 'frq', 1, '', '', False), expected_len)
+
+    def test_wordlist_length(self):
+        self.assertEqual(corplib.get_wordlist_length(self.corp, 'word', '.*', 'frq', 3, '', '', False), 4)
+        self.assertEqual(corplib.get_wordlist_length(self.corp, 'word', '.*', 'frq', 3, '', '', True), 5)
+        self.assertEqual(corplib.get_wordlist_length(self.corp, 'word', '.*', 'frq', 1, 'a c x', 'c', False), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+# Copyright (c) 2020 Charles University, Faculty of Arts,
+#                    Institute of the Czech National Corpus
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; version 2
+# dated June, 1991.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from conclib.freq import FreqDistResult, save_freq_dists, load_freq_dists
+
+
+def create_result(num_lines):
+    return FreqDistResult(
+        head=[dict(n='doc.genre', s=0), dict(n='Freq', s='freq', title='Frequency')],
+        words=['valé {0}\tsub\vitem'.format(i) for i in range(num_lines)],
+        freq=np.arange(num_lines, 0, -1, dtype=np.int64),
+        fbar=np.arange(num_lines, dtype=np.int64) + 1,
+        norm=np.full(num_lines, 1000, dtype=np.int64),
+        nbar=np.full(num_lines, 3, dtype=np.int64),
+        relbar=np.arange(num_lines, dtype=np.int64),
+        freqbar=np.full(num_lines, 10, dtype=np.int64),
+        rel=np.linspace(0, 1, num_lines).round(2),
+        has_rel=np.array([i % 3 > 0 for i in range(num_lines)]),
+        norel='')
+
+
+class FreqDistCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, 'test.frq')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_items(self):
+        items = create_result(5).items(1, 3)
+        self.assertEqual(len(items), 2)
+        self.assertEqual(items[0]['Word'], [{'n': 'valé 1'}, {'n': 'sub  item'}])
+        self.assertEqual(items[0]['freq'], 4)
+        self.assertNotIn('rel', create_result(5).items(0, 1)[0])
+
+    def test_save_load(self):
+        orig = create_result(50)
+        save_freq_dists(self.path, [orig, None], 1234)
+        blocks, conc_size = load_freq_dists(self.path)
+        self.assertEqual(conc_size, 1234)
+        self.assertEqual(len(blocks), 2)
+        self.assertIsNone(blocks[1])
+        self.assertEqual(len(blocks[0]), 50)
+        self.assertEqual(blocks[0].head, orig.head)
+        self.assertEqual(blocks[0].to_dict(), orig.to_dict())
+        self.assertEqual(blocks[0].items(17, 29), orig.items(17, 29))
+
+    def test_invalid_file(self):
+        with open(self.path, 'wb') as fw:
+            fw.write(b'foo')
+        self.assertRaises(ValueError, lambda: load_freq_dists(self.path))
+
+
+if __name__ == '__main__':
+    unittest.main()
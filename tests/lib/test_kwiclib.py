@@ -16,8 +16,11 @@
 # 02110-1301, USA.
 
 import unittest
+from unittest import mock
 
 import kwiclib
+from conclib import pyconc
+from plugins.abstract.conc_cache import CalcStatus
 
 
 class Tokens2StrClassTest(unittest.TestCase):
@@ -33,4 +36,106 @@ class Tokens2StrClassTest(unittest.TestCase):
         self.assertEqual(output[1].get('str'), 'bar  ')
         self.assertEqual(output[1].get('class'), 'class3 class4')
         self.assertEqual(output[2].get('str'), 'last one')
-        self.assertEqual(output[2].get('class'), 'class5')
\ No newline at end of file
+        self.assertEqual(output[2].get('class'), 'class5')
+
+
+class SpeechTokenizerTest(unittest.TestCase):
+
+    def test_no_speech_tags(self):
+        tok = kwiclib.SpeechTokenizer(('seg', 'soundfile'), True)
+        left, kwic, right = tok.process_line([{'str': 'foo', 'class': ''}, {'str': '', 'class': ''}],
+                                             [{'str': 'bar', 'class': 'col0'}], [], 'a.wav')
+        self.assertEqual(left, [{'str': 'foo', 'class': ''}])
+        self.assertEqual(kwic, [{'str': 'bar', 'class': 'col0'}])
+        self.assertEqual(right, [])
+
+    def test_speech_links(self):
+        tok = kwiclib.SpeechTokenizer(('seg', 'soundfile'), False)
+        left, kwic, right = tok.process_line(
+            [{'str': 'foo</seg><seg id=1 soundfile=b.wav>', 'class': 'strc'}],
+            [{'str': 'bar', 'class': 'col0'}],
+            [{'str': '</seg>', 'class': 'strc'}, {'str': '<seg soundfile=c.wav>', 'class': 'strc'}],
+            'a.wav')
+        self.assertEqual(left[0], {'str': 'foo', 'class': 'strc'})
+        self.assertEqual(left[1], {'str': '</seg>', 'class': 'strc', 'close_link': {'speech_path': 'a.wav'}})
+        self.assertEqual(left[2], {'str': '<seg id=1>', 'class': 'strc', 'open_link': {'speech_path': 'b.wav'}})
+        self.assertEqual(right[0]['close_link'], {'speech_path': 'b.wav'})
+        # a segment starting at the end of the line has no link
+        self.assertEqual(right[1], {'str': '<seg>', 'class': 'strc'})
+
+    def test_filter_speech_tag(self):
+        tok = kwiclib.SpeechTokenizer(('seg', 'soundfile'), True)
+        left = tok.process_line([{'str': 'foo</seg><seg soundfile=b.wav>', 'class': ''}], [], [])[0]
+        self.assertEqual([x['str'] for x in left], ['foo', '', ''])
+        self.assertEqual(left[2]['open_link'], {'speech_path': 'b.wav'})
+
+
+class SortIdxTest(unittest.TestCase):
+
+    def test_get_sort_crit(self):
+        self.assertEqual(kwiclib.get_sort_crit(('aword,[word="x"]', 'sword/i 1<0~1>0', 'r100', 'sword/ -1<0')),
+                         'word/ -1<0')
+        self.assertEqual(kwiclib.get_sort_crit(('aword,[word="x"]', 's*foo')), '')
+
+    def test_sort_idx_pages(self):
+        self.assertEqual(kwiclib.Kwic.sort_idx_pages([('a', 0), ('b', 19), ('c', 20), ('d', 45)], 20),
+                         [{'page': 1, 'label': 'a'}, {'page': 1, 'label': 'b'},
+                          {'page': 2, 'label': 'c'}, {'page': 3, 'label': 'd'}])
+
+    class UndecodableStrVector(list):
+        """
+        A StrVector replacement failing to decode None items
+        """
+
+        def __getitem__(self, i):
+            v = super().__getitem__(i)
+            if v is None:
+                raise UnicodeDecodeError('utf-8', b'\xff', 0, 1, 'invalid start byte')
+            return v
+
+    class DummyConc(object):
+
+        def sort_idx(self, crit, vals, idx, just_letters):
+            vals.extend(['apple', 'avocado', None, 'banana'])
+            idx.extend([0, 3, 5, 8])
+
+    def test_get_sort_idx_items_skips_undecodable(self):
+        with mock.patch('conclib.pyconc.manatee.StrVector', self.UndecodableStrVector, create=True), \
+                mock.patch('conclib.pyconc.manatee.IntVector', list, create=True):
+            conc = self.DummyConc()
+            self.assertEqual(pyconc.PyConc.get_sort_idx_items(conc, 'word/ 0'), [('a', 0), ('b', 8)])
+            self.assertEqual(pyconc.PyConc.get_sort_idx_items(conc, 'doc.id 0'),
+                             [('apple', 0), ('avocado', 3), ('banana', 8)])
+
+
+class ResultStatsTest(unittest.TestCase):
+
+    class DummyCorpus(object):
+
+        def size(self):
+            return 1000000
+
+    class DummyConc(object):
+
+        def __init__(self, size):
+            self._size = size
+
+        def size(self):
+            return self._size
+
+        def compute_ARF(self):
+            return 3.14159
+
+    def _result_arf(self, concsize, calc_status):
+        kwic = kwiclib.Kwic(self.DummyCorpus(), 'foo', self.DummyConc(concsize), calc_status=calc_status)
+        return kwic.get_result_stats()['result_arf']
+
+    def test_stored_arf(self):
+        self.assertEqual(self._result_arf(10, CalcStatus(concsize=10, arf=2.5)), 2.5)
+        self.assertEqual(self._result_arf(0, CalcStatus(concsize=0, arf=0)), 0)
+        self.assertEqual(self._result_arf(10, None), 3.14)
+
+    def test_missing_arf(self):
+        self.assertIsNone(self._result_arf(10, CalcStatus(concsize=10)))
+        # older cache entries store 0 instead of a missing value
+        self.assertIsNone(self._result_arf(10, CalcStatus(concsize=10, arf=0)))
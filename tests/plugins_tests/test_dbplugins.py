@@ -19,8 +19,8 @@ Where possible, the results of identical operations on the two plugins are check
 With list operations, the results are verified against a control list created alongside the database lists.
 Test parameters allow to turn on/off the verbose mode and the ttl methods testing.
 
-The sqlite3 plugin stores data in a single table called "data" with the following structure:
-CREATE TABLE data (key text PRIMARY KEY, value text, expires integer)
+The sqlite3 plugin stores data in tables "data", "hash_data", "list_data" and "expiry"
+(see the sqlite3_db plugin for their structure).
 """
 import sqlite3
 import time
@@ -32,6 +32,7 @@ import redis
 from plugins.abstract.general_storage import KeyValueStorage
 from plugins.redis_db import RedisDb
 from plugins.sqlite3_db import DefaultDb
+from plugins import sqlite3_db
 
 # set test parameters
 TEST_TTL_METHODS = True  # set to False to speed up by skipping ttl testing which involves time.sleep()
@@ -40,8 +41,7 @@ REDIS_HOST = os.environ.get('REDIS_HOST', 'localhost')
 REDIS_PORT = 6379
 REDIS_DB = 0
 SQLITE3_DB = ':memory:'
-DROP_DATA_TABLE_SQL = "DROP TABLE IF EXISTS data"
-CREATE_DATA_TABLE_SQL = "CREATE TABLE data (key text PRIMARY KEY, value text, expires integer)"
+SQLITE3_TABLES = ('data', 'hash_data', 'list_data', 'expiry')
 
 
 class DbTest(unittest.TestCase):
@@ -62,15 +62,12 @@ class DbTest(unittest.TestCase):
     def setUp(self):
         # delete data before each test
         self.rd.flushdb()
-        # drop and re-create the sqlite3 table called "data" with the correct structure
-
-        self.sd.execute(DROP_DATA_TABLE_SQL)
-        self.sd.execute(CREATE_DATA_TABLE_SQL)
-        self.sd.commit()
-        s_db = getattr(self.s, '_conn')()  # we must force sqlite3 db to instantiate lazy _conn attr
-        s_db.execute(DROP_DATA_TABLE_SQL)
-        s_db.execute(CREATE_DATA_TABLE_SQL)
-        s_db.commit()
+        # drop and re-create the sqlite3 tables with the correct structure
+        for db in (self.sd, getattr(self.s, '_conn')()):  # we must force sqlite3 db to instantiate lazy _conn attr
+            for table in SQLITE3_TABLES:
+                db.execute('DROP TABLE IF EXISTS {0}'.format(table))
+            db.commit()
+            DefaultDb.create_schema(db)
 
     def test_set_and_get(self):
         """
@@ -339,6 +336,67 @@ class DbTest(unittest.TestCase):
             print(('redis: {0}, sqlite: {1}'.format(out_r, out_s)))
         self.assertEqual(out_r, out_s)
 
+    def test_hash_get_multi(self):
+        """
+        test the hash_get_multi method, including a non-existing field
+        """
+        key = 'foo'
+        self.r.hash_set(key, 'f1', 'val1')
+        self.s.hash_set(key, 'f1', 'val1')
+        self.r.hash_set(key, 'f2', [1, 2])
+        self.s.hash_set(key, 'f2', [1, 2])
+        out_r = self.r.hash_get_multi(key, ['f2', 'absent', 'f1'])
+        out_s = self.s.hash_get_multi(key, ['f2', 'absent', 'f1'])
+        self.assertTrue(out_r == out_s == [[1, 2], None, 'val1'])
+
+    def test_hash_get_multi_large_hash(self):
+        """
+        test the hash_get_multi method on a large hash, on a hash stored
+        in the 'data' table and on an expired hash
+        """
+        key = 'large'
+        self.r.hash_set_map(key, dict(('f{0}'.format(i), i) for i in range(5000)))
+        self.s.hash_set_map(key, dict(('f{0}'.format(i), i) for i in range(5000)))
+        fields = ['f4999', 'absent', 'f0', 'f1234', 'f0']
+        out_r = self.r.hash_get_multi(key, fields)
+        out_s = self.s.hash_get_multi(key, fields)
+        self.assertTrue(out_r == out_s == [4999, None, 0, 1234, 0])
+        many_fields = ['f{0}'.format(i) for i in range(0, 5000, 3)]
+        self.assertEqual(self.s.hash_get_multi(key, many_fields), list(range(0, 5000, 3)))
+
+        self.s.set('legacy', {'f1': 'val1', 'f2': 2})
+        self.assertEqual(self.s.hash_get_multi('legacy', ['f2', 'f3', 'f1']), [2, None, 'val1'])
+
+        self.s.hash_set('expired', 'f1', 'val1')
+        self.s.set_ttl('expired', -10)
+        self.assertEqual(self.s.hash_get_multi('expired', ['f1']), [None])
+
+    def test_batch(self):
+        """
+        test that the sqlite3 batch() commits all the enclosed writes at once
+        and rolls them back in case of an error
+        """
+        with self.s.batch():
+            self.s.set('b1', 1)
+            self.s.incr('b1')
+            with self.s.batch():
+                self.s.hash_set('b2', 'f1', 'val1')
+            self.assertTrue(self.s._conn().in_transaction)
+            self.assertEqual(self.s.get('b1'), 2)
+        self.assertFalse(self.s._conn().in_transaction)
+        self.assertEqual(self.s.hash_get('b2', 'f1'), 'val1')
+
+        with self.assertRaises(IndexError):
+            with self.s.batch():
+                self.s.set('b1', 3)
+                self.s.list_pop('empty')
+        self.assertFalse(self.s._conn().in_transaction)
+        self.assertEqual(self.s.get('b1'), 2)
+
+        with self.r.batch():
+            self.r.set('b1', 1)
+        self.assertEqual(self.r.get('b1'), 1)
+
     def test_rename(self):
         """
         there is a difference in behavior in case the old key does not exist anymore:
@@ -508,6 +566,29 @@ class DbTest(unittest.TestCase):
         self.assertEqual(out_r, "100times")
         self.assertEqual(out_s, "100times")
 
+    def test_publish_and_subscribe(self):
+        """
+        test the publish & subscribe methods: a message published after
+        a subscription is created must wake up the waiting subscriber
+        """
+        channel = 'channel1'
+        with self.r.subscribe(channel) as sub_r, self.s.subscribe(channel) as sub_s:
+            self.r.publish(channel, True)
+            self.s.publish(channel, True)
+            out_r = sub_r.wait(2)
+            out_s = sub_s.wait(2)
+        self.assertTrue(out_r)
+        self.assertTrue(out_s)
+
+    def test_subscribe_timeout(self):
+        """
+        test that waiting for a message on a quiet channel times out
+        """
+        with self.s.subscribe('channel2') as sub_s:
+            self.assertFalse(sub_s.wait(0.2))
+        # a channel without subscribers must not be kept
+        self.assertNotIn('channel2', sqlite3_db._channels)
+
     def test_get_instance(self):
         """
         test the get_instance method (defined in the KeyValueStorage abstract class)
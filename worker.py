@@ -228,6 +228,19 @@ def conc_sync_calculate(self, user_id, corpus_name, subc_name, subchash, query,
     return task(subchash, query, samplesize)
 
 
+@app.task(bind=True)
+def conc_calculate_arf(self, user_id, corpus_name, subc_name, subchash, query):
+    """
+    Calculate ARF of a cached concordance and store it along with the respective
+    cache entry (see conclib.search.get_stored_calc_status()).
+    """
+    subc_path = os.path.join(settings.get('corpora', 'users_subcpath'), str(user_id))
+    pub_path = os.path.join(settings.get('corpora', 'users_subcpath'), 'published')
+    task = conclib.calc.ConcArfCalculation(task_id=self.request.id, subc_dirs=(subc_path, pub_path),
+                                           corpus_name=corpus_name, subc_name=subc_name)
+    return task(subchash, query)
+
+
 # ----------------------------- COLLOCATIONS ----------------------------------
 
 class CollsTask(app.Task):
@@ -256,7 +269,7 @@ def calculate_colls(coll_args):
         calculate_colls.cache_data = ans['data']
     else:
         calculate_colls.cache_data = None
-    return ans
+    return coll_calc.export_colls_page(ans, coll_args)
 
 
 @app.task()
@@ -274,22 +287,25 @@ class FreqsTask(app.Task):
 
     def after_return(self, *args, **kw):
         if self.cache_data:
-            with open(self.cache_path, 'wb') as f:
-                pickle.dump(self.cache_data, f)
-                self.cache_data = None
+            freq_calc.FreqCalcCache.store(self.cache_path, self.cache_data)
+            self.cache_data = None
 
 
 @app.task(base=FreqsTask)
 def calculate_freqs(args):
+    """
+    Calculates frequency distributions and returns the requested page
+    (the whole data are cached in a columnar format by FreqsTask.after_return)
+    """
     args = freq_calc.FreqCalsArgs(**args)
     calculate_freqs.cache_path = args.cache_path
     ans = freq_calc.calc_freqs_bg(args)
     trigger_cache_limit = settings.get_int('corpora', 'freqs_cache_min_lines', 10)
-    if args.force_cache or max(len(d.get('Items', ())) for d in ans['freqs']) >= trigger_cache_limit:
+    if args.force_cache or max(len(d) if d is not None else 0 for d in ans['freqs']) >= trigger_cache_limit:
         calculate_freqs.cache_data = ans
     else:
         calculate_freqs.cache_data = None
-    return ans
+    return freq_calc.export_freqs_page(ans, args)
 
 
 @app.task()